@@ -3,12 +3,22 @@ from flask_sqlalchemy import SQLAlchemy
 import json
 
 db = SQLAlchemy()
-def create_app():
+def create_app(config=None):
+    """
+    Application factory. `config` (a mapping) overrides app.config.Config,
+    e.g. a different SQLALCHEMY_DATABASE_URI for benchmarks.
+    """
     app = Flask(__name__)
     app.config.from_object("app.config.Config")
+    if config:
+        app.config.update(config)
 
     db.init_app(app)
 
+    if app.config.get("REQUEST_PROFILING"):
+        from app.services.request_profiler import RequestProfiler
+        RequestProfiler(app)
+
     # Import and register blueprints
     from app.routes.auth_routes import auth_bp
     from app.routes.superadmin_routes import superadmin_bp
@@ -21,7 +31,10 @@ def create_app():
     app.register_blueprint(auth_bp)
     app.register_blueprint(superadmin_bp)
     app.register_blueprint(admin_bp)
-    
+
+    from app.commands import register_commands
+    register_commands(app)
+
     # Register custom template filter - FIXED VERSION
     @app.template_filter('fromjson')
     def fromjson_filter(value):
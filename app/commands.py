@@ -0,0 +1,76 @@
+# app/commands.py
+import click
+
+
+def register_commands(app):
+    @app.cli.command("upgrade-schema")
+    @click.option("--dry-run", is_flag=True, help="Only print the statements")
+    def upgrade_schema_command(dry_run):
+        """Add the tables, columns, indexes and triggers an existing database is missing."""
+        from app import models  # noqa: F401  (register every table)
+        from app.services.schema_service import upgrade_schema
+
+        statements = upgrade_schema(dry_run=dry_run)
+        for statement in statements:
+            click.echo(f"{statement.strip()};")
+        verb = "Would run" if dry_run else "Ran"
+        click.echo(f"{verb} {len(statements)} schema statements")
+        if statements and not dry_run:
+            click.echo("Next: flask backfill-simulation-summaries (rollups backfill on first use)")
+
+    @app.cli.command("recover-simulation-jobs")
+    def recover_simulation_jobs_command():
+        """Fail queued/running simulations whose process died (run once at server start)."""
+        from app.services.simulation_jobs import recover_stale_jobs
+
+        click.echo(f"Marked {recover_stale_jobs()} interrupted simulation jobs as failed")
+
+    @app.cli.command("rebuild-rollups")
+    @click.option("--hospital-id", type=int, default=None, help="Only rebuild this hospital")
+    def rebuild_rollups_command(hospital_id):
+        """Backfill or rebuild device usage rollups from treatment sessions."""
+        from app.services.rollup_service import rebuild_rollups
+        from app.services.utilization_service import invalidate_utilization
+        from app.services.demand_model_service import invalidate_demand_model
+
+        rows = rebuild_rollups(hospital_id)
+        invalidate_utilization(hospital_id)
+        invalidate_demand_model(hospital_id)
+        click.echo(f"Rebuilt {rows} device usage rollup rows")
+
+    @app.cli.command("backfill-simulation-summaries")
+    def backfill_simulation_summaries_command():
+        """Fill summary columns for simulations saved before they existed."""
+        from app.services.simulation_history_service import backfill_summaries
+
+        rows = backfill_summaries()
+        click.echo(f"Backfilled {rows} simulation summaries")
+
+    @app.cli.command("gc-distributions")
+    @click.option("--grace-seconds", type=int, default=None,
+                  help="Keep unreferenced files younger than this (default 1 hour)")
+    @click.option("--dry-run", is_flag=True, help="Only report what would be deleted")
+    def gc_distributions_command(grace_seconds, dry_run):
+        """Delete simulation distribution files no simulation references."""
+        from app.services.distribution_store import GC_GRACE_SECONDS, collect_garbage
+
+        removed, freed = collect_garbage(
+            GC_GRACE_SECONDS if grace_seconds is None else grace_seconds, dry_run=dry_run
+        )
+        verb = "Would delete" if dry_run else "Deleted"
+        click.echo(f"{verb} {removed} distribution files ({freed / 1024 / 1024:.1f} MB)")
+
+    @app.cli.command("fit-demand-models")
+    @click.option("--hospital-id", type=int, default=None, help="Only refit this hospital")
+    def fit_demand_models_command(hospital_id):
+        """Refit per-hospital demand models (run on a schedule to keep fits warm)."""
+        from app.models.hospital import Hospital
+        from app.services.demand_model_service import get_demand_model
+
+        hospital_ids = [hospital_id] if hospital_id is not None else [
+            h.hospital_id for h in Hospital.query.all()
+        ]
+        for hid in hospital_ids:
+            model = get_demand_model(hid, refresh=True)
+            click.echo(f"Hospital {hid}: {len(model['devices'])} devices fitted "
+                       f"over {model['days']} days ({model['basis'] or 'no history'})")
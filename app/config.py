@@ -2,3 +2,42 @@ class Config:
     SECRET_KEY = "supersecretkey"
     SQLALCHEMY_DATABASE_URI = "mysql+mysqlconnector://root:@localhost/hospital"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Monte Carlo simulation: worker processes (1 = run in the request thread)
+    SIMULATION_WORKERS = 1
+    SIMULATION_PARALLEL_MIN_DRAWS = 2000000
+
+    # Background simulation jobs (False runs them inside the request)
+    SIMULATION_ASYNC = True
+    SIMULATION_JOB_WORKERS = 2
+    # Seconds without a heartbeat before a queued/running job counts as dead
+    # (its process restarted); such rows are failed at startup and never reused
+    SIMULATION_JOB_STALE_SECONDS = 300
+    # Fail dead jobs once when run.py starts the server; other deployments
+    # run `flask recover-simulation-jobs` at startup instead
+    SIMULATION_RECOVER_JOBS_ON_START = True
+
+    # Per-run result distributions (.npy files; None = <instance>/simulation_distributions)
+    SIMULATION_STORE_DISTRIBUTIONS = True
+    SIMULATION_DISTRIBUTION_DIR = None
+
+    # Bulk transfers: processes hashing session histories (1 = request process)
+    TRANSFER_CHECKSUM_WORKERS = 1
+
+    # Demand model fits from session history: seconds before a hospital's fit is refreshed
+    DEMAND_FIT_REFRESH_SECONDS = 21600
+
+    # Request instrumentation: SQL/render timings per request, recent requests kept for superadmins
+    REQUEST_PROFILING = True
+    # X-Request-Id / X-DB-Queries / Server-Timing headers, sent to superadmin sessions only
+    REQUEST_PROFILE_HEADERS = True
+    REQUEST_PROFILE_BUFFER_SIZE = 200
+    REQUEST_PROFILE_SLOW_QUERIES = 5
+    REQUEST_PROFILE_SLOW_MS = 1000
+
+    # Same statement shape run this many times in one request is reported as N+1
+    REQUEST_PROFILE_N_PLUS_ONE = 10
+
+    # Fraction of requests run under a profiler ("cprofile" or "pyinstrument", if installed)
+    REQUEST_PROFILE_SAMPLE_RATE = 0.0
+    REQUEST_PROFILER = "cprofile"
@@ -8,4 +8,5 @@ from app.models.doctor import Doctor
 from app.models.nurse import Nurse
 from app.models.department import Department
 from .medical_report import MedicalReport
-
+from app.models.device_usage_rollup import DeviceUsageRollup
+from app.models.transfer_leaf_hash import TransferLeafHash
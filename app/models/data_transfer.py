@@ -4,6 +4,11 @@ from datetime import datetime
 
 class DataTransfer(db.Model):
     __tablename__ = "data_transfers"
+    __table_args__ = (
+        # Newest-first incoming / outgoing transfer history
+        db.Index("ix_data_transfers_target_transferred", "target_hospital", "transferred_at"),
+        db.Index("ix_data_transfers_source_transferred", "source_hospital", "transferred_at"),
+    )
 
     transfer_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     patient_id = db.Column(db.String(36), db.ForeignKey("patients.patient_id"), nullable=False)
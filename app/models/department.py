@@ -2,6 +2,10 @@ from app import db
 
 class Department(db.Model):
     __tablename__ = "departments"
+    __table_args__ = (
+        # Name prefix search (autocomplete) and lookups by department name
+        db.Index("ix_departments_name_hospital", "name", "hospital_id"),
+    )
 
     department_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     hospital_id = db.Column(db.Integer, db.ForeignKey("hospitals.hospital_id"), nullable=False)
@@ -9,3 +13,7 @@ class Department(db.Model):
 
     # Relationship to hospital (optional, useful)
     hospital = db.relationship("Hospital", backref="departments", lazy=True)
+
+
+# Candidate ranking matches department names case-insensitively
+db.Index("ix_departments_name_lower", db.func.lower(Department.name))
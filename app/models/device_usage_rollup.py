@@ -0,0 +1,26 @@
+# app/models/device_usage_rollup.py
+from app import db
+
+class DeviceUsageRollup(db.Model):
+    """Daily per-device usage and profit totals, maintained from treatment sessions"""
+    __tablename__ = "device_usage_rollups"
+    __table_args__ = (
+        db.UniqueConstraint("hospital_id", "device_key", "usage_date", name="uq_device_usage_rollup_day"),
+        db.Index("ix_device_usage_rollups_hospital_date", "hospital_id", "usage_date"),
+    )
+
+    rollup_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+
+    hospital_id = db.Column(db.Integer, db.ForeignKey("hospitals.hospital_id"), nullable=False)
+    # NULL collects sessions that did not use a device
+    device_id = db.Column(db.Integer, db.ForeignKey("devices.device_id", ondelete="SET NULL"), nullable=True)
+    # device_id, or 0 for no device: NULLs never collide in a unique key, so
+    # the per-day uniqueness (and the upsert) is keyed on this instead
+    device_key = db.Column(db.Integer, nullable=False, default=0)
+    usage_date = db.Column(db.Date, nullable=False)
+
+    session_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    device_cost = db.Column(db.Float, nullable=False, default=0)
+    staff_cost = db.Column(db.Float, nullable=False, default=0)
+    profit = db.Column(db.Float, nullable=False, default=0)
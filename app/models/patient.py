@@ -2,6 +2,10 @@ from app import db
 
 class Patient(db.Model):
     __tablename__ = "patients"
+    __table_args__ = (
+        # Hospital-scoped name prefix search (autocomplete)
+        db.Index("ix_patients_hospital_name", "hospital_id", "name"),
+    )
 
     patient_id = db.Column(db.String(36), primary_key=True)  # UUID
     hospital_id = db.Column(db.Integer, db.ForeignKey("hospitals.hospital_id"), nullable=False)
@@ -3,6 +3,10 @@ from datetime import datetime
 
 class PatientAccess(db.Model):
     __tablename__ = "patient_access"
+    __table_args__ = (
+        # "Can hospital H see patient P?" checks, single and batched
+        db.Index("ix_patient_access_patient_hospital_active", "patient_id", "hospital_id", "is_active"),
+    )
 
     access_id = db.Column(db.Integer, primary_key=True)
 
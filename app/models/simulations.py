@@ -2,6 +2,12 @@ from app import db
 from datetime import datetime
 class Simulation(db.Model):
     __tablename__ = "simulations"
+    __table_args__ = (
+        # Newest-first history pages per hospital
+        db.Index("ix_simulations_hospital_date", "hospital_id", "simulation_date", "simulation_id"),
+        # Reuse lookups for resubmitted runs (simulation_cache)
+        db.Index("ix_simulations_hospital_fingerprint", "hospital_id", "fingerprint"),
+    )
     
     simulation_id = db.Column(db.Integer, primary_key=True)
     hospital_id = db.Column(db.Integer, db.ForeignKey("hospitals.hospital_id"), nullable=False)
@@ -10,5 +16,32 @@ class Simulation(db.Model):
     parameters = db.Column(db.JSON)  # Stores all input parameters
     results = db.Column(db.JSON)  # Stores simulation results
     recommendations = db.Column(db.Text)
+
+    # Summary of `results`, written at save time so listings never parse the blob
+    device_count = db.Column(db.Integer, nullable=True)
+    total_revenue = db.Column(db.Float, nullable=True)
+    total_profit = db.Column(db.Float, nullable=True)
+    high_risk_count = db.Column(db.Integer, nullable=True)
+    medium_risk_count = db.Column(db.Integer, nullable=True)
+    low_risk_count = db.Column(db.Integer, nullable=True)
+
+    # Content-addressed key of the stored per-run treatment counts (distribution_store)
+    distribution_key = db.Column(db.String(64), nullable=True)
+
+    # SHA-256 of the run's parameters, seed and device cost fields (simulation_cache)
+    fingerprint = db.Column(db.String(64), nullable=True)
+
+    # Background job state (rows saved before the job queue are 'completed')
+    status = db.Column(
+        db.Enum("queued", "running", "completed", "failed", "cancelled"),
+        nullable=False,
+        default="completed",
+        server_default="completed"
+    )
+    progress = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    error_message = db.Column(db.Text, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    # Touched while the job is alive; a stale heartbeat means its process died
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
     
     hospital = db.relationship("Hospital", backref="simulations")
\ No newline at end of file
@@ -0,0 +1,19 @@
+# app/models/transfer_leaf_hash.py
+from app import db
+
+class TransferLeafHash(db.Model):
+    """Merkle leaves snapshotted when a transfer is initiated (position 0 is the patient header)"""
+    __tablename__ = "transfer_leaf_hashes"
+
+    transfer_id = db.Column(
+        db.Integer,
+        db.ForeignKey("data_transfers.transfer_id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    position = db.Column(db.Integer, primary_key=True)
+
+    # NULL for the header leaf
+    session_id = db.Column(db.Integer, nullable=True)
+    leaf_hash = db.Column(db.String(64), nullable=False)
+    # TreatmentSession.row_version that was hashed (NULL for the header and older rows)
+    session_version = db.Column(db.Integer, nullable=True)
@@ -6,6 +6,12 @@ from app.models.doctor import Doctor
 
 class TreatmentSession(db.Model):
     __tablename__ = "treatment_sessions"
+    __table_args__ = (
+        # Per-device usage aggregation over a date window
+        db.Index("ix_treatment_sessions_hospital_device_created", "hospital_id", "device_id", "created_at"),
+        # Newest-first keyset pagination of a hospital's sessions
+        db.Index("ix_treatment_sessions_hospital_created", "hospital_id", "created_at", "session_id"),
+    )
 
     session_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     patient_id = db.Column(db.String(36), db.ForeignKey("patients.patient_id"), nullable=False)
@@ -25,9 +31,30 @@ class TreatmentSession(db.Model):
     notes = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
+    # Bumped by every ORM update (and on MySQL by a trigger, so raw SQL edits
+    # count too); transfer verification rehashes only sessions whose version moved
+    row_version = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0",
+        onupdate=db.literal_column("row_version") + 1
+    )
+
     # Relationships with unique backrefs
   # Relationships with logical unique names
     patient_session   = db.relationship("Patient", backref="sessions_for_patient")
     doctor_session    = db.relationship("Doctor", backref="sessions_for_doctor")
     device_session    = db.relationship("Device", backref="sessions_for_device")
     treatment_session = db.relationship("Treatment", backref="sessions_for_treatment")
+
+
+# Setting NEW.row_version = OLD.row_version + 1 agrees with the ORM's own bump
+ROW_VERSION_TRIGGER = "treatment_sessions_row_version"
+ROW_VERSION_TRIGGER_DDL = (
+    f"CREATE TRIGGER {ROW_VERSION_TRIGGER} BEFORE UPDATE ON treatment_sessions "
+    "FOR EACH ROW SET NEW.row_version = OLD.row_version + 1"
+)
+
+db.event.listen(
+    TreatmentSession.__table__,
+    "after_create",
+    db.DDL(ROW_VERSION_TRIGGER_DDL).execute_if(dialect="mysql")
+)
@@ -14,21 +14,41 @@ from app.models.hospital_connection import HospitalConnection
 from app.models.data_transfer import DataTransfer
 from app.models.patient_access import PatientAccess
 from app.models.simulations import Simulation
-from app.services.simulation_engine import EnhancedSimulation
+from app.services.simulation_engine import MAX_SIMULATION_RUNS, parameters_from_saved
+from app.services.horizon_simulation import HORIZON_MAX_MONTHS, schedule_matrix, seasonality_curve
+from app.services.price_optimizer import DEFAULT_ELASTICITY, resolve_elasticity
+from app.services.portfolio_risk import resolve_common_share
+from app.services.simulation_jobs import enqueue_simulation, cancel_simulation, job_status
+from app.services.simulation_rng import resolve_seed
+from app.services.simulation_history_service import list_simulations, simulation_stats
+from app.services.distribution_store import (
+    HISTOGRAM_BINS, load_distribution, profit_samples, distribution_stats, release_distribution
+)
+from app.services.utilization_service import historical_utilization as get_historical_utilization
+from app.services.demand_model_service import fitted_parameters, get_demand_model
+from app.services.search_service import search_patients, search_departments
+from app.services.request_profiler import annotate
+from app.services.access_service import can_access
 from app.models.treatment_session import TreatmentSession
 from datetime import datetime, timedelta
 
-from app.services.transfer_service import compute_hospital_scores, create_transfer_checksum, build_patient_payload
-from app.services.checksum_service import generate_checksum
+from app.services.transfer_service import compute_hospital_scores, create_transfer_checksum, transfer_timestamp
+from app.services.transfer_history_service import TRANSFER_STATUSES, list_transfers, transfer_counts
+from app.services.bulk_transfer_service import BULK_TRANSFER_LIMIT, initiate_transfers, accept_transfers
+import json
 import uuid
 import numpy as np
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
 
+def _owns_patient(patient_id):
+    """Is the patient registered at the signed-in admin's hospital?"""
+    patient = Patient.query.get(patient_id)
+    return patient is not None and str(patient.hospital_id) == str(session.get("hospital_id"))
+
 @admin_bp.route("/transfers", methods=["GET", "POST"])
 def transfer_patient():
-    patients = Patient.query.all()
-    departments = Department.query.all()
+    # Patients and departments are picked through the autocomplete endpoints
     selected_patient = None
     selected_department = None
     hospitals_options = []
@@ -37,21 +57,37 @@ def transfer_patient():
         patient_id = request.form.get("patient_id")
         department_id = request.form.get("department_id")
         target_hospital_id = request.form.get("target_hospital_id")
+        target_department_id = request.form.get("target_department_id")
+
+        # Only the owning hospital starts a transfer (as in bulk transfers);
+        # a PatientAccess grant allows reading, not sending the patient on
+        if patient_id and not _owns_patient(patient_id):
+            flash("Patient belongs to another hospital", "danger")
+            return redirect(url_for("admin.transfer_patient"))
 
         # Transfer submission
-        if patient_id and department_id and target_hospital_id:
+        if patient_id and department_id and (target_department_id or target_hospital_id):
             patient = Patient.query.get(patient_id)
 
+            # Candidates match the searched department by name, so each one
+            # carries its own department row; it must belong to the target
+            target_department = Department.query.get(int(target_department_id or department_id))
+            if target_department is None or (
+                target_hospital_id and str(target_department.hospital_id) != str(target_hospital_id)
+            ):
+                flash("Department belongs to another hospital", "danger")
+                return redirect(url_for("admin.transfer_patient"))
+
             initiated_by = session.get("admin_id")  # <-- Use session instead of flask-login
 
             transfer = DataTransfer(
                 patient_id=patient.patient_id,
                 source_hospital=patient.hospital_id,
-                target_hospital=int(target_hospital_id),
-                department_id=int(department_id),
+                target_hospital=target_department.hospital_id,
+                department_id=target_department.department_id,
                 initiated_by_staff=initiated_by,
                 transfer_status="pending",
-                transferred_at=db.func.now()
+                transferred_at=transfer_timestamp()
             )
             db.session.add(transfer)
             db.session.flush()
@@ -69,8 +105,6 @@ def transfer_patient():
 
     return render_template(
         "dashboards/admin/transfer_patient.html",
-        patients=patients,
-        departments=departments,
         selected_patient=selected_patient,
         selected_department=selected_department,
         hospitals_options=hospitals_options
@@ -93,25 +127,15 @@ def incoming_transfers():
 def accept_transfer(transfer_id):
     transfer = DataTransfer.query.get_or_404(transfer_id)
 
-    # DEBUG: Print current state
-    print(f"DEBUG: Transfer ID: {transfer_id}")
-    print(f"DEBUG: Original checksum: {transfer.checksum_original}")
-    print(f"DEBUG: Current status: {transfer.transfer_status}")
+    annotate(f"Status before verification: {transfer.transfer_status}")
 
     # Verify checksum
     from app.services.transfer_service import verify_transfer_checksum
-    checksum_matches = verify_transfer_checksum(transfer)
-    
-    print(f"DEBUG: Checksum matches? {checksum_matches}")
+    checksum_matches, verified_checksum, diverged = verify_transfer_checksum(transfer)
     
+    annotate(f"Checksum matches: {checksum_matches}")
+
     if checksum_matches:
-        # Recompute and store verified checksum
-        payload = build_patient_payload(transfer.patient_id, transfer.department_id)
-        payload["transfer_context"]["timestamp"] = transfer.transferred_at.isoformat() if transfer.transferred_at else None
-        verified_checksum = generate_checksum(payload)
-        
-        print(f"DEBUG: New checksum: {verified_checksum}")
-        
         transfer.transfer_status = "verified"
         transfer.checksum_verified = verified_checksum
         
@@ -130,20 +154,26 @@ def accept_transfer(transfer_id):
         db.session.commit()
         
         flash("Transfer verified successfully! Access granted.", "success")
-        print(f"DEBUG: Transfer marked as verified and committed")
+        annotate("Transfer marked as verified and committed")
     else:
         # Still update the database even if it fails
         transfer.transfer_status = "failed"
         
         # Store what checksum we got (for debugging)
-        payload = build_patient_payload(transfer.patient_id, transfer.department_id)
-        payload["transfer_context"]["timestamp"] = transfer.transferred_at.isoformat() if transfer.transferred_at else None
-        transfer.checksum_verified = generate_checksum(payload)
+        transfer.checksum_verified = verified_checksum
         
         db.session.commit()
         
         flash("Checksum verification failed. Transfer rejected.", "danger")
-        print(f"DEBUG: Transfer marked as failed")
+        if diverged:
+            details = []
+            if diverged["patient"]:
+                details.append("patient details")
+            for label in ("changed", "removed", "added"):
+                if diverged[label]:
+                    details.append(f"{label} sessions {', '.join(map(str, diverged[label]))}")
+            flash(f"Diverged since initiation: {'; '.join(details)}.", "danger")
+        annotate("Transfer marked as failed")
 
     return redirect(url_for("admin.incoming_transfers"))
 
@@ -154,6 +184,60 @@ def reject_transfer(transfer_id):
     db.session.commit()
     flash("Transfer request has been manually rejected.", "warning")
     return redirect(url_for("admin.incoming_transfers"))
+@admin_bp.route("/transfers/bulk", methods=["POST"])
+def bulk_transfer():
+    """
+    Queues many patient transfers in one request.
+    JSON body: {"transfers": [{"patient_id", "department_id", "target_hospital_id"}, ...]};
+    top-level "department_id"/"target_hospital_id" apply to items that omit them.
+    """
+    if "admin_id" not in session:
+        return jsonify({"success": False, "error": "Not authenticated"}), 401
+
+    data = request.get_json(silent=True) or {}
+    items = data.get("transfers") or []
+    if not isinstance(items, list) or not items:
+        return jsonify({"success": False, "error": "No transfers given"}), 400
+    if len(items) > BULK_TRANSFER_LIMIT:
+        return jsonify({"success": False, "error": f"At most {BULK_TRANSFER_LIMIT} transfers per request"}), 400
+
+    transfer_requests = [
+        {
+            "patient_id": item.get("patient_id"),
+            "department_id": item.get("department_id", data.get("department_id")),
+            "target_hospital_id": item.get("target_hospital_id", data.get("target_hospital_id"))
+        }
+        for item in items if isinstance(item, dict)
+    ]
+    results = initiate_transfers(transfer_requests, session.get("hospital_id"), session["admin_id"])
+
+    return jsonify({
+        "success": True,
+        "queued": sum(1 for r in results if r["status"] == "pending"),
+        "results": results
+    })
+
+@admin_bp.route("/transfers/accept-batch", methods=["POST"])
+def bulk_accept_transfers():
+    """Verifies and accepts many incoming transfers. JSON body: {"transfer_ids": [...]}"""
+    if "admin_id" not in session:
+        return jsonify({"success": False, "error": "Not authenticated"}), 401
+
+    data = request.get_json(silent=True) or {}
+    transfer_ids = data.get("transfer_ids") or []
+    if not isinstance(transfer_ids, list) or not transfer_ids:
+        return jsonify({"success": False, "error": "No transfers given"}), 400
+    if len(transfer_ids) > BULK_TRANSFER_LIMIT:
+        return jsonify({"success": False, "error": f"At most {BULK_TRANSFER_LIMIT} transfers per request"}), 400
+
+    results = accept_transfers(transfer_ids, session.get("hospital_id"))
+
+    return jsonify({
+        "success": True,
+        "verified": sum(1 for r in results if r["status"] == "verified"),
+        "results": results
+    })
+
 @admin_bp.route("/transfers-history")
 def transfers_history():
     """
@@ -163,34 +247,18 @@ def transfers_history():
     - Shows department names instead of IDs
     """
     hospital_id = session.get("hospital_id")
-    
-    # Get incoming transfers (to this hospital)
-    incoming_transfers = db.session.query(
-        DataTransfer,
-        Department.name.label('department_name'),
-        Hospital.name.label('source_hospital_name'),
-        Patient.name.label('patient_name')
-    )\
-    .join(Department, DataTransfer.department_id == Department.department_id)\
-    .join(Hospital, DataTransfer.source_hospital == Hospital.hospital_id)\
-    .join(Patient, DataTransfer.patient_id == Patient.patient_id)\
-    .filter(DataTransfer.target_hospital == hospital_id)\
-    .order_by(DataTransfer.transferred_at.desc())\
-    .all()
-    
-    # Get outgoing transfers (from this hospital)
-    outgoing_transfers = db.session.query(
-        DataTransfer,
-        Department.name.label('department_name'),
-        Hospital.name.label('target_hospital_name'),
-        Patient.name.label('patient_name')
-    )\
-    .join(Department, DataTransfer.department_id == Department.department_id)\
-    .join(Hospital, DataTransfer.target_hospital == Hospital.hospital_id)\
-    .join(Patient, DataTransfer.patient_id == Patient.patient_id)\
-    .filter(DataTransfer.source_hospital == hospital_id)\
-    .order_by(DataTransfer.transferred_at.desc())\
-    .all()
+    filters = {
+        "status": request.args.get("status") or None,
+        "date_from": request.args.get("date_from") or None,
+        "date_to": request.args.get("date_to") or None
+    }
+
+    incoming_transfers, incoming_cursor = list_transfers(
+        hospital_id, "incoming", cursor=request.args.get("incoming_cursor"), **filters
+    )
+    outgoing_transfers, outgoing_cursor = list_transfers(
+        hospital_id, "outgoing", cursor=request.args.get("outgoing_cursor"), **filters
+    )
     
     # Format status for display
     def format_status(status):
@@ -206,30 +274,37 @@ def transfers_history():
         "dashboards/admin/transfers_history.html",
         incoming=incoming_transfers,
         outgoing=outgoing_transfers,
+        incoming_cursor=incoming_cursor,
+        outgoing_cursor=outgoing_cursor,
+        counts=transfer_counts(hospital_id),
+        statuses=TRANSFER_STATUSES,
+        filters=filters,
         format_status=format_status,
         hospital_id=hospital_id
     )
 
-# AJAX route for patient autocomplete
+# AJAX route for patient autocomplete (admin's own hospital)
 @admin_bp.route("/autocomplete/patient")
 def autocomplete_patient():
-    term = request.args.get("q", "")
-    patients = Patient.query.filter(Patient.name.ilike(f"%{term}%")).all()
-    results = [{"id": p.patient_id, "name": p.name} for p in patients]
+    hospital_id = session.get("hospital_id")
+    if hospital_id is None:
+        return jsonify([])
+    results = search_patients(hospital_id, request.args.get("q", ""), request.args.get("limit"))
     return jsonify(results)
 
 # AJAX route for department autocomplete (excluding current hospital)
 @admin_bp.route("/autocomplete/department/<patient_id>")
 def autocomplete_department(patient_id):
-    term = request.args.get("q", "")
+    if not can_access(session.get("hospital_id"), patient_id):
+        return jsonify([])
     patient = Patient.query.get(patient_id)
     if not patient:
         return jsonify([])
-    departments = Department.query.filter(
-        Department.name.ilike(f"%{term}%"),
-        Department.hospital_id != patient.hospital_id
-    ).all()
-    results = [{"id": d.department_id, "name": d.name, "hospital_id": d.hospital_id} for d in departments]
+    results = search_departments(
+        request.args.get("q", ""),
+        exclude_hospital_id=patient.hospital_id,
+        limit=request.args.get("limit")
+    )
     return jsonify(results)
 
 
@@ -242,6 +317,9 @@ def confirm_transfer():
     patient_id = request.form.get("patient_id")
     target_hospital_id = request.form.get("target_hospital")
     staff_id = session.get("admin_id")
+    if not _owns_patient(patient_id):
+        flash("Patient belongs to another hospital", "danger")
+        return redirect(url_for("admin.transfer_patient"))
     patient = Patient.query.get(patient_id)
 
     transfer = DataTransfer(
@@ -264,43 +342,14 @@ def simulations():
     hospital_id = admin.hospital_id
 
     devices = Device.query.filter_by(hospital_id=hospital_id).all()
-    treatments = Treatment.query.filter_by(hospital_id=hospital_id).all()
-
-    summary = None
-    detailed = None
-    recommendations = None
-    simulation_id = None
     
-    # Calculate historical utilization
-    historical_utilization = {}
-    if devices:
-        # Try to get from treatment sessions
-        from app.models.treatment_session import TreatmentSession
-        from datetime import datetime, timedelta
-        
-        six_months_ago = datetime.utcnow() - timedelta(days=180)
-        total_treatments = TreatmentSession.query.filter_by(
-            hospital_id=hospital_id
-        ).filter(
-            TreatmentSession.created_at >= six_months_ago
-        ).count()
-        
-        if total_treatments > 0:
-            for device in devices:
-                device_treatments = TreatmentSession.query.filter_by(
-                    device_id=device.device_id,
-                    hospital_id=hospital_id
-                ).filter(
-                    TreatmentSession.created_at >= six_months_ago
-                ).count()
-                historical_utilization[device.device_id] = device_treatments / total_treatments
-        else:
-            # Default equal distribution
-            for device in devices:
-                historical_utilization[device.device_id] = 1.0 / len(devices)
-    else:
-        # No devices
-        historical_utilization = {}
+    # Historical utilization (one grouped query, cached per hospital)
+    historical_utilization = get_historical_utilization(
+        hospital_id, [device.device_id for device in devices]
+    )
+
+    # Demand fitted from session history (cached per hospital, refreshed on a schedule)
+    demand_model = get_demand_model(hospital_id)
 
     if request.method == "POST":
         try:
@@ -309,11 +358,33 @@ def simulations():
             simulation_runs = int(request.form.get("runs", 100))
             seasonality = float(request.form.get("seasonality", 1.0))
             target_margin = float(request.form.get("target_margin", 20)) / 100
+            max_loss = request.form.get("max_loss_probability")
+            max_loss_probability = float(max_loss) / 100 if max_loss else None
+            try:
+                elasticity = resolve_elasticity(request.form.get("elasticity"))
+            except ValueError as e:
+                flash(f"Invalid elasticity: {e}", "danger")
+                return redirect(url_for("admin.simulations"))
+            portfolio_mode = bool(request.form.get("portfolio_mode"))
+            try:
+                common_share = resolve_common_share(request.form.get("common_share"))
+            except ValueError as e:
+                flash(f"Invalid portfolio risk setting: {e}", "danger")
+                return redirect(url_for("admin.simulations"))
+            horizon_months = int(request.form.get("horizon_months") or 1)
+            use_fitted_demand = bool(request.form.get("use_fitted_demand")) and bool(demand_model["devices"])
+            seed_was_random = not request.form.get("seed", "").strip()
+            try:
+                seed = resolve_seed(request.form.get("seed"))
+            except ValueError as e:
+                flash(f"Invalid seed: {e}", "danger")
+                return redirect(url_for("admin.simulations"))
             
             # Build device parameters - use historical if not specified
             device_utilization = {}
             price_changes = {}
             maintenance_downtime = {}
+            explicit_utilization = set()
             
             for device in devices:
                 device_id = device.device_id
@@ -322,6 +393,7 @@ def simulations():
                 util_key = f"util_{device_id}"
                 if util_key in request.form and request.form[util_key]:
                     device_utilization[device_id] = float(request.form[util_key])
+                    explicit_utilization.add(device_id)
                 else:
                     device_utilization[device_id] = historical_utilization.get(device_id, 0.1)
                 
@@ -334,31 +406,68 @@ def simulations():
                 'seasonality_factor': seasonality,
                 'price_changes': price_changes,
                 'maintenance_downtime': maintenance_downtime,
-                'simulation_runs': min(simulation_runs, 100)  # Cap at 100
+                'simulation_runs': max(1, min(simulation_runs, MAX_SIMULATION_RUNS)),
+                'seed': seed,
+                'seed_was_random': seed_was_random,
+                'target_margin': target_margin,
+                'max_loss_probability': max_loss_probability,
+                'elasticity': elasticity,
+                'portfolio_mode': portfolio_mode,
+                'common_share': common_share
             }
             
-            # Run simulation
-            simulator = EnhancedSimulation(hospital_id, devices, treatments)
-            results = simulator.simulate_month_with_parameters(parameters)
+            # Fitted means/dispersions are stored with the run so replays reuse them.
+            # A utilization the admin submitted wins over the fit for that device
+            # (the form disables the sliders of fitted devices while the fit is on)
+            if use_fitted_demand:
+                parameters['fitted_demand'] = fitted_parameters(
+                    demand_model,
+                    [device.device_id for device in devices if device.device_id not in explicit_utilization]
+                )
             
-            # Generate recommendations
-            recommendations = simulator.optimize_prices(results, target_margin)
+            # More than one month: multi-month forecast with optional curves and schedules
+            simulation_type = "revenue_forecast"
+            if horizon_months > 1:
+                simulation_type = "horizon_forecast"
+                parameters['horizon_months'] = min(horizon_months, HORIZON_MAX_MONTHS)
+                # Checked here so bad input is reported now, not as a failed job later
+                try:
+                    start = datetime.utcnow().replace(day=1) + timedelta(days=32)
+                    if request.form.get("horizon_start"):
+                        parameters['horizon_start'] = request.form["horizon_start"]
+                        start = datetime.strptime(parameters['horizon_start'], '%Y-%m')
+                    curve = request.form.get("seasonality_curve", "").strip()
+                    if curve:
+                        parameters['seasonality_curve'] = [float(v) for v in curve.split(",")]
+                    elif use_fitted_demand:
+                        parameters['seasonality_curve'] = demand_model["monthly_factors"]
+                    seasonality_curve(parameters.get('seasonality_curve'), start.month, parameters['horizon_months'])
+                    for key in ('downtime_schedule', 'price_schedule'):
+                        if request.form.get(key, "").strip():
+                            parameters[key] = json.loads(request.form[key])
+                            schedule_matrix(parameters[key], [device.device_id for device in devices],
+                                            parameters['horizon_months'], 0.0)
+                except ValueError as e:
+                    flash(f"Invalid forecast settings: {str(e)[:150]}", "danger")
+                    return redirect(url_for("admin.simulations"))
             
-            # Save with the class method - NOW CORRECT
-            simulation_id = simulator.save_simulation_simple(parameters, results, recommendations)
-            
-            if simulation_id:
+            # Queue the run; the job stores its results on the simulation row
+            simulation_id = enqueue_simulation(hospital_id, parameters, simulation_type=simulation_type)
+            simulation = Simulation.query.get(simulation_id)
+
+            if request.accept_mimetypes.best == "application/json":
+                return jsonify({
+                    **job_status(simulation),
+                    "status_url": url_for("admin.simulation_status", simulation_id=simulation_id),
+                    "result_url": url_for("admin.view_simulation", simulation_id=simulation_id)
+                }), 202
+
+            if simulation.status == "completed":
                 flash(f"Simulation completed! ID: {simulation_id}", "success")
-            else:
-                # Try minimal save as backup
-                simulation_id = simulator.save_simulation_minimal(parameters, results)
-                if simulation_id:
-                    flash("Simulation completed (minimal save)", "info")
-                else:
-                    flash("Simulation completed but not saved to database", "warning")
-            
-            summary = results
-            detailed = results
+                return redirect(url_for("admin.view_simulation", simulation_id=simulation_id))
+
+            flash(f"Simulation #{simulation_id} queued. Progress is shown below.", "info")
+            return redirect(url_for("admin.simulation_history"))
             
         except Exception as e:
             db.session.rollback()
@@ -369,11 +478,11 @@ def simulations():
     return render_template(
         "dashboards/admin/simulations.html",
         devices=devices,
-        summary=summary,
-        detailed=detailed,
-        recommendations=recommendations,
-        simulation_id=simulation_id,
-        historical_utilization=historical_utilization  
+        historical_utilization=historical_utilization,
+        demand_model=demand_model,
+        max_runs=MAX_SIMULATION_RUNS,
+        max_horizon_months=HORIZON_MAX_MONTHS,
+        default_elasticity=DEFAULT_ELASTICITY
     )
 @admin_bp.route("/simulation/<int:simulation_id>")
 def view_simulation(simulation_id):
@@ -481,6 +590,115 @@ def view_simulation(simulation_id):
         recommendations=recommendations
     )
 
+@admin_bp.route("/simulation/<int:simulation_id>/replay", methods=["POST"])
+def replay_simulation(simulation_id):
+    """Re-runs a saved simulation with its stored parameters and seed"""
+    if "admin_id" not in session:
+        flash("Please log in first", "danger")
+        return redirect(url_for("auth.admin_login"))
+
+    admin = Admin.query.get(session["admin_id"])
+    simulation = Simulation.query.get_or_404(simulation_id)
+
+    if simulation.hospital_id != admin.hospital_id:
+        flash("Access denied", "danger")
+        return redirect(url_for("admin.simulations"))
+
+    parameters = parameters_from_saved(simulation.parameters)
+    if parameters.get('seed') is None:
+        flash("This simulation was saved without a seed and cannot be replayed", "warning")
+        return redirect(url_for("admin.view_simulation", simulation_id=simulation_id))
+
+    # A replay always re-runs, even when the inputs are unchanged
+    new_id = enqueue_simulation(
+        admin.hospital_id, parameters, reuse=False,
+        simulation_type=simulation.simulation_type or "revenue_forecast"
+    )
+
+    flash(f"Simulation #{simulation_id} queued for replay as #{new_id} (seed {parameters['seed']})", "success")
+    return redirect(url_for("admin.view_simulation", simulation_id=new_id))
+
+@admin_bp.route("/simulation/<int:simulation_id>/status")
+def simulation_status(simulation_id):
+    """Polling endpoint for a background simulation job"""
+    if "admin_id" not in session:
+        return jsonify({"success": False, "error": "Not authenticated"}), 401
+
+    admin = Admin.query.get(session["admin_id"])
+    simulation = Simulation.query.get_or_404(simulation_id)
+
+    if simulation.hospital_id != admin.hospital_id:
+        return jsonify({"success": False, "error": "Access denied"}), 403
+
+    return jsonify(job_status(simulation))
+
+@admin_bp.route("/simulation/<int:simulation_id>/cancel", methods=["POST"])
+def cancel_simulation_job(simulation_id):
+    """Cancels a queued or running simulation"""
+    if "admin_id" not in session:
+        return jsonify({"success": False, "error": "Not authenticated"}), 401
+
+    admin = Admin.query.get(session["admin_id"])
+    simulation = Simulation.query.get_or_404(simulation_id)
+
+    if simulation.hospital_id != admin.hospital_id:
+        return jsonify({"success": False, "error": "Access denied"}), 403
+
+    if not cancel_simulation(simulation_id):
+        return jsonify({"success": False, "error": "Simulation already finished"}), 409
+
+    return jsonify({"success": True})
+
+@admin_bp.route("/simulation/<int:simulation_id>/distribution")
+def simulation_distribution(simulation_id):
+    """
+    Histogram, percentiles and VaR of a saved simulation's profit
+    distribution, read from its stored draws. ?device_id= selects one
+    device (default: hospital total); ?bins= and ?var= (e.g. 0.95) tune it.
+    """
+    if "admin_id" not in session:
+        return jsonify({"success": False, "error": "Not authenticated"}), 401
+
+    admin = Admin.query.get(session["admin_id"])
+    simulation = Simulation.query.get_or_404(simulation_id)
+
+    if simulation.hospital_id != admin.hospital_id:
+        return jsonify({"success": False, "error": "Access denied"}), 403
+
+    counts = load_distribution(simulation.distribution_key)
+    if counts is None:
+        return jsonify({"success": False, "error": "No stored distribution for this simulation"}), 404
+
+    # Legacy and minimal rows have no distribution metadata
+    results = simulation.results
+    if isinstance(results, str):
+        try:
+            results = json.loads(results)
+        except ValueError:
+            results = None
+    meta = results.get("distribution") if isinstance(results, dict) else None
+    if not meta:
+        return jsonify({"success": False, "error": "No stored distribution for this simulation"}), 404
+
+    device_index = None
+    device_id = request.args.get("device_id", type=int)
+    if device_id is not None:
+        if device_id not in meta["device_ids"]:
+            return jsonify({"success": False, "error": "Device not in this simulation"}), 404
+        device_index = meta["device_ids"].index(device_id)
+
+    var_level = request.args.get("var", 0.95, type=float)
+    if not 0 < var_level < 1:
+        return jsonify({"success": False, "error": "var must be between 0 and 1"}), 400
+
+    profits = profit_samples(counts, meta, device_index)
+    return jsonify({
+        "success": True,
+        "simulation_id": simulation_id,
+        "device_id": device_id,
+        **distribution_stats(profits, bins=request.args.get("bins", HISTOGRAM_BINS, type=int), var_level=var_level)
+    })
+
 @admin_bp.route("/simulation-history")
 def simulation_history():
     """View all saved simulations"""
@@ -489,15 +707,16 @@ def simulation_history():
         return redirect(url_for("auth.admin_login"))
     
     admin = Admin.query.get(session["admin_id"])
-    simulations = Simulation.query.filter_by(
-        hospital_id=admin.hospital_id
-    ).order_by(
-        Simulation.simulation_date.desc()
-    ).all()
+    simulations, next_cursor = list_simulations(
+        admin.hospital_id,
+        cursor=request.args.get("cursor")
+    )
     
     return render_template(
         "dashboards/admin/simulation_history.html",
-        simulations=simulations
+        simulations=simulations,
+        next_cursor=next_cursor,
+        stats=simulation_stats(admin.hospital_id)
     )
 
 @admin_bp.route("/simulation/<int:simulation_id>/delete", methods=["POST"])
@@ -512,8 +731,10 @@ def delete_simulation(simulation_id):
     if simulation.hospital_id != admin.hospital_id:
         return jsonify({"success": False, "error": "Access denied"}), 403
     
+    distribution_key = simulation.distribution_key
     db.session.delete(simulation)
     db.session.commit()
+    release_distribution(distribution_key)
     
     return jsonify({"success": True})
 @admin_bp.route("/dashboard")
@@ -1,4 +1,5 @@
-from flask import Blueprint, render_template, session,request, redirect, url_for, flash
+from flask import Blueprint, render_template, session,request, redirect, url_for, flash, abort
+from sqlalchemy.exc import SQLAlchemyError
 from app import db
 from app.models.doctor import Doctor
 from app.models.patient import Patient
@@ -6,6 +7,9 @@ from app.models.treatment_session import TreatmentSession
 from app.models.treatment import Treatment
 from app.models.medical_report import MedicalReport
 from app.models.device import Device
+from app.services.access_service import can_access, visible_patients
+from app.services.rollup_service import record_session, hospital_totals
+from app.services.treatment_session_service import list_sessions
 import uuid
 
 
@@ -26,22 +30,21 @@ def dashboard():
     
     doctor_id = session.get("doctor_id")
     doctor = Doctor.query.get(doctor_id)
-    patients = Patient.query.filter_by(hospital_id=doctor.hospital_id).all()
-    sessions = TreatmentSession.query.filter_by(hospital_id=doctor.hospital_id).all()
+    patient_count = Patient.query.filter_by(hospital_id=doctor.hospital_id).count()
+    totals = hospital_totals(doctor.hospital_id)
 
     return render_template("dashboards/doctor/doctor_dashboard.html",
                            doctor=doctor,
-                           patients=patients,
-                           sessions=sessions)
+                           patient_count=patient_count,
+                           session_count=totals["sessions"])
 @doctor_bp.route("/patients")
 def patients():
     if "doctor_id" not in session:
         flash("Please log in first", "danger")
         return redirect(url_for("auth.doctor_login"))
 
-    patients = Patient.query.filter_by(
-        hospital_id=session.get("hospital_id")
-    ).all()
+    # Own patients plus those transferred in (active PatientAccess grants)
+    patients = visible_patients(session.get("hospital_id"))
 
     return render_template(
         "dashboards/doctor/patients.html",
@@ -54,10 +57,9 @@ def start_exam(patient_id):
         flash("Please log in first", "danger")
         return redirect(url_for("auth.doctor_login"))
 
-    patient = Patient.query.filter_by(
-        patient_id=patient_id,
-        hospital_id=session.get("hospital_id")
-    ).first_or_404()
+    if not can_access(session.get("hospital_id"), patient_id):
+        abort(404)
+    patient = Patient.query.get_or_404(patient_id)
 
     return render_template(
         "dashboards/doctor/start_exam.html",
@@ -85,6 +87,10 @@ def submit_report(patient_id):
         flash("Please log in first", "danger")
         return redirect(url_for("auth.doctor_login"))
 
+    if not can_access(session.get("hospital_id"), patient_id):
+        flash("Access denied", "danger")
+        return redirect(url_for("doctor.patients"))
+
     report = MedicalReport(
         report_id=str(uuid.uuid4()),
         patient_id=patient_id,
@@ -114,6 +120,9 @@ def select_treatment(report_id):
 
     # Get the report
     report = MedicalReport.query.get_or_404(report_id)
+    if not can_access(session.get("hospital_id"), report.patient_id):
+        flash("Access denied", "danger")
+        return redirect(url_for("doctor.patients"))
 
     # All treatments for the hospital
     treatments = Treatment.query.filter_by(hospital_id=report.hospital_id).all()
@@ -176,8 +185,15 @@ def select_treatment(report_id):
             notes=notes
         )
 
-        db.session.add(session_obj)
-        db.session.commit()
+        # Session row and rollup increment share one transaction
+        try:
+            db.session.add(session_obj)
+            record_session(session_obj)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            flash("Could not save the treatment session, please try again.", "danger")
+            return redirect(url_for("doctor.select_treatment", report_id=report_id))
 
         flash("Treatment assigned successfully.", "success")
         # Go back to patient's page or dashboard
@@ -202,7 +218,23 @@ def treatment_sessions():
         return redirect(url_for("auth.doctor_login"))
 
     doctor = Doctor.query.get(session["doctor_id"])
-    sessions = TreatmentSession.query.filter_by(hospital_id=doctor.hospital_id).order_by(TreatmentSession.created_at.desc()).all()
-
-    return render_template("dashboards/doctor/treatment_sessions.html", sessions=sessions)
+    filters = {
+        "doctor_id": request.args.get("doctor_id") or None,
+        "date_from": request.args.get("date_from") or None,
+        "date_to": request.args.get("date_to") or None
+    }
+
+    sessions, next_cursor = list_sessions(
+        doctor.hospital_id,
+        cursor=request.args.get("cursor"),
+        **filters
+    )
+    doctors = Doctor.query.filter_by(hospital_id=doctor.hospital_id).order_by(Doctor.name).all()
 
+    return render_template(
+        "dashboards/doctor/treatment_sessions.html",
+        sessions=sessions,
+        next_cursor=next_cursor,
+        doctors=doctors,
+        filters=filters
+    )
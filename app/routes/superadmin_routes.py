@@ -1,9 +1,10 @@
 # app/routes/superadmin_routes.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, current_app, jsonify, render_template, request, redirect, url_for, flash, session
 from app import db
 from app.models.hospital import Hospital
 from app.models.admin import Admin
 from app.models.hospital_connection import HospitalConnection
+from app.services.connection_graph import connections_added, connections_deleted
 from werkzeug.security import generate_password_hash
 import uuid
 
@@ -120,6 +121,7 @@ def add_hospital_connection():
     ).first()
 
     db.session.add(conn_ab)
+    added = [conn_ab]
 
     if not reverse:
         conn_ba = HospitalConnection(
@@ -130,8 +132,10 @@ def add_hospital_connection():
             reliability=reliability
         )
         db.session.add(conn_ba)
+        added.append(conn_ba)
 
     db.session.commit()
+    connections_added(*added)
     flash("Hospital connection created successfully.", "success")
     return redirect(url_for("superadmin.hospital_connections"))
 
@@ -142,9 +146,49 @@ def add_hospital_connection():
 @superadmin_bp.route("/hospital-connections/delete/<int:connection_id>", methods=["POST"])
 def delete_hospital_connection(connection_id):
     connection = HospitalConnection.query.get_or_404(connection_id)
+    pair = (connection.hospital_from, connection.hospital_to)
 
     db.session.delete(connection)
     db.session.commit()
+    connections_deleted(pair)
 
     flash("Hospital connection deleted", "success")
     return redirect(url_for("superadmin.hospital_connections"))
+
+
+# -----------------------------
+# REQUEST PROFILES
+# -----------------------------
+@superadmin_bp.route("/request-profiles")
+def request_profiles():
+    """Recent request profiles, newest first; ?limit=, ?endpoint= and ?min_ms= filter them"""
+    if session.get("role") != 1:
+        return jsonify({"success": False, "error": "Access denied"}), 403
+
+    profiler = current_app.extensions.get("request_profiler")
+    if profiler is None:
+        return jsonify({"success": False, "error": "Request profiling is disabled"}), 404
+
+    profiles = profiler.recent()
+    endpoint = request.args.get("endpoint")
+    if endpoint:
+        profiles = [p for p in profiles if p["endpoint"] == endpoint]
+    min_ms = request.args.get("min_ms", type=float)
+    if min_ms is not None:
+        profiles = [p for p in profiles if p["total_ms"] >= min_ms]
+
+    limit = request.args.get("limit", 50, type=int)
+    return jsonify({"success": True, "profiles": profiles[:limit]})
+
+
+@superadmin_bp.route("/request-profiles/<int:profile_id>")
+def request_profile(profile_id):
+    """One profile, with the sampled profiler output when there is one"""
+    if session.get("role") != 1:
+        return jsonify({"success": False, "error": "Access denied"}), 403
+
+    profiler = current_app.extensions.get("request_profiler")
+    record = profiler.get(profile_id) if profiler else None
+    if record is None:
+        return jsonify({"success": False, "error": "Profile not found (it may have left the buffer)"}), 404
+    return jsonify({"success": True, "profile": record})
@@ -0,0 +1,128 @@
+# app/services/access_service.py
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, or_
+
+from app import db
+from app.models.patient import Patient
+from app.models.patient_access import PatientAccess
+
+# Decisions are reused briefly; local access/patient writes drop them
+# immediately and the TTL is a safety net for other processes' writes
+ACCESS_CACHE_TTL = 300
+ACCESS_CACHE_SIZE = 50000
+
+_decisions = OrderedDict()
+_decisions_lock = threading.Lock()
+
+
+def _key(hospital_id, patient_id):
+    return (str(hospital_id), str(patient_id))
+
+
+def _cached(keys):
+    now = time.monotonic()
+    found = {}
+    with _decisions_lock:
+        for key in keys:
+            entry = _decisions.get(key)
+            if entry is None:
+                continue
+            if entry[0] < now:
+                del _decisions[key]
+                continue
+            _decisions.move_to_end(key)
+            found[key] = entry[1]
+    return found
+
+
+def _store(decisions):
+    expires = time.monotonic() + ACCESS_CACHE_TTL
+    with _decisions_lock:
+        for key, allowed in decisions.items():
+            _decisions[key] = (expires, allowed)
+            _decisions.move_to_end(key)
+        while len(_decisions) > ACCESS_CACHE_SIZE:
+            _decisions.popitem(last=False)
+
+
+def _visible_to(hospital_id):
+    """Patient filter: the hospital's own patients and those with an active grant"""
+    granted = db.session.query(PatientAccess.patient_id).filter(
+        PatientAccess.patient_id == Patient.patient_id,
+        PatientAccess.hospital_id == hospital_id,
+        PatientAccess.is_active.is_(True)
+    ).exists()
+    return or_(Patient.hospital_id == hospital_id, granted)
+
+
+def visible_patients(hospital_id):
+    """
+    Every patient the hospital may see, for list views. The listed ids are
+    stored as allowed, so opening one of them is a cache hit.
+    """
+    patients = Patient.query.filter(_visible_to(hospital_id)).all()
+    _store({_key(hospital_id, patient.patient_id): True for patient in patients})
+    return patients
+
+
+def accessible_patients(hospital_id, patient_ids):
+    """
+    Batched check for list views: returns the subset of patient_ids the
+    hospital may see (its own patients, plus those with an active
+    PatientAccess grant). Uncached ids are resolved in one query.
+    """
+    patient_ids = {str(patient_id) for patient_id in patient_ids}
+    cached = _cached([_key(hospital_id, patient_id) for patient_id in patient_ids])
+    allowed = {key[1] for key, value in cached.items() if value}
+
+    missing = [patient_id for patient_id in patient_ids if _key(hospital_id, patient_id) not in cached]
+    if missing:
+        rows = db.session.query(Patient.patient_id).filter(
+            Patient.patient_id.in_(missing),
+            _visible_to(hospital_id)
+        ).all()
+        found = {str(patient_id) for (patient_id,) in rows}
+        _store({_key(hospital_id, patient_id): patient_id in found for patient_id in missing})
+        allowed |= found
+
+    return allowed
+
+
+def can_access(hospital_id, patient_id):
+    """Can this hospital see this patient's records?"""
+    return str(patient_id) in accessible_patients(hospital_id, [patient_id])
+
+
+def invalidate_access(hospital_id=None, patient_id=None):
+    """
+    Drops cached decisions for one (hospital, patient) pair, for every
+    pair involving the given patient or hospital, or all of them.
+    """
+    with _decisions_lock:
+        if hospital_id is not None and patient_id is not None:
+            _decisions.pop(_key(hospital_id, patient_id), None)
+            return
+        if hospital_id is None and patient_id is None:
+            _decisions.clear()
+            return
+        index = 0 if hospital_id is not None else 1
+        value = str(hospital_id if hospital_id is not None else patient_id)
+        for key in [k for k in _decisions if k[index] == value]:
+            del _decisions[key]
+
+
+@event.listens_for(PatientAccess, "after_insert")
+@event.listens_for(PatientAccess, "after_delete")
+def _access_changed(mapper, connection, target):
+    invalidate_access(target.hospital_id, target.patient_id)
+
+
+@event.listens_for(PatientAccess, "after_update")
+@event.listens_for(Patient, "after_update")
+@event.listens_for(Patient, "after_delete")
+def _patient_changed(mapper, connection, target):
+    # The grant's or patient's hospital may have changed
+    invalidate_access(patient_id=target.patient_id)
@@ -0,0 +1,277 @@
+# app/services/bulk_transfer_service.py
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+
+from app import db
+from app.models.data_transfer import DataTransfer
+from app.models.department import Department
+from app.models.hospital import Hospital
+from app.models.patient import Patient
+from app.models.patient_access import PatientAccess
+from app.models.transfer_leaf_hash import TransferLeafHash
+from app.models.treatment_session import TreatmentSession
+from app.services.access_service import invalidate_access
+from app.services.checksum_service import leaf_hash, merkle_root
+from app.services.transfer_service import (
+    PAYLOAD_BATCH_SIZE, cache_session_leaves, hash_session_records, leaf_rows, missing_session_records,
+    patient_header, reusable_leaves, transfer_timestamp, verify_transfer_checksum
+)
+
+# Most transfers accepted in one bulk request
+BULK_TRANSFER_LIMIT = 1000
+
+# Below this many sessions the hashing runs in the request process
+BULK_PARALLEL_MIN_SESSIONS = 20000
+
+# Spawned, not forked: the web process's threads may hold locks a fork would copy
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def patient_leaves(patient_ids, known=None):
+    """
+    {patient_id: [(session_id, leaf hash, row_version)]} for many patients.
+    One id/version scan covers every patient; only sessions whose version
+    is neither in `known` nor cached (see reusable_leaves) are fetched and
+    hashed, in a process pool when there are many (TRANSFER_CHECKSUM_WORKERS).
+    Fresh hashes are put in the leaf cache.
+    """
+    order = defaultdict(list)
+    for patient_id, session_id, version in db.session.query(
+        TreatmentSession.patient_id, TreatmentSession.session_id, TreatmentSession.row_version
+    ).filter(
+        TreatmentSession.patient_id.in_(list(patient_ids))
+    ).order_by(
+        TreatmentSession.created_at, TreatmentSession.session_id
+    ).yield_per(PAYLOAD_BATCH_SIZE):
+        order[patient_id].append((session_id, version))
+
+    versions = [pair for pairs in order.values() for pair in pairs]
+    reused = reusable_leaves(versions, known)
+    missing = [session_id for session_id, _ in versions if session_id not in reused]
+
+    if missing:
+        records = list(missing_session_records(missing))
+        workers = current_app.config.get("TRANSFER_CHECKSUM_WORKERS", 1)
+        if workers > 1 and len(records) >= BULK_PARALLEL_MIN_SESSIONS:
+            size = -(-len(records) // (workers * 2))
+            batches = [records[i:i + size] for i in range(0, len(records), size)]
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_MP_CONTEXT) as pool:
+                hashed = [leaf for result in pool.map(hash_session_records, batches) for leaf in result]
+        else:
+            hashed = hash_session_records(records)
+        reused.update((session_id, (digest, version)) for session_id, digest, version in hashed)
+        cache_session_leaves(hashed)
+
+    return {
+        patient_id: [
+            (session_id,) + reused[session_id]
+            for session_id, _ in order.get(patient_id, []) if session_id in reused
+        ]
+        for patient_id in patient_ids
+    }
+
+
+def initiate_transfers(transfer_requests, source_hospital_id, initiated_by):
+    """
+    Creates many pending transfers in one transaction.
+
+    Each request is {"patient_id", "department_id", "target_hospital_id"}.
+    Returns one result per request, in order:
+    {"patient_id", "status": "pending" | "error", "transfer_id" | "error"}.
+    """
+    patient_ids = {str(r.get("patient_id")) for r in transfer_requests}
+    patients = {p.patient_id: p for p in Patient.query.filter(Patient.patient_id.in_(patient_ids))}
+    department_hospitals = {d: str(h) for d, h in db.session.query(
+        Department.department_id, Department.hospital_id
+    ).filter(
+        Department.department_id.in_({_as_int(r.get("department_id")) for r in transfer_requests})
+    )}
+    hospital_ids = {str(h) for (h,) in db.session.query(Hospital.hospital_id).filter(
+        Hospital.hospital_id.in_({str(r.get("target_hospital_id")) for r in transfer_requests})
+    )}
+    pending = {p for (p,) in db.session.query(DataTransfer.patient_id).filter(
+        DataTransfer.patient_id.in_(patient_ids),
+        DataTransfer.transfer_status == "pending"
+    )}
+
+    results = []
+    accepted = []
+    seen = set()
+    for r in transfer_requests:
+        patient_id = str(r.get("patient_id"))
+        department_id = _as_int(r.get("department_id"))
+        target = str(r.get("target_hospital_id"))
+        patient = patients.get(patient_id)
+
+        error = None
+        if patient is None:
+            error = "Patient not found"
+        elif str(patient.hospital_id) != str(source_hospital_id):
+            error = "Patient belongs to another hospital"
+        elif patient_id in seen:
+            error = "Duplicate patient in batch"
+        elif patient_id in pending:
+            error = "Transfer already pending"
+        elif department_id not in department_hospitals:
+            error = "Department not found"
+        elif target not in hospital_ids:
+            error = "Target hospital not found"
+        elif department_hospitals[department_id] != target:
+            error = "Department belongs to another hospital"
+        elif target == str(patient.hospital_id):
+            error = "Target is the patient's current hospital"
+
+        result = {"patient_id": patient_id}
+        if error:
+            result.update(status="error", error=error)
+        else:
+            seen.add(patient_id)
+            accepted.append((result, patient, department_id, target))
+        results.append(result)
+
+    if not accepted:
+        return results
+
+    # One timestamp for the batch, from the same clock as single transfers
+    transferred_at = transfer_timestamp()
+    leaves = patient_leaves([patient.patient_id for _, patient, _, _ in accepted])
+
+    transfer_rows = []
+    headers = []
+    for _, patient, department_id, target in accepted:
+        header = leaf_hash(patient_header(patient, department_id, transferred_at))
+        session_hashes = leaves[patient.patient_id]
+        headers.append(header)
+        transfer_rows.append({
+            "patient_id": patient.patient_id,
+            "source_hospital": patient.hospital_id,
+            "target_hospital": int(target),
+            "department_id": department_id,
+            "initiated_by_staff": initiated_by,
+            "transfer_status": "pending",
+            "transferred_at": transferred_at,
+            "checksum_original": merkle_root([header] + [digest for _, digest, _ in session_hashes])
+        })
+
+    try:
+        db.session.bulk_insert_mappings(DataTransfer, transfer_rows, return_defaults=True)
+        leaf_mappings = []
+        for row, header, (_, patient, _, _) in zip(transfer_rows, headers, accepted):
+            leaf_mappings.extend(leaf_rows(row["transfer_id"], header, leaves[patient.patient_id]))
+        db.session.bulk_insert_mappings(TransferLeafHash, leaf_mappings)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Bulk transfer initiation failed: {e}")
+        for result, _, _, _ in accepted:
+            result.update(status="error", error="Database error")
+        return results
+
+    for row, (result, _, _, _) in zip(transfer_rows, accepted):
+        result.update(status="pending", transfer_id=row["transfer_id"])
+    return results
+
+
+def accept_transfers(transfer_ids, hospital_id):
+    """
+    Verifies and accepts many incoming transfers in one transaction.
+    Verified transfers get PatientAccess rows; mismatches are marked failed.
+    Returns one result per id: {"transfer_id", "status", ...}.
+    """
+    transfer_ids = [_as_int(t) for t in transfer_ids]
+    transfers = {
+        t.transfer_id: t for t in DataTransfer.query.filter(DataTransfer.transfer_id.in_(transfer_ids))
+    }
+    patients = {p.patient_id: p for p in Patient.query.filter(
+        Patient.patient_id.in_({t.patient_id for t in transfers.values()})
+    )}
+
+    results = []
+    to_check = []
+    for transfer_id in transfer_ids:
+        transfer = transfers.get(transfer_id)
+        result = {"transfer_id": transfer_id}
+        if transfer is None:
+            result.update(status="error", error="Transfer not found")
+        elif str(transfer.target_hospital) != str(hospital_id):
+            result.update(status="error", error="Transfer is addressed to another hospital")
+        elif transfer.transfer_status != "pending":
+            result.update(status="error", error=f"Transfer is {transfer.transfer_status}")
+        else:
+            to_check.append((result, transfer))
+        results.append(result)
+
+    if not to_check:
+        return results
+
+    # Sessions unchanged since initiation (same row_version) reuse their stored leaves
+    known = {
+        session_id: (digest, version)
+        for session_id, digest, version in db.session.query(
+            TransferLeafHash.session_id, TransferLeafHash.leaf_hash, TransferLeafHash.session_version
+        ).filter(
+            TransferLeafHash.transfer_id.in_([transfer.transfer_id for _, transfer in to_check]),
+            TransferLeafHash.session_id.isnot(None)
+        )
+    }
+    leaves = patient_leaves({transfer.patient_id for _, transfer in to_check}, known)
+
+    updates = []
+    accesses = []
+    for result, transfer in to_check:
+        header = leaf_hash(patient_header(
+            patients[transfer.patient_id], transfer.department_id, transfer.transferred_at
+        ))
+        root = merkle_root([header] + [digest for _, digest, _ in leaves[transfer.patient_id]])
+
+        matches = root == transfer.checksum_original
+        if not matches:
+            # Legacy (flat) checksums and pinpointing go through the single-transfer path
+            matches, root, diverged = verify_transfer_checksum(transfer)
+            if diverged:
+                result["diverged"] = diverged
+
+        status = "verified" if matches else "failed"
+        if matches:
+            accesses.append({
+                "patient_id": transfer.patient_id,
+                "hospital_id": transfer.target_hospital,
+                "access_reason": f"Transfer approved for department {transfer.department_id}",
+                "transfer_id": transfer.transfer_id,
+                "access_granted_at": datetime.utcnow(),
+                "is_active": True
+            })
+
+        updates.append({
+            "transfer_id": transfer.transfer_id,
+            "transfer_status": status,
+            "checksum_verified": root
+        })
+        result["status"] = status
+
+    try:
+        db.session.bulk_update_mappings(DataTransfer, updates)
+        db.session.bulk_insert_mappings(PatientAccess, accesses)
+        db.session.commit()
+        # Bulk inserts skip mapper events, so drop cached denials here
+        for access in accesses:
+            invalidate_access(access["hospital_id"], access["patient_id"])
+    except Exception as e:
+        db.session.rollback()
+        print(f"Bulk transfer acceptance failed: {e}")
+        for result, _ in to_check:
+            result.pop("diverged", None)
+            result.update(status="error", error="Database error")
+
+    return results
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
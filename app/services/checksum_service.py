@@ -1,9 +1,114 @@
 import hashlib
 import json
+from collections.abc import Iterator
+
+# Bytes buffered before each update of the running hash
+CHECKSUM_CHUNK_SIZE = 64 * 1024
+
+
+def _encode(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def iter_canonical(payload):
+    """
+    Yields the canonical JSON of `payload` piece by piece. Iterators inside
+    the payload (e.g. a generator of session records) are written as JSON
+    arrays without being materialized. The concatenated output is identical
+    to json.dumps(payload, sort_keys=True, default=str).
+    """
+    if isinstance(payload, dict):
+        yield "{"
+        for i, key in enumerate(sorted(payload)):
+            if i:
+                yield ", "
+            yield _encode(key) + ": "
+            yield from iter_canonical(payload[key])
+        yield "}"
+    elif isinstance(payload, Iterator):
+        yield "["
+        for i, item in enumerate(payload):
+            yield (", " if i else "") + _encode(item)
+        yield "]"
+    else:
+        yield _encode(payload)
+
+
+def checksum_chunks(chunks) -> str:
+    """SHA-256 over a stream of text chunks, hashed in bounded buffers"""
+    digest = hashlib.sha256()
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= CHECKSUM_CHUNK_SIZE:
+            digest.update("".join(buffer).encode("utf-8"))
+            buffer = []
+            size = 0
+    if buffer:
+        digest.update("".join(buffer).encode("utf-8"))
+    return digest.hexdigest()
+
 
 def generate_checksum(payload: dict) -> str:
     """
-    Generates a SHA-256 checksum from structured patient data
+    Generates a SHA-256 checksum from structured patient data.
+    The payload is streamed into the hash, so lazily built sections
+    are never held in memory as a whole.
+    """
+    return checksum_chunks(iter_canonical(payload))
+
+
+# -----------------------
+# Merkle checksums
+# -----------------------
+
+def leaf_hash(record) -> str:
+    """SHA-256 of one record's canonical JSON"""
+    return hashlib.sha256(_encode(record).encode("utf-8")).hexdigest()
+
+
+# Domain separation (as in RFC 6962): a leaf can never hash like an inner node
+MERKLE_LEAF_PREFIX = b"\x00"
+MERKLE_NODE_PREFIX = b"\x01"
+
+
+def merkle_root(leaves) -> str:
+    """
+    Root of a binary Merkle tree over hex leaf hashes, in order. Leaves are
+    hashed with a 0x00 prefix and inner nodes with 0x01, so no list of leaves
+    can reproduce the root of a different list. An odd node at the end of a
+    level is promoted, which the prefixes keep unambiguous.
+    """
+    level = [hashlib.sha256(MERKLE_LEAF_PREFIX + bytes.fromhex(leaf)).digest() for leaf in leaves]
+    if not level:
+        return hashlib.sha256(b"").hexdigest()
+    while len(level) > 1:
+        parents = [
+            hashlib.sha256(MERKLE_NODE_PREFIX + level[i] + level[i + 1]).digest()
+            for i in range(0, len(level) - 1, 2)
+        ]
+        if len(level) % 2:
+            parents.append(level[-1])
+        level = parents
+    return level[0].hex()
+
+
+def legacy_merkle_root(leaves) -> str:
+    """
+    Root as computed before domain separation (hex strings concatenated,
+    no prefixes). Only used to verify transfers initiated with it.
     """
-    canonical = json.dumps(payload, sort_keys=True, default=str)
-    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    level = list(leaves)
+    if not level:
+        return hashlib.sha256(b"").hexdigest()
+    while len(level) > 1:
+        parents = [
+            hashlib.sha256((level[i] + level[i + 1]).encode("ascii")).hexdigest()
+            for i in range(0, len(level) - 1, 2)
+        ]
+        if len(level) % 2:
+            parents.append(level[-1])
+        level = parents
+    return level[0]
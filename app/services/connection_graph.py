@@ -0,0 +1,134 @@
+# app/services/connection_graph.py
+import threading
+import time
+
+from app.models.hospital_connection import HospitalConnection
+
+# Safety net for edits made by other processes; local edits apply immediately
+GRAPH_CACHE_TTL = 300
+
+
+def _edge(connection):
+    return {
+        "to": connection.hospital_to,
+        "cost": connection.transfer_cost,
+        "latency": connection.latency_minutes,
+        "reliability": connection.reliability
+    }
+
+
+class ConnectionGraph:
+    """
+    In-memory hospital connection graph.
+    `adjacency` maps hospital -> outgoing edge list (the shape build_graph
+    always returned); `edges` gives O(1) lookup by (from, to).
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.adjacency = {}
+        self.edges = {}
+
+    @staticmethod
+    def key(hospital_from, hospital_to):
+        # hospitals.hospital_id is a string column while connection ends are
+        # integers, so edges are keyed on the string form of both ids
+        return (str(hospital_from), str(hospital_to))
+
+    def add(self, hospital_from, edge):
+        self.remove(hospital_from, edge["to"])
+        self.adjacency.setdefault(hospital_from, []).append(edge)
+        self.edges[self.key(hospital_from, edge["to"])] = (hospital_from, edge)
+
+    def remove(self, hospital_from, hospital_to):
+        entry = self.edges.pop(self.key(hospital_from, hospital_to), None)
+        if entry is not None:
+            source, edge = entry
+            self.adjacency[source].remove(edge)
+
+    def copy(self, version):
+        """A graph with the same edges that can be edited without touching this one"""
+        graph = ConnectionGraph(version)
+        graph.loaded_at = self.loaded_at
+        graph.adjacency = {hospital: list(edges) for hospital, edges in self.adjacency.items()}
+        graph.edges = dict(self.edges)
+        return graph
+
+    def edge(self, hospital_from, hospital_to):
+        entry = self.edges.get(self.key(hospital_from, hospital_to))
+        return entry[1] if entry else None
+
+
+_graph = None
+_version = 0
+_lock = threading.Lock()
+
+
+def graph_version():
+    return _version
+
+
+def _load(version):
+    graph = ConnectionGraph(version)
+    for connection in HospitalConnection.query.all():
+        graph.add(connection.hospital_from, _edge(connection))
+    return graph
+
+
+def get_connection_graph():
+    """Returns the cached graph, reloading it only when missing or stale"""
+    global _graph
+    with _lock:
+        graph = _graph
+        if graph is not None and time.monotonic() - graph.loaded_at < GRAPH_CACHE_TTL:
+            return graph
+        version = _version
+
+    graph = _load(version)
+    with _lock:
+        # A concurrent edit bumped the version mid-load; keep the newer graph
+        if version == _version:
+            _graph = graph
+        return _graph or graph
+
+
+def _apply(change):
+    """
+    Applies an edit to a copy of the cached graph (if loaded), swaps it in
+    and bumps the version. Readers iterate graphs without the lock, so a
+    published graph is never modified.
+    """
+    global _graph, _version
+    with _lock:
+        _version += 1
+        if _graph is not None:
+            graph = _graph.copy(_version)
+            change(graph)
+            _graph = graph
+
+
+def connections_added(*connections):
+    """Call after committing new HospitalConnection rows"""
+    edges = [(connection.hospital_from, _edge(connection)) for connection in connections]
+
+    def change(graph):
+        for hospital_from, edge in edges:
+            graph.add(hospital_from, edge)
+    _apply(change)
+
+
+def connections_deleted(*pairs):
+    """Call after committing HospitalConnection deletions, with (from, to) pairs"""
+    def change(graph):
+        for hospital_from, hospital_to in pairs:
+            graph.remove(hospital_from, hospital_to)
+    _apply(change)
+
+
+def invalidate_connection_graph():
+    """Forces the next read to reload the graph from the database"""
+    global _graph, _version
+    with _lock:
+        _version += 1
+        _graph = None
@@ -0,0 +1,230 @@
+# app/services/demand_model_service.py
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from flask import current_app
+
+from app import db
+from app.models.device_usage_rollup import DeviceUsageRollup
+from app.services.rollup_service import ensure_rollups
+
+# History used for fitting; a year covers every calendar month once
+DEMAND_FIT_WINDOW_DAYS = 365
+
+# Fewer full months than this: dispersion comes from daily counts instead
+MIN_FIT_MONTHS = 3
+
+# Dispersion reported when counts are no more variable than Poisson
+MAX_DISPERSION = 1000.0
+MIN_DISPERSION = 0.5
+
+DAYS_PER_MONTH = 365.25 / 12
+
+_fits = {}
+_fits_lock = threading.Lock()
+
+
+def _refresh_seconds():
+    return current_app.config.get("DEMAND_FIT_REFRESH_SECONDS", 21600)
+
+
+def load_daily_counts(hospital_id, since, until):
+    """
+    Bulk-loads per-device daily session counts as a dense (days x devices)
+    array from the daily usage rollup (one query over O(days x devices)
+    rows; days without sessions are zero). Returns (device_ids, dates, counts).
+    """
+    ensure_rollups(hospital_id)
+    rows = db.session.query(
+        DeviceUsageRollup.device_id,
+        DeviceUsageRollup.usage_date,
+        DeviceUsageRollup.session_count
+    ).filter(
+        DeviceUsageRollup.hospital_id == hospital_id,
+        DeviceUsageRollup.device_id.isnot(None),
+        DeviceUsageRollup.usage_date >= since,
+        DeviceUsageRollup.usage_date <= until
+    ).all()
+
+    if not rows:
+        return [], [], np.zeros((0, 0))
+
+    device_ids = sorted({row[0] for row in rows})
+    column = {device_id: j for j, device_id in enumerate(device_ids)}
+
+    # History starts at the first recorded day, not at the window edge
+    first = min(row[1] for row in rows)
+    days = (until - first).days + 1
+    counts = np.zeros((days, len(device_ids)))
+    for device_id, usage_date, session_count in rows:
+        counts[(usage_date - first).days, column[device_id]] += session_count
+
+    dates = [first + timedelta(days=i) for i in range(days)]
+    return device_ids, dates, counts
+
+
+def moment_dispersion(mean, variance):
+    """
+    Method-of-moments negative-binomial dispersion k from var = mu + mu^2 / k,
+    vectorized. Counts no more variable than Poisson get MAX_DISPERSION.
+    """
+    mean = np.asarray(mean, dtype=float)
+    excess = np.asarray(variance, dtype=float) - mean
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = np.where(excess > 0, mean ** 2 / excess, MAX_DISPERSION)
+    return np.clip(np.nan_to_num(k, nan=MAX_DISPERSION), MIN_DISPERSION, MAX_DISPERSION)
+
+
+def fit_counts(dates, counts):
+    """
+    Fits per-device monthly demand from a (days x devices) count array.
+
+    Seasonality is pooled over the hospital's devices: monthly factors are
+    the mean daily total per calendar month over the overall daily mean
+    (1.0 for months without data). Per-device monthly means and
+    dispersions come from full calendar months after removing the
+    monthly factor, or from daily counts scaled to a month when there
+    are fewer than MIN_FIT_MONTHS full months.
+    """
+    days, n_devices = counts.shape
+    month_of_year = np.array([d.month for d in dates])
+    month_key = np.array([d.year * 12 + d.month - 1 for d in dates])
+
+    daily_total = counts.sum(axis=1)
+    overall = daily_total.mean() if days else 0.0
+
+    monthly_factors = np.ones(12)
+    if overall > 0:
+        for m in range(1, 13):
+            if (month_of_year == m).any():
+                monthly_factors[m - 1] = daily_total[month_of_year == m].mean() / overall
+        # Factors over the months actually seen average to 1
+        seen = np.unique(month_of_year) - 1
+        monthly_factors[seen] /= monthly_factors[seen].mean()
+
+    # Full calendar months only; partial months at either end are dropped
+    keys, starts, lengths = np.unique(month_key, return_index=True, return_counts=True)
+    full = [
+        (key, start, length) for key, start, length in zip(keys, starts, lengths)
+        if length == _month_length(key)
+    ]
+
+    if len(full) >= MIN_FIT_MONTHS:
+        monthly = np.array([counts[start:start + length].sum(axis=0) for _, start, length in full])
+        factors = np.array([monthly_factors[key % 12] for key, _, _ in full])
+        monthly = monthly / factors[:, None]
+        mean = monthly.mean(axis=0)
+        dispersion = moment_dispersion(mean, monthly.var(axis=0, ddof=1))
+        basis = "monthly"
+    else:
+        daily_mean = counts.mean(axis=0)
+        daily_k = moment_dispersion(daily_mean, counts.var(axis=0, ddof=1) if days > 1 else daily_mean)
+        # A month is a sum of ~30 independent days: same p, dispersion scales with the day count
+        mean = daily_mean * DAYS_PER_MONTH
+        dispersion = np.clip(daily_k * DAYS_PER_MONTH, MIN_DISPERSION, MAX_DISPERSION)
+        basis = "daily"
+
+    return {
+        "mean": mean,
+        "dispersion": dispersion,
+        "daily_mean": counts.mean(axis=0) if days else np.zeros(n_devices),
+        "monthly_factors": monthly_factors,
+        "months": len(full),
+        "basis": basis
+    }
+
+
+def _month_length(key):
+    year, month = divmod(int(key), 12)
+    start = date(year, month + 1, 1)
+    following = date(year + (month + 1) // 12, (month + 1) % 12 + 1, 1)
+    return (following - start).days
+
+
+def fit_demand_model(hospital_id, days=DEMAND_FIT_WINDOW_DAYS, until=None):
+    """
+    Fits the hospital's demand model from its session history. Returns a
+    JSON-ready dict:
+      devices: {device_id: {mean, dispersion, daily_mean}} (monthly figures)
+      monthly_factors: January first
+    Devices without sessions in the window are absent.
+    """
+    until = until or (datetime.utcnow().date() - timedelta(days=1))
+    since = until - timedelta(days=days - 1)
+    device_ids, dates, counts = load_daily_counts(hospital_id, since, until)
+
+    model = {
+        "hospital_id": hospital_id,
+        "fitted_at": datetime.utcnow().isoformat(),
+        "window_start": dates[0].isoformat() if dates else None,
+        "window_end": until.isoformat(),
+        "days": len(dates),
+        "devices": {},
+        "monthly_factors": [1.0] * 12,
+        "months": 0,
+        "basis": None
+    }
+    if not device_ids:
+        return model
+
+    fit = fit_counts(dates, counts)
+    model.update({
+        "devices": {
+            device_id: {
+                "mean": float(fit["mean"][j]),
+                "dispersion": float(fit["dispersion"][j]),
+                "daily_mean": float(fit["daily_mean"][j])
+            }
+            for j, device_id in enumerate(device_ids)
+        },
+        "monthly_factors": [float(v) for v in fit["monthly_factors"]],
+        "months": fit["months"],
+        "basis": fit["basis"]
+    })
+    return model
+
+
+def get_demand_model(hospital_id, refresh=False):
+    """
+    Cached fit for a hospital. Fits are refreshed once they are older than
+    DEMAND_FIT_REFRESH_SECONDS (or on demand); new sessions do not trigger a
+    refit, since a day's sessions barely move a year-long fit.
+    """
+    key = str(hospital_id)
+    now = time.monotonic()
+    if not refresh:
+        with _fits_lock:
+            entry = _fits.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+    model = fit_demand_model(hospital_id)
+    with _fits_lock:
+        _fits[key] = (now + _refresh_seconds(), model)
+    return model
+
+
+def invalidate_demand_model(hospital_id=None):
+    """Drops the cached fit for one hospital, or for all hospitals"""
+    with _fits_lock:
+        if hospital_id is None:
+            _fits.clear()
+        else:
+            _fits.pop(str(hospital_id), None)
+
+
+def fitted_parameters(model, device_ids):
+    """
+    The per-device slice of a fit stored with a simulation's parameters,
+    so the run (and its replays) keep the numbers it started from.
+    """
+    return {
+        device_id: {
+            "mean": model["devices"][device_id]["mean"],
+            "dispersion": model["devices"][device_id]["dispersion"]
+        }
+        for device_id in device_ids
+        if device_id in model["devices"]
+    }
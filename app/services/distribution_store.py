@@ -0,0 +1,173 @@
+# app/services/distribution_store.py
+import hashlib
+import os
+import tempfile
+import time
+
+import numpy as np
+from flask import current_app
+
+DISTRIBUTION_DIRNAME = "simulation_distributions"
+
+# Unreferenced files younger than this are kept: a running job writes its
+# file before the Simulation row that references it is committed
+GC_GRACE_SECONDS = 3600
+
+HISTOGRAM_BINS = 30
+MAX_HISTOGRAM_BINS = 200
+
+
+def _store_dir():
+    return current_app.config.get("SIMULATION_DISTRIBUTION_DIR") or os.path.join(
+        current_app.instance_path, DISTRIBUTION_DIRNAME
+    )
+
+
+def _path(key):
+    return os.path.join(_store_dir(), key[:2], f"{key}.npy")
+
+
+def compact_counts(treatments):
+    """Smallest unsigned dtype that holds every treatment count"""
+    peak = int(treatments.max()) if treatments.size else 0
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if peak <= np.iinfo(dtype).max:
+            return treatments.astype(dtype, copy=False)
+    return treatments.astype(np.uint64, copy=False)
+
+
+def store_distribution(treatments):
+    """
+    Writes a (devices x runs) treatment count matrix as a .npy file under
+    a content-addressed path and returns its key (SHA-256 of the file).
+    Identical draws (e.g. a replayed seed) share one file.
+    """
+    counts = np.ascontiguousarray(compact_counts(np.asarray(treatments)))
+
+    digest = hashlib.sha256()
+    digest.update(f"{counts.dtype.str}{counts.shape}".encode("ascii"))
+    digest.update(counts.data)
+    key = digest.hexdigest()
+
+    path = _path(key)
+    if os.path.exists(path):
+        return key
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, counts)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return key
+
+
+def load_distribution(key):
+    """Memory-mapped (devices x runs) count matrix, or None if it is missing"""
+    if not key or len(key) != 64:
+        return None
+    try:
+        return np.load(_path(key), mmap_mode="r")
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def release_distribution(key):
+    """
+    Deletes a distribution file once no simulation references it (files
+    are shared by identical runs). Call after the deleting commit.
+    """
+    from app.models.simulations import Simulation
+
+    if not key or len(key) != 64:
+        return False
+    if Simulation.query.filter_by(distribution_key=key).first() is not None:
+        return False
+    try:
+        os.remove(_path(key))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def collect_garbage(grace_seconds=GC_GRACE_SECONDS, dry_run=False):
+    """
+    Deletes distribution files (and leftover .tmp files) that no
+    Simulation.distribution_key references, e.g. after rows were removed
+    outside delete_simulation. Returns (removed, bytes freed).
+    """
+    from app.models.simulations import Simulation
+    from app import db
+
+    store = _store_dir()
+    if not os.path.isdir(store):
+        return 0, 0
+
+    referenced = {
+        key for (key,) in db.session.query(Simulation.distribution_key)
+        .filter(Simulation.distribution_key.isnot(None)).distinct()
+    }
+    cutoff = time.time() - grace_seconds
+
+    removed = freed = 0
+    for prefix in os.listdir(store):
+        folder = os.path.join(store, prefix)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            key, ext = os.path.splitext(name)
+            if ext not in (".npy", ".tmp") or (ext == ".npy" and key in referenced):
+                continue
+            path = os.path.join(folder, name)
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime > cutoff:
+                    continue
+                if not dry_run:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += stat.st_size
+        if not dry_run and not os.listdir(folder):
+            os.rmdir(folder)
+    return removed, freed
+
+
+def profit_samples(counts, meta, device_index=None):
+    """
+    Per-run profits for one device row, or the hospital total across all
+    devices when device_index is None. `meta` holds the unit_margins and
+    fixed_costs stored with the simulation.
+    """
+    margins = np.asarray(meta["unit_margins"], dtype=float)
+    fixed = np.asarray(meta["fixed_costs"], dtype=float)
+    if device_index is not None:
+        return counts[device_index] * margins[device_index] - fixed[device_index]
+    return margins @ counts - fixed.sum()
+
+
+def distribution_stats(profits, bins=HISTOGRAM_BINS, percentiles=(5, 50, 95), var_level=0.95):
+    """Histogram, percentiles and value-at-risk (as a positive loss) of a profit sample"""
+    bins = max(1, min(int(bins), MAX_HISTOGRAM_BINS))
+    counts, edges = np.histogram(profits, bins=bins)
+
+    cutoff = np.percentile(profits, (1 - var_level) * 100)
+    tail = profits[profits <= cutoff]
+
+    return {
+        "runs": int(profits.size),
+        "mean": float(profits.mean()),
+        "std": float(profits.std()),
+        "histogram": {"counts": counts.tolist(), "edges": edges.tolist()},
+        "percentiles": {
+            str(p): float(v) for p, v in zip(percentiles, np.percentile(profits, percentiles))
+        },
+        "var_level": var_level,
+        "value_at_risk": float(-cutoff),
+        "conditional_value_at_risk": float(-tail.mean()) if tail.size else float(-cutoff)
+    }
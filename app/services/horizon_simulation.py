@@ -0,0 +1,249 @@
+# app/services/horizon_simulation.py
+import numpy as np
+
+from app.services.simulation_rng import SimulationStreams
+
+HORIZON_DEFAULT_MONTHS = 12
+HORIZON_MAX_MONTHS = 36
+
+# Runs drawn at a time; memory is O(chunk x (devices + months)), independent of total runs
+HORIZON_CHUNK_RUNS = 2000
+
+# Items kept per sketch level; rank error is roughly 1 / capacity
+SKETCH_CAPACITY = 512
+
+HORIZON_PERCENTILES = (5, 50, 95)
+
+
+class RunningStats:
+    """
+    Welford mean/variance over batches of samples along axis 0, for
+    arrays of any trailing shape. Batches are merged with Chan's update,
+    so the result matches a single pass over all samples.
+    """
+
+    def __init__(self, shape=()):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self._m2 = np.zeros(shape)
+
+    def update(self, batch):
+        batch = np.asarray(batch, dtype=float)
+        n = batch.shape[0]
+        if n == 0:
+            return
+        batch_mean = batch.mean(axis=0)
+        batch_m2 = ((batch - batch_mean) ** 2).sum(axis=0)
+
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * (n / total)
+        self._m2 = self._m2 + batch_m2 + delta ** 2 * (self.count * n / total)
+        self.count = total
+
+    @property
+    def variance(self):
+        return self._m2 / self.count if self.count else np.zeros_like(self._m2)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+class QuantileSketch:
+    """
+    Streaming quantile sketch (hierarchical compactors, as in
+    KLL). Level h holds items of weight 2**h; a full level is sorted and
+    every other item is promoted, alternating the offset so the estimate
+    stays unbiased and deterministic. Memory is O(capacity * log(n)).
+    """
+
+    def __init__(self, capacity=SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.levels = [np.empty(0)]
+        self._offsets = [0]
+        self.count = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        self.count += values.size
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compact()
+
+    def _compact(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if level.size <= self.capacity:
+                h += 1
+                continue
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+                self._offsets.append(0)
+
+            level = np.sort(level)
+            # An odd item out stays behind so the promoted pairs are exact
+            keep = level[-1:] if level.size % 2 else level[:0]
+            pairs = level[:level.size - keep.size]
+            promoted = pairs[self._offsets[h]::2]
+            self._offsets[h] ^= 1
+
+            self.levels[h] = keep
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def quantiles(self, percentiles):
+        if self.count == 0:
+            return np.full(len(percentiles), np.nan)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(level.size, 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values)
+        values, cumulative = values[order], np.cumsum(weights[order])
+        targets = np.asarray(percentiles, dtype=float) / 100 * cumulative[-1]
+        index = np.minimum(np.searchsorted(cumulative, targets, side="left"), values.size - 1)
+        return values[index]
+
+
+def month_labels(start, months):
+    """'YYYY-MM' labels for a horizon starting at a date"""
+    labels = []
+    year, month = start.year, start.month
+    for _ in range(months):
+        labels.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return labels
+
+
+def seasonality_curve(values, start_month, months):
+    """
+    Per-month demand factors for the horizon. `values` is a list of 12
+    calendar-month factors (January first) that repeats every year, or
+    one factor per horizon month; a scalar applies to every month.
+    """
+    if values is None:
+        return np.ones(months)
+    if np.isscalar(values):
+        return np.full(months, float(values))
+
+    values = np.asarray(values, dtype=float)
+    if values.size == 12:
+        return values[(np.arange(months) + start_month - 1) % 12]
+    if values.size >= months:
+        return values[:months]
+    raise ValueError(f"Seasonality curve needs 12 calendar-month values or one per month ({months}), got {values.size}")
+
+
+def schedule_matrix(schedule, device_ids, months, default, carry_forward=False):
+    """
+    (months x devices) matrix from {device_id: {month_index: value}}.
+    Month indexes start at 1; `default` is a scalar or one value per device.
+    With carry_forward a value holds until the next scheduled change (price
+    changes); otherwise it applies to that month only (maintenance windows).
+    Raises ValueError for a schedule that is not shaped like that.
+    """
+    schedule = schedule or {}
+    if not isinstance(schedule, dict):
+        raise ValueError("Schedule must map device ids to {month: value}")
+
+    matrix = np.full((months, len(device_ids)), np.asarray(default, dtype=float))
+    for j, device_id in enumerate(device_ids):
+        changes = schedule.get(device_id) or schedule.get(str(device_id)) or {}
+        if not isinstance(changes, dict):
+            raise ValueError(f"Schedule for device {device_id} must map months to values")
+        try:
+            changes = sorted((int(m), float(v)) for m, v in changes.items())
+        except (TypeError, ValueError):
+            raise ValueError(f"Schedule for device {device_id} needs whole months and numeric values")
+        for month, value in changes:
+            if not 1 <= month <= months:
+                continue
+            if carry_forward:
+                matrix[month - 1:, j] = value
+            else:
+                matrix[month - 1, j] = value
+    return matrix
+
+
+def simulate_horizon(device_ids, means, prices, variable_costs, fixed_costs, months, runs, seed,
+                     dispersion, seasonality=None, availability=None, price_multipliers=None,
+                     chunk_runs=HORIZON_CHUNK_RUNS, percentiles=HORIZON_PERCENTILES, progress=None):
+    """
+    Month-by-month profit paths for a device portfolio, aggregated on the fly.
+    Arrays are aligned with device_ids; the result holds (months,) hospital
+    series and (months x devices) per-device means.
+
+    `means` are baseline monthly treatments per device and `dispersion`
+    their negative-binomial dispersion (scalar or per device); each month they
+    are scaled by seasonality (months,) and availability (months x devices),
+    and prices by price_multipliers (months x devices). Runs are drawn in
+    chunks from per-chunk seeded streams and folded into Welford statistics
+    and quantile sketches, so memory does not grow with runs or months.
+    `progress(runs_done, runs)` is called after every chunk; an exception
+    it raises (e.g. a cancellation) stops the run.
+    """
+    n_devices = len(device_ids)
+    seasonality = np.ones(months) if seasonality is None else seasonality
+    availability = np.ones((months, n_devices)) if availability is None else availability
+    price_multipliers = np.ones((months, n_devices)) if price_multipliers is None else price_multipliers
+
+    month_means = means[None, :] * seasonality[:, None] * availability
+    unit_margins = prices[None, :] * price_multipliers - variable_costs[None, :]
+    revenue_per_use = prices[None, :] * price_multipliers
+
+    monthly_total = RunningStats((months,))
+    cumulative_total = RunningStats((months,))
+    monthly_sketches = [QuantileSketch() for _ in range(months)]
+    cumulative_sketches = [QuantileSketch() for _ in range(months)]
+
+    # Per-device figures are only reported as means, so plain sums suffice
+    profit_sum = np.zeros((months, n_devices))
+    treatment_sum = np.zeros((months, n_devices))
+    horizon_losses = 0
+    device_losses = np.zeros(n_devices)
+
+    streams = SimulationStreams(seed)
+    for chunk, start in enumerate(range(0, runs, chunk_runs)):
+        size = min(chunk_runs, runs - start)
+        rng = streams.for_horizon(chunk)
+
+        totals = np.empty((size, months))
+        device_cumulative = np.zeros((size, n_devices))
+        for m in range(months):
+            mean = np.maximum(month_means[m], 1e-12)
+            counts = rng.negative_binomial(dispersion, dispersion / (dispersion + mean), size=(size, n_devices))
+            counts[:, month_means[m] <= 0] = 0
+
+            profit = counts * unit_margins[m] - fixed_costs
+            totals[:, m] = profit.sum(axis=1)
+            device_cumulative += profit
+            profit_sum[m] += profit.sum(axis=0)
+            treatment_sum[m] += counts.sum(axis=0)
+
+        cumulatives = np.cumsum(totals, axis=1)
+        monthly_total.update(totals)
+        cumulative_total.update(cumulatives)
+        for m in range(months):
+            monthly_sketches[m].update(totals[:, m])
+            cumulative_sketches[m].update(cumulatives[:, m])
+        horizon_losses += int((cumulatives[:, -1] < 0).sum())
+        device_losses += (device_cumulative < 0).sum(axis=0)
+        if progress is not None:
+            progress(start + size, runs)
+
+    device_treatments = treatment_sum / runs
+    return {
+        'runs': runs,
+        'months': months,
+        'percentiles': percentiles,
+        'monthly_mean': monthly_total.mean,
+        'monthly_std': monthly_total.std,
+        'monthly_percentiles': np.array([sketch.quantiles(percentiles) for sketch in monthly_sketches]),
+        'cumulative_mean': cumulative_total.mean,
+        'cumulative_std': cumulative_total.std,
+        'cumulative_percentiles': np.array([sketch.quantiles(percentiles) for sketch in cumulative_sketches]),
+        'device_profit': profit_sum / runs,
+        'device_treatments': device_treatments,
+        'device_revenue': device_treatments * revenue_per_use,
+        'probability_horizon_loss': horizon_losses / runs,
+        'device_probability_loss': device_losses / runs
+    }
@@ -0,0 +1,80 @@
+# app/services/parallel_simulation.py
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.services.simulation_engine import simulate_device_batch
+
+# Batches per worker; a little oversubscription evens out uneven devices
+BATCHES_PER_WORKER = 2
+
+# Workers start as fresh interpreters: forking the web process (job, heartbeat
+# and index threads) could copy locks held by another thread and deadlock
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def _timed_batch(device_ids, means, unit_margins, fixed_costs, dispersions, runs, seed, keep_samples=False):
+    """Worker entry point: runs one device batch and reports its timing"""
+    started = time.perf_counter()
+    stats = simulate_device_batch(device_ids, means, unit_margins, fixed_costs, dispersions, runs, seed, keep_samples)
+    return os.getpid(), time.perf_counter() - started, stats
+
+
+def _split(task, chunks):
+    """Splits a (device_ids, means, unit_margins, fixed_costs, dispersions) task into device chunks"""
+    bounds = np.array_split(np.arange(len(task[0])), min(chunks, len(task[0])))
+    return [tuple(array[idx] for array in task) for idx in bounds if len(idx)]
+
+
+def _merge(parts):
+    """Concatenates per-chunk statistics back into one per-device result"""
+    merged = {
+        'mean_treatments': np.concatenate([p['mean_treatments'] for p in parts]),
+        'expected_profit': np.concatenate([p['expected_profit'] for p in parts]),
+        'probability_loss': np.concatenate([p['probability_loss'] for p in parts]),
+        'profit_percentiles': np.concatenate([p['profit_percentiles'] for p in parts], axis=1)
+    }
+    if 'treatments' in parts[0]:
+        merged['treatments'] = np.concatenate([p['treatments'] for p in parts])
+    return merged
+
+
+def run_batches(tasks, runs, seed, workers, keep_samples=False):
+    """
+    Fans the device batches of every task (one task per scenario) out over
+    a process pool.
+
+    Every device draws from its own seeded stream, so the split does not
+    change the numbers: results are merged back in task and device order
+    and match a serial run exactly.
+
+    Returns (per-task statistics, per-worker timing breakdown).
+    """
+    chunks_per_task = max(1, (workers * BATCHES_PER_WORKER) // len(tasks))
+    chunked = [_split(task, chunks_per_task) for task in tasks]
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_MP_CONTEXT) as pool:
+        futures = [
+            [pool.submit(_timed_batch, *chunk, runs, seed, keep_samples) for chunk in chunks]
+            for chunks in chunked
+        ]
+
+        timings = {}
+        stats = []
+        for task_futures, chunks in zip(futures, chunked):
+            parts = []
+            for future, chunk in zip(task_futures, chunks):
+                pid, seconds, part = future.result()
+                timing = timings.setdefault(pid, {
+                    'worker': pid, 'batches': 0, 'devices': 0, 'seconds': 0.0
+                })
+                timing['batches'] += 1
+                timing['devices'] += len(chunk[0])
+                timing['seconds'] += seconds
+                parts.append(part)
+            stats.append(_merge(parts))
+
+    return stats, list(timings.values())
@@ -0,0 +1,125 @@
+# app/services/portfolio_risk.py
+import math
+
+import numpy as np
+
+from app.services.distribution_store import distribution_stats
+from app.services.simulation_rng import SimulationStreams
+
+# Share of each device's demand-shock variance that comes from the
+# hospital-wide factor (census swings, seasonality surprises)
+DEFAULT_COMMON_SHARE = 0.5
+
+PORTFOLIO_PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+PORTFOLIO_VAR_LEVEL = 0.95
+
+
+def resolve_common_share(value):
+    """
+    Parses the common-factor share from a percentage entered by the user
+    (blank = the default) and returns it as a fraction. Raises ValueError
+    for non-numbers and values outside 0-100.
+    """
+    if value is None or str(value).strip() == "":
+        return DEFAULT_COMMON_SHARE
+    try:
+        percent = float(str(value).strip())
+    except ValueError:
+        raise ValueError("the shared demand percentage must be a number") from None
+    if not math.isfinite(percent) or not 0 <= percent <= 100:
+        raise ValueError("the shared demand percentage must be between 0 and 100")
+    return percent / 100
+
+
+def _shape(variance_share, dispersion):
+    """Gamma shape whose mean-one shock carries this share of 1/dispersion variance"""
+    return dispersion / variance_share if variance_share > 0 else None
+
+
+def draw_portfolio_profits(device_ids, means, unit_margins, fixed_costs, runs, seed,
+                           dispersion, common_share=DEFAULT_COMMON_SHARE):
+    """
+    (runs x devices) matrix of monthly profits with correlated demand.
+
+    Each run draws one hospital-wide gamma factor shared by every device;
+    each device multiplies it by its own gamma noise and draws a Poisson
+    count around mean * common * noise. The two shocks split the
+    negative-binomial variance (1 / dispersion) by common_share, so each
+    device keeps roughly the marginal spread of the independent model
+    while devices now move together. `dispersion` is a scalar or one value
+    per device; the common factor uses their median.
+
+    The common factor and every device column come from their own seeded
+    streams, so results do not depend on the device order.
+    """
+    streams = SimulationStreams(seed)
+    common_share = min(max(float(common_share), 0.0), 1.0)
+    dispersions = np.broadcast_to(np.asarray(dispersion, dtype=float), (len(device_ids),))
+    common_shape = _shape(common_share, float(np.median(dispersions))) if len(device_ids) else None
+
+    common = np.ones(runs)
+    if common_shape:
+        common = streams.for_common_factor().gamma(common_shape, 1.0 / common_shape, size=runs)
+
+    profits = np.empty((runs, len(device_ids)))
+    for j, device_id in enumerate(device_ids):
+        rng = streams.for_device(device_id)
+        rate = means[j] * common
+        device_shape = _shape(1.0 - common_share, dispersions[j])
+        if device_shape:
+            rate = rate * rng.gamma(device_shape, 1.0 / device_shape, size=runs)
+        profits[:, j] = rng.poisson(rate) * unit_margins[j] - fixed_costs[j]
+
+    return profits, common
+
+
+def portfolio_stats(profits, device_ids, device_names=None, var_level=PORTFOLIO_VAR_LEVEL,
+                    percentiles=PORTFOLIO_PERCENTILES):
+    """
+    Hospital-wide profit distribution plus per-device risk contributions.
+
+    Contributions are Euler allocations, which add up to the hospital
+    figure:
+      - std_contribution: cov(device, total) / std(total)
+      - cvar_contribution: minus the device's mean profit in the runs
+        where the hospital total is at or below its VaR cutoff
+    """
+    total = profits.sum(axis=1)
+    stats = distribution_stats(total, percentiles=percentiles, var_level=var_level)
+
+    cutoff = np.percentile(total, (1 - var_level) * 100)
+    tail = total <= cutoff
+    total_std = total.std()
+
+    centered = profits - profits.mean(axis=0)
+    covariance = centered.T @ (total - total.mean()) / total.size
+    std_contribution = covariance / total_std if total_std > 0 else np.zeros(profits.shape[1])
+    cvar_contribution = -profits[tail].mean(axis=0) if tail.any() else np.zeros(profits.shape[1])
+
+    # Independent-model comparison: how much of the spread is diversified away
+    standalone_std = profits.std(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = np.atleast_2d(np.corrcoef(profits, rowvar=False))
+    off_diagonal = correlation[~np.eye(len(correlation), dtype=bool)]
+
+    devices = []
+    for j, device_id in enumerate(device_ids):
+        devices.append({
+            'device_id': int(device_id),
+            'device_name': device_names[j] if device_names else str(device_id),
+            'expected_profit': float(profits[:, j].mean()),
+            'standalone_std': float(standalone_std[j]),
+            'std_contribution': float(std_contribution[j]),
+            'cvar_contribution': float(cvar_contribution[j]),
+            'cvar_share': float(cvar_contribution[j] / stats['conditional_value_at_risk'])
+            if stats['conditional_value_at_risk'] else 0.0
+        })
+
+    stats.update({
+        'probability_loss': float((total < 0).mean()),
+        'diversification_ratio': float(standalone_std.sum() / total_std) if total_std > 0 else 1.0,
+        'mean_correlation': float(np.nanmean(off_diagonal)) if np.isfinite(off_diagonal).any() else 1.0,
+        'devices': devices
+    })
+    return stats
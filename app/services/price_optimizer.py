@@ -0,0 +1,192 @@
+# app/services/price_optimizer.py
+import math
+
+import numpy as np
+
+from app.services.simulation_rng import SimulationStreams
+
+# Price multipliers evaluated per device (1.0 = current price)
+PRICE_MULTIPLIERS = tuple(np.round(np.linspace(0.7, 1.6, 19), 3))
+
+# Constant price elasticity of demand: demand scales with multiplier ** elasticity.
+# Inelastic values (above -1) make profit rise across the whole grid, so the
+# default is elastic enough for an interior optimum
+DEFAULT_ELASTICITY = -1.5
+
+OPTIMIZER_RUNS = 5000
+
+# Gamma shape of the demand shock when a result carries no 'demand_dispersion'
+DEFAULT_DISPERSION = 10
+
+# Recommendations smaller than this relative change are not reported
+MIN_PRICE_CHANGE = 0.01
+
+
+def resolve_elasticity(value):
+    """
+    Parses a price elasticity from user input, defaulting when blank.
+    Raises ValueError for non-numbers and for values that are not
+    negative: demand must fall as the price rises, or the grid search
+    recommends the highest price for every device.
+    """
+    if value is None or str(value).strip() == "":
+        return DEFAULT_ELASTICITY
+    try:
+        elasticity = float(str(value).strip())
+    except ValueError:
+        raise ValueError("the elasticity must be a number") from None
+    if not math.isfinite(elasticity) or elasticity >= 0:
+        raise ValueError("the elasticity must be negative (e.g. -1.5)")
+    return elasticity
+
+
+def evaluate_price_grid(device_ids, means, prices, variable_costs, fixed_costs,
+                        multipliers=PRICE_MULTIPLIERS, elasticity=DEFAULT_ELASTICITY,
+                        runs=OPTIMIZER_RUNS, seed=None, dispersion=DEFAULT_DISPERSION):
+    """
+    Expected profit and loss probability of every (device, price multiplier)
+    candidate.
+
+    Demand is negative binomial, drawn as a gamma shock times a Poisson
+    count (dispersion is a scalar or one value per device). The candidate
+    mean is mean * multiplier ** elasticity. All candidates of a device
+    share one draw per run (common random numbers): the candidate with
+    the highest mean draws the Poisson count, and each next-lower mean
+    keeps a binomially thinned subset of the previous count, which is
+    again Poisson with the lower mean. Candidates differ only by the
+    thinned-out treatments, so differences reflect the price, not
+    sampling noise.
+
+    Returns (expected_profit, probability_loss, expected_treatments), each
+    shaped (devices x candidates).
+    """
+    streams = SimulationStreams(seed)
+    multipliers = np.asarray(multipliers, dtype=float)
+    dispersions = np.broadcast_to(np.asarray(dispersion, dtype=float), (len(device_ids),))
+    demand_scale = multipliers ** elasticity
+
+    n_devices, n_candidates = len(device_ids), len(multipliers)
+    expected_profit = np.empty((n_devices, n_candidates))
+    probability_loss = np.empty((n_devices, n_candidates))
+    expected_treatments = np.empty((n_devices, n_candidates))
+
+    for i, device_id in enumerate(device_ids):
+        rng = streams.for_optimizer(device_id)
+        shocks = rng.gamma(dispersions[i], 1.0 / dispersions[i], size=runs)
+        counts = nested_poisson(rng, means[i] * demand_scale, shocks)
+
+        unit_margins = prices[i] * multipliers - variable_costs[i]
+        profits = counts * unit_margins[:, None] - fixed_costs[i]
+
+        expected_profit[i] = profits.mean(axis=1)
+        probability_loss[i] = (profits < 0).mean(axis=1)
+        expected_treatments[i] = counts.mean(axis=1)
+
+    return expected_profit, probability_loss, expected_treatments
+
+
+def nested_poisson(rng, candidate_means, shocks):
+    """
+    (candidates x runs) Poisson counts with means candidate_means x shocks,
+    coupled across candidates by thinning one count in decreasing-mean order.
+    """
+    order = np.argsort(-candidate_means, kind="stable")
+    counts = np.empty((len(candidate_means), len(shocks)), dtype=np.int64)
+
+    previous_mean = candidate_means[order[0]]
+    previous = rng.poisson(previous_mean * shocks)
+    counts[order[0]] = previous
+    for c in order[1:]:
+        keep = candidate_means[c] / previous_mean if previous_mean > 0 else 0.0
+        previous = rng.binomial(previous, keep)
+        previous_mean = candidate_means[c]
+        counts[c] = previous
+    return counts
+
+
+def choose_prices(expected_profit, probability_loss, margins, target_margin=None,
+                  max_loss_probability=None):
+    """
+    Index of the chosen candidate per device: the highest expected profit
+    among candidates meeting the margin floor and loss-probability cap.
+    When no candidate qualifies, the lowest loss probability wins.
+    """
+    feasible = np.ones(expected_profit.shape, dtype=bool)
+    if target_margin is not None:
+        feasible &= margins >= target_margin
+    if max_loss_probability is not None:
+        feasible &= probability_loss <= max_loss_probability
+
+    best = np.where(feasible, expected_profit, -np.inf).argmax(axis=1)
+    fallback = probability_loss.argmin(axis=1)
+    return np.where(feasible.any(axis=1), best, fallback)
+
+
+def optimize_portfolio(results, target_margin=None, elasticity=DEFAULT_ELASTICITY,
+                       max_loss_probability=None, multipliers=PRICE_MULTIPLIERS,
+                       runs=OPTIMIZER_RUNS, seed=None, dispersion=DEFAULT_DISPERSION):
+    """
+    Price recommendations for the devices in a simulation result list.
+    Each recommendation keeps the fields the results page shows and adds
+    the expected profit before/after and the device's full price curve.
+    """
+    devices = [
+        r for r in results
+        if r.get('current_price', 0) > 0 and r.get('expected_treatments', 0) > 0
+    ]
+    if not devices:
+        return []
+
+    multipliers = np.asarray(multipliers, dtype=float)
+    prices = np.array([r['current_price'] for r in devices], dtype=float)
+    variable_costs = np.array([r.get('variable_cost_per_use', 0) for r in devices], dtype=float)
+
+    expected_profit, probability_loss, expected_treatments = evaluate_price_grid(
+        [r.get('device_id', i) for i, r in enumerate(devices)],
+        np.array([r['expected_treatments'] for r in devices], dtype=float),
+        prices,
+        variable_costs,
+        np.array([r.get('fixed_monthly_cost', 0) for r in devices], dtype=float),
+        multipliers, elasticity, runs, seed,
+        np.array([r.get('demand_dispersion', dispersion) for r in devices], dtype=float)
+    )
+
+    candidate_prices = prices[:, None] * multipliers[None, :]
+    margins = (candidate_prices - variable_costs[:, None]) / candidate_prices
+    chosen = choose_prices(expected_profit, probability_loss, margins, target_margin, max_loss_probability)
+    current = int(np.abs(multipliers - 1.0).argmin())
+
+    recommendations = []
+    for i, result in enumerate(devices):
+        best = chosen[i]
+        if abs(multipliers[best] - 1.0) < MIN_PRICE_CHANGE:
+            continue
+
+        recommendations.append({
+            'device_id': result.get('device_id'),
+            'device_name': result.get('device_name', 'Unknown'),
+            'current_price': float(prices[i]),
+            'recommended_price': float(candidate_prices[i, best]),
+            'current_margin': float(margins[i, current] * 100),
+            'target_margin': float((target_margin or 0) * 100),
+            'price_change_pct': float((multipliers[best] - 1) * 100),
+            'demand_change_pct': float(
+                (expected_treatments[i, best] / expected_treatments[i, current] - 1) * 100
+            ) if expected_treatments[i, current] > 0 else 0.0,
+            'current_expected_profit': float(expected_profit[i, current]),
+            'expected_profit': float(expected_profit[i, best]),
+            'probability_loss': float(probability_loss[i, best]),
+            # The optimum may lie beyond the grid; the price is a bound, not a maximum
+            'at_grid_edge': bool(best in (0, len(multipliers) - 1)),
+            'urgency': 'high' if probability_loss[i, current] >= 0.3 else 'normal',
+            'price_curve': [
+                {
+                    'price': float(candidate_prices[i, c]),
+                    'expected_profit': float(expected_profit[i, c]),
+                    'probability_loss': float(probability_loss[i, c])
+                }
+                for c in range(len(multipliers))
+            ]
+        })
+
+    return recommendations
@@ -0,0 +1,321 @@
+# app/services/request_profiler.py
+import cProfile
+import heapq
+import io
+import itertools
+import pstats
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from flask import before_render_template, current_app, g, has_app_context, request, session, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    import pyinstrument
+except ImportError:  # optional; REQUEST_PROFILER = "pyinstrument" falls back to cProfile
+    pyinstrument = None
+
+# Statements longer than this are truncated in stored profiles
+STATEMENT_MAX_LENGTH = 500
+
+# Lines of pstats output kept per sampled profile
+PROFILE_STATS_LINES = 40
+
+# Requests under these paths are never recorded
+IGNORED_PATH_PREFIXES = ("/static/",)
+
+# Bound-parameter lists ("IN (?, ?, ?)") collapse to one shape, whatever their length
+_PARAMETER_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+_ids = itertools.count(1)
+
+# Only one sampled profile at a time: cProfile and pyinstrument are not meant to overlap
+_sampling_lock = threading.Lock()
+
+
+def normalize_statement(statement):
+    """Statement shape for N+1 detection: whitespace and IN-list lengths removed"""
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    return _PARAMETER_LIST.sub("(?...)", statement)
+
+
+class RequestProfile:
+    """SQL, render and total timings for one request"""
+
+    def __init__(self, method, path, endpoint, slow_query_limit):
+        self.id = next(_ids)
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.slow_query_limit = slow_query_limit
+
+        self.query_count = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_queries = 0
+        self.templates = []
+        self.shapes = Counter()
+        self.slowest = []  # min-heap of (duration, seq, statement)
+        self.notes = []
+
+        self.rendering = 0
+        self.profiler = None
+        self.profile_stats = None
+
+    def record_query(self, statement, duration):
+        self.query_count += 1
+        self.db_time += duration
+        if self.rendering:
+            self.render_queries += 1
+        self.shapes[normalize_statement(statement)] += 1
+
+        item = (duration, self.query_count, statement[:STATEMENT_MAX_LENGTH])
+        if len(self.slowest) < self.slow_query_limit:
+            heapq.heappush(self.slowest, item)
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def repeated_statements(self, threshold):
+        """Statement shapes run at least `threshold` times: likely N+1 loops"""
+        return [
+            {"statement": shape[:STATEMENT_MAX_LENGTH], "count": count}
+            for shape, count in self.shapes.most_common()
+            if count >= threshold
+        ]
+
+    def to_dict(self, status, total, n_plus_one_threshold):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "endpoint": self.endpoint,
+            "status": status,
+            "started_at": self.started_at.isoformat(),
+            "total_ms": round(total * 1000, 2),
+            "db_ms": round(self.db_time * 1000, 2),
+            "render_ms": round(self.render_time * 1000, 2),
+            "query_count": self.query_count,
+            "render_queries": self.render_queries,
+            "templates": self.templates,
+            "slowest_queries": [
+                {"statement": statement, "ms": round(duration * 1000, 3)}
+                for duration, _, statement in sorted(self.slowest, reverse=True)
+            ],
+            "n_plus_one": self.repeated_statements(n_plus_one_threshold),
+            "notes": self.notes,
+            "profile": self.profile_stats
+        }
+
+
+class RequestProfiler:
+    """
+    Per-request instrumentation. SQL timings come from engine cursor events,
+    render timings from Flask's template signals; finished profiles go to a
+    ring buffer read by the superadmin endpoint and, for superadmins only,
+    to response headers. Statements are stored without their parameters and
+    paths as URL rules (/admin/patient/<patient_id>), so no patient data is
+    kept; annotate() callers must not pass any either.
+    """
+
+    def __init__(self, app=None):
+        self.profiles = deque()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        self.headers = config.get("REQUEST_PROFILE_HEADERS", True)
+        self.slow_query_limit = config.get("REQUEST_PROFILE_SLOW_QUERIES", 5)
+        self.n_plus_one_threshold = config.get("REQUEST_PROFILE_N_PLUS_ONE", 10)
+        self.slow_request_ms = config.get("REQUEST_PROFILE_SLOW_MS", 1000)
+        self.sample_rate = config.get("REQUEST_PROFILE_SAMPLE_RATE", 0.0)
+        self.profiler_name = config.get("REQUEST_PROFILER", "cprofile")
+        self.profiles = deque(maxlen=config.get("REQUEST_PROFILE_BUFFER_SIZE", 200))
+
+        if self.profiler_name == "pyinstrument" and pyinstrument is None:
+            print("pyinstrument is not installed; sampled requests use cProfile")
+            self.profiler_name = "cprofile"
+
+        app.extensions["request_profiler"] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._template_rendered, app)
+        _listen_engines()
+
+    # ----------------------
+    # Request lifecycle
+    # ----------------------
+    def _before_request(self):
+        if request.path.startswith(IGNORED_PATH_PREFIXES):
+            return
+        path = request.url_rule.rule if request.url_rule else request.path
+        profile = RequestProfile(request.method, path, request.endpoint, self.slow_query_limit)
+        g.request_profile = profile
+
+        # Superadmins can force a profile for one request with ?_profile=1
+        forced = request.args.get("_profile") == "1" and session.get("role") == 1
+        if (forced or random.random() < self.sample_rate) and _sampling_lock.acquire(blocking=False):
+            profile.profiler = self._start_sampling()
+            if profile.profiler is None:
+                _sampling_lock.release()
+
+    def _after_request(self, response):
+        profile = g.pop("request_profile", None)
+        if profile is None:
+            return response
+        self._stop_sampling(profile)
+
+        total = time.perf_counter() - profile.started
+        record = profile.to_dict(response.status_code, total, self.n_plus_one_threshold)
+        with self._lock:
+            self.profiles.append(record)
+
+        # Timings reveal how the server works; other clients never see them
+        if self.headers and session.get("role") == 1:
+            response.headers["X-Request-Id"] = str(profile.id)
+            response.headers["X-DB-Queries"] = str(profile.query_count)
+            response.headers["Server-Timing"] = (
+                f"db;dur={record['db_ms']}, render;dur={record['render_ms']}, total;dur={record['total_ms']}"
+            )
+
+        if record["total_ms"] >= self.slow_request_ms or record["n_plus_one"]:
+            repeated = ", ".join(str(item["count"]) for item in record["n_plus_one"])
+            print(
+                f"REQUEST PROFILE {profile.method} {profile.path}: {record['total_ms']}ms, "
+                f"{profile.query_count} queries ({record['db_ms']}ms)"
+                + (f", repeated statements x{repeated}" if repeated else "")
+            )
+        return response
+
+    def _teardown_request(self, exc):
+        # after_request did not run (e.g. the response could not be built)
+        profile = g.pop("request_profile", None)
+        if profile is not None:
+            self._stop_sampling(profile)
+
+    # ----------------------
+    # Sampling profiler
+    # ----------------------
+    def _start_sampling(self):
+        try:
+            if self.profiler_name == "pyinstrument":
+                profiler = pyinstrument.Profiler()
+                profiler.start()
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+            return profiler
+        except (RuntimeError, ValueError) as e:
+            # Another profiler is already attached to the interpreter
+            print(f"Request profiling skipped: {e}")
+            return None
+
+    def _stop_sampling(self, profile):
+        profiler, profile.profiler = profile.profiler, None
+        if profiler is None:
+            return
+        try:
+            if self.profiler_name == "pyinstrument":
+                profiler.stop()
+                profile.profile_stats = profiler.output_text(unicode=False, color=False)
+            else:
+                profiler.disable()
+                out = io.StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_STATS_LINES)
+                profile.profile_stats = out.getvalue()
+        finally:
+            _sampling_lock.release()
+
+    # ----------------------
+    # Template signals
+    # ----------------------
+    def _before_render(self, sender, template, context, **extra):
+        profile = g.get("request_profile")
+        if profile is not None:
+            profile.rendering += 1
+            g.render_started = time.perf_counter()
+
+    def _template_rendered(self, sender, template, context, **extra):
+        profile = g.get("request_profile")
+        if profile is not None and profile.rendering:
+            profile.rendering -= 1
+            profile.render_time += time.perf_counter() - g.pop("render_started", time.perf_counter())
+            profile.templates.append(template.name)
+
+    def recent(self, limit=None):
+        """Newest profiles first, without the sampled profiler output"""
+        with self._lock:
+            records = list(self.profiles)
+        records.reverse()
+        return [dict(record, profile=record["profile"] is not None) for record in records[:limit]]
+
+    def get(self, profile_id):
+        with self._lock:
+            return next((record for record in self.profiles if record["id"] == profile_id), None)
+
+
+def current_profile():
+    """The profile of the request being handled, or None (jobs, CLI, disabled)"""
+    if not has_app_context():
+        return None
+    return g.get("request_profile")
+
+
+def annotate(message):
+    """
+    Attaches a diagnostic line to the current request's profile, shown by
+    the superadmin endpoint; outside a profiled request it goes to the app's
+    debug log. Notes are kept in memory, so they must not hold patient data.
+    """
+    profile = current_profile()
+    if profile is not None:
+        profile.notes.append(message)
+    elif has_app_context():
+        current_app.logger.debug(message)
+
+
+# ----------------------
+# SQLAlchemy hooks
+# ----------------------
+_listening = False
+
+
+def _listen_engines():
+    # Registered once on the Engine class, so every engine (and app) is covered
+    global _listening
+    if _listening:
+        return
+    _listening = True
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    profile = current_profile()
+    if profile is not None:
+        profile.record_query(statement, time.perf_counter() - started)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_started"):
+        conn.info["query_started"].pop()
@@ -0,0 +1,181 @@
+# app/services/rollup_service.py
+import threading
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.device_usage_rollup import DeviceUsageRollup
+from app.models.treatment_session import TreatmentSession
+
+
+# Dialect-specific INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE
+_UPSERT_DIALECTS = {
+    "mysql": mysql.insert,
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert
+}
+
+ROLLUP_AMOUNTS = ("session_count", "revenue", "device_cost", "staff_cost", "profit")
+
+ROLLUP_COLUMNS = ("hospital_id", "device_id", "device_key", "usage_date") + ROLLUP_AMOUNTS
+
+# Hospitals whose rollup rows are known to exist in this process
+_ready = set()
+_ready_lock = threading.Lock()
+
+
+def record_session(session_obj):
+    """
+    Adds one treatment session to its device/day rollup row with a single
+    upsert, so concurrent first sessions of a day cannot both insert.
+    The upsert runs in the caller's transaction: it commits or rolls back
+    together with the session, so call it before committing.
+    """
+    # Backfill first: it uses its own connection, before this one writes
+    ensure_rollups(session_obj.hospital_id)
+    if session_obj.created_at is None:
+        db.session.flush()
+    usage_date = (session_obj.created_at or datetime.utcnow()).date()
+
+    values = {
+        "hospital_id": session_obj.hospital_id,
+        "device_id": session_obj.device_id,
+        "device_key": session_obj.device_id or 0,
+        "usage_date": usage_date,
+        "session_count": 1,
+        "revenue": session_obj.total_price or 0,
+        "device_cost": session_obj.device_cost or 0,
+        "staff_cost": session_obj.staff_cost or 0,
+        "profit": session_obj.profit or 0
+    }
+
+    table = DeviceUsageRollup.__table__
+    dialect = db.session.get_bind().dialect.name
+    statement = _UPSERT_DIALECTS[dialect](table).values(**values)
+
+    # Increment in SQL so concurrent writers don't lose updates
+    if dialect == "mysql":
+        statement = statement.on_duplicate_key_update({
+            column: table.c[column] + statement.inserted[column] for column in ROLLUP_AMOUNTS
+        })
+    else:
+        statement = statement.on_conflict_do_update(
+            index_elements=["hospital_id", "device_key", "usage_date"],
+            set_={column: table.c[column] + statement.excluded[column] for column in ROLLUP_AMOUNTS}
+        )
+    db.session.execute(statement)
+
+
+def _rebuild_statements(hospital_id=None):
+    # DELETE + INSERT ... SELECT that recompute rollup rows from treatment_sessions
+    table = DeviceUsageRollup.__table__
+    clear = delete(table)
+    if hospital_id is not None:
+        clear = clear.where(table.c.hospital_id == hospital_id)
+
+    usage_date = func.date(TreatmentSession.created_at)
+    source = select(
+        TreatmentSession.hospital_id,
+        TreatmentSession.device_id,
+        func.coalesce(TreatmentSession.device_id, 0),
+        usage_date,
+        func.count(TreatmentSession.session_id),
+        func.coalesce(func.sum(TreatmentSession.total_price), 0),
+        func.coalesce(func.sum(TreatmentSession.device_cost), 0),
+        func.coalesce(func.sum(TreatmentSession.staff_cost), 0),
+        func.coalesce(func.sum(TreatmentSession.profit), 0)
+    ).where(
+        TreatmentSession.created_at.isnot(None)
+    ).group_by(
+        TreatmentSession.hospital_id,
+        TreatmentSession.device_id,
+        usage_date
+    )
+    if hospital_id is not None:
+        source = source.where(TreatmentSession.hospital_id == hospital_id)
+
+    return clear, insert(table).from_select(list(ROLLUP_COLUMNS), source)
+
+
+def rebuild_rollups(hospital_id=None):
+    """
+    Recomputes rollup rows from treatment_sessions with one INSERT ... SELECT.
+    Used to repair drift: `flask rebuild-rollups [--hospital-id N]`.
+    Returns the row count.
+    """
+    for statement in _rebuild_statements(hospital_id):
+        db.session.execute(statement)
+    db.session.commit()
+
+    count_query = DeviceUsageRollup.query
+    if hospital_id is not None:
+        count_query = count_query.filter(DeviceUsageRollup.hospital_id == hospital_id)
+    return count_query.count()
+
+
+def ensure_rollups(hospital_id):
+    """
+    Backfills a hospital's rollup rows the first time they are needed, so
+    deployments that predate the rollup table keep their history without
+    a manual `flask rebuild-rollups`. Runs on its own connection and commits
+    there, leaving the caller's transaction untouched.
+    """
+    key = str(hospital_id)
+    if key in _ready:
+        return
+
+    table = DeviceUsageRollup.__table__
+    try:
+        with db.engine.begin() as connection:
+            has_rows = connection.execute(
+                select(table.c.hospital_id).where(table.c.hospital_id == hospital_id).limit(1)
+            ).first() is not None
+            if not has_rows:
+                for statement in _rebuild_statements(hospital_id):
+                    connection.execute(statement)
+                print(f"[Rollups] Backfilled device usage rollups for hospital {hospital_id}")
+    except IntegrityError:
+        # Another worker backfilled the same hospital first
+        pass
+
+    with _ready_lock:
+        _ready.add(key)
+
+
+def usage_counts_since(hospital_id, since_date):
+    """Sessions per device (None = no device) from the rollup table"""
+    ensure_rollups(hospital_id)
+    rows = db.session.query(
+        DeviceUsageRollup.device_id,
+        func.sum(DeviceUsageRollup.session_count)
+    ).filter(
+        DeviceUsageRollup.hospital_id == hospital_id,
+        DeviceUsageRollup.usage_date >= since_date
+    ).group_by(
+        DeviceUsageRollup.device_id
+    ).all()
+    return {device_id: int(count or 0) for device_id, count in rows}
+
+
+def hospital_totals(hospital_id, since_date=None):
+    """Session count and money totals for a hospital, optionally from a date"""
+    ensure_rollups(hospital_id)
+    query = db.session.query(
+        func.coalesce(func.sum(DeviceUsageRollup.session_count), 0),
+        func.coalesce(func.sum(DeviceUsageRollup.revenue), 0),
+        func.coalesce(func.sum(DeviceUsageRollup.staff_cost), 0),
+        func.coalesce(func.sum(DeviceUsageRollup.profit), 0)
+    ).filter(DeviceUsageRollup.hospital_id == hospital_id)
+    if since_date is not None:
+        query = query.filter(DeviceUsageRollup.usage_date >= since_date)
+
+    sessions, revenue, staff_cost, profit = query.one()
+    return {
+        "sessions": int(sessions),
+        "revenue": float(revenue),
+        "staff_cost": float(staff_cost),
+        "profit": float(profit)
+    }
@@ -0,0 +1,207 @@
+# app/services/routing_service.py
+import heapq
+import math
+import threading
+from collections import OrderedDict
+
+from app.services.connection_graph import get_connection_graph
+
+METRICS = ("cost", "latency", "reliability", "combined")
+
+# Weight of -log(reliability) in the combined metric
+RELIABILITY_WEIGHT = 100.0
+
+# Networks up to this size get every source precomputed when the graph changes
+ALL_PAIRS_MAX_NODES = 200
+
+# Larger networks cache shortest-path trees for this many (source, metric) pairs
+TREE_CACHE_SIZE = 512
+
+DEFAULT_K = 3
+
+
+def _weight(edge, metric):
+    if metric == "cost":
+        return edge["cost"]
+    if metric == "latency":
+        return edge["latency"]
+    reliability_weight = -math.log(edge["reliability"]) if edge["reliability"] > 0 else math.inf
+    if metric == "reliability":
+        return reliability_weight
+    return edge["cost"] + edge["latency"] + RELIABILITY_WEIGHT * reliability_weight
+
+
+def route_score(cost, latency, reliability):
+    """Higher score = better (more reliable, cheaper, faster); same formula as a direct edge"""
+    return round(reliability / (1 + cost + latency), 4)
+
+
+class RoutingGraph:
+    """
+    Shortest-path engine over one version of the connection graph.
+    Nodes are hospital ids as strings (see ConnectionGraph.key).
+    """
+
+    def __init__(self, connection_graph):
+        self.source_graph = connection_graph
+        self.version = connection_graph.version
+        self.adjacency = {}
+        self.edges = {}
+        for hospital_from, edges in connection_graph.adjacency.items():
+            for edge in edges:
+                u, v = connection_graph.key(hospital_from, edge["to"])
+                self.adjacency.setdefault(u, []).append((v, edge))
+                self.edges[(u, v)] = edge
+        self.nodes = set(self.adjacency) | {v for _, v in self.edges}
+
+        self._trees = OrderedDict()
+        self._lock = threading.Lock()
+        self._precomputed = len(self.nodes) <= ALL_PAIRS_MAX_NODES
+        if self._precomputed:
+            for source in self.nodes:
+                for metric in METRICS:
+                    self._trees[(source, metric)] = self._dijkstra(source, metric)
+
+    def _dijkstra(self, source, metric, banned_edges=(), banned_nodes=()):
+        """Returns (distance, predecessor) maps for every node reachable from source"""
+        dist = {source: 0.0}
+        prev = {}
+        heap = [(0.0, source)]
+        done = set()
+        while heap:
+            d, node = heapq.heappop(heap)
+            if node in done:
+                continue
+            done.add(node)
+            for neighbour, edge in self.adjacency.get(node, ()):
+                if neighbour in banned_nodes or (node, neighbour) in banned_edges:
+                    continue
+                nd = d + _weight(edge, metric)
+                if nd < dist.get(neighbour, math.inf):
+                    dist[neighbour] = nd
+                    prev[neighbour] = node
+                    heapq.heappush(heap, (nd, neighbour))
+        return dist, prev
+
+    def _tree(self, source, metric):
+        key = (source, metric)
+        with self._lock:
+            tree = self._trees.get(key)
+            if tree is not None:
+                if not self._precomputed:
+                    self._trees.move_to_end(key)
+                return tree
+        tree = self._dijkstra(source, metric)
+        with self._lock:
+            self._trees[key] = tree
+            if not self._precomputed:
+                while len(self._trees) > TREE_CACHE_SIZE:
+                    self._trees.popitem(last=False)
+        return tree
+
+    @staticmethod
+    def _walk(prev, source, target):
+        path = [target]
+        while path[-1] != source:
+            path.append(prev[path[-1]])
+        path.reverse()
+        return path
+
+    def _path(self, source, target, metric):
+        dist, prev = self._tree(source, metric)
+        if target not in dist or source == target:
+            return None
+        return self._walk(prev, source, target)
+
+    def _path_weight(self, path, metric):
+        return sum(_weight(self.edges[(u, v)], metric) for u, v in zip(path, path[1:]))
+
+    def describe(self, path):
+        """Totals for a node path: cost and latency add up, reliability multiplies"""
+        cost = latency = 0.0
+        reliability = 1.0
+        for u, v in zip(path, path[1:]):
+            edge = self.edges[(u, v)]
+            cost += edge["cost"]
+            latency += edge["latency"]
+            reliability *= edge["reliability"]
+        return {
+            "path": path,
+            "hops": len(path) - 1,
+            "cost": round(cost, 2),
+            "latency": round(latency, 2),
+            "reliability": round(reliability, 4),
+            "score": route_score(cost, latency, reliability)
+        }
+
+    def shortest_route(self, source, target, metric="combined"):
+        """Best route under one metric, or None if target is unreachable"""
+        path = self._path(str(source), str(target), metric)
+        return self.describe(path) if path else None
+
+    def best_route(self, source, target):
+        """
+        Highest-scoring route among the cheapest, fastest, most reliable
+        and combined-metric shortest paths.
+        """
+        best = None
+        seen = set()
+        for metric in METRICS:
+            path = self._path(str(source), str(target), metric)
+            if not path or tuple(path) in seen:
+                continue
+            seen.add(tuple(path))
+            route = self.describe(path)
+            if best is None or route["score"] > best["score"]:
+                best = route
+        return best
+
+    def k_best_routes(self, source, target, k=DEFAULT_K, metric="combined"):
+        """Up to k loopless routes in increasing metric weight (Yen's algorithm)"""
+        source, target = str(source), str(target)
+        first = self._path(source, target, metric)
+        if not first:
+            return []
+
+        found = [first]
+        seen = {tuple(first)}
+        candidates = []
+        while len(found) < k:
+            last = found[-1]
+            for i in range(len(last) - 1):
+                spur = last[i]
+                root = last[:i + 1]
+                banned_edges = {
+                    (p[i], p[i + 1]) for p in found if len(p) > i + 1 and p[:i + 1] == root
+                }
+                dist, prev = self._dijkstra(spur, metric, banned_edges, set(root[:-1]))
+                if target not in dist:
+                    continue
+                path = root[:-1] + self._walk(prev, spur, target)
+                if tuple(path) not in seen:
+                    seen.add(tuple(path))
+                    heapq.heappush(candidates, (self._path_weight(path, metric), path))
+            if not candidates:
+                break
+            found.append(heapq.heappop(candidates)[1])
+
+        return [self.describe(path) for path in found]
+
+
+_routing = None
+_routing_lock = threading.Lock()
+
+
+def get_routing_graph(connection_graph=None):
+    """Routing engine for the current connection graph, rebuilt when the graph changes"""
+    global _routing
+    graph = connection_graph or get_connection_graph()
+    with _routing_lock:
+        routing = _routing
+    if routing is not None and routing.source_graph is graph and routing.version == graph.version:
+        return routing
+
+    routing = RoutingGraph(graph)
+    with _routing_lock:
+        _routing = routing
+    return routing
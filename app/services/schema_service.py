@@ -0,0 +1,89 @@
+# app/services/schema_service.py
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+
+from app import db
+from app.models.treatment_session import ROW_VERSION_TRIGGER, ROW_VERSION_TRIGGER_DDL
+
+# Schema changes an existing database needs (db.create_all only creates
+# missing tables, never alters existing ones):
+#   simulations          status (NOT NULL, default 'completed'), progress,
+#                        error_message, completed_at, heartbeat_at, fingerprint,
+#                        distribution_key and the summary columns, plus the
+#                        history and fingerprint indexes
+#   treatment_sessions   row_version (NOT NULL, default 0), the MySQL trigger
+#                        that bumps it, and the pagination/usage indexes
+#   device_usage_rollups new table (backfilled on first use)
+#   transfer_leaf_hashes new table
+#   patients, departments, patient_access, data_transfers  new indexes
+
+
+def pending_statements():
+    """
+    DDL that brings the connected database up to the models: missing
+    tables, then missing columns and indexes of existing tables, then the
+    MySQL row_version trigger. Every added column is nullable or has a
+    server default, so existing rows stay valid.
+    """
+    engine = db.engine
+    dialect = engine.dialect
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    statements = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            statements.append(str(CreateTable(table).compile(dialect=dialect)).strip())
+            statements.extend(str(CreateIndex(index).compile(dialect=dialect)) for index in table.indexes)
+            continue
+
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                statements.append(
+                    f"ALTER TABLE {table.name} ADD COLUMN {CreateColumn(column).compile(dialect=dialect)}"
+                )
+
+        indexes = _index_names(inspector, table.name)
+        for index in table.indexes:
+            if index.name not in indexes:
+                statements.append(str(CreateIndex(index).compile(dialect=dialect)))
+
+    if dialect.name == "mysql" and not _has_trigger(ROW_VERSION_TRIGGER):
+        statements.append(ROW_VERSION_TRIGGER_DDL)
+
+    return statements
+
+
+# The inspector leaves out expression indexes (lower(name)), so read the catalog
+_INDEX_CATALOG = {
+    "sqlite": "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table",
+    "mysql": "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+             "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table"
+}
+
+
+def _index_names(inspector, table_name):
+    catalog = _INDEX_CATALOG.get(db.engine.dialect.name)
+    if catalog is None:
+        return {index["name"] for index in inspector.get_indexes(table_name)}
+    with db.engine.connect() as connection:
+        return {row[0] for row in connection.execute(text(catalog), {"table": table_name})}
+
+
+def _has_trigger(name):
+    with db.engine.connect() as connection:
+        return connection.execute(text(
+            "SELECT 1 FROM information_schema.TRIGGERS "
+            "WHERE TRIGGER_SCHEMA = DATABASE() AND TRIGGER_NAME = :name"
+        ), {"name": name}).first() is not None
+
+
+def upgrade_schema(dry_run=False):
+    """Runs (or with dry_run only returns) the pending DDL, in one transaction where the database allows"""
+    statements = pending_statements()
+    if statements and not dry_run:
+        with db.engine.begin() as connection:
+            for statement in statements:
+                connection.exec_driver_sql(statement)
+    return statements
@@ -0,0 +1,368 @@
+# app/services/search_service.py
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app import db
+from app.models.department import Department
+from app.models.patient import Patient
+
+SEARCH_RESULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+
+# Typeahead responses are reused briefly; writes clear them immediately
+SEARCH_CACHE_TTL = 30
+SEARCH_CACHE_SIZE = 2048
+
+# In-process indexes are rebuilt in the background after this long to pick
+# up other processes' writes; the old index answers until the new one is ready
+SEARCH_INDEX_TTL = 600
+
+NGRAM_SIZE = 3
+
+
+def _normalize(text):
+    return (text or "").casefold().strip()
+
+
+def _escape_like(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class NgramIndex:
+    """
+    Portable in-process n-gram index for substring search over names.
+    Each document is (doc_id -> name, scope); scope carries whatever the
+    caller filters on (e.g. a hospital id).
+    """
+
+    def __init__(self, n=NGRAM_SIZE):
+        self.n = n
+        self.built_at = time.monotonic()
+        self._postings = defaultdict(set)
+        self._docs = {}
+        self._lock = threading.RLock()
+        # Ids changed by commits while the index is loading (None once
+        # loaded); load() skips them
+        self._touched = set()
+
+    def _grams(self, text):
+        return {text[i:i + self.n] for i in range(len(text) - self.n + 1)}
+
+    def add(self, doc_id, name, scope=None):
+        with self._lock:
+            self.remove(doc_id)
+            normalized = _normalize(name)
+            self._docs[doc_id] = (normalized, name, scope)
+            for gram in self._grams(normalized):
+                self._postings[gram].add(doc_id)
+
+    def load(self, rows):
+        """Bulk add from a loader query, keeping newer committed changes"""
+        for doc_id, name, scope in rows:
+            with self._lock:
+                if doc_id not in self._touched:
+                    self.add(doc_id, name, scope)
+        with self._lock:
+            self._touched = None
+
+    def apply(self, doc_id, name, scope):
+        """A committed write: the document's new name, or name=None if it is gone"""
+        with self._lock:
+            if self._touched is not None:
+                self._touched.add(doc_id)
+            if name is None:
+                self.remove(doc_id)
+            else:
+                self.add(doc_id, name, scope)
+
+    def remove(self, doc_id):
+        with self._lock:
+            doc = self._docs.pop(doc_id, None)
+            if doc is None:
+                return
+            for gram in self._grams(doc[0]):
+                postings = self._postings.get(gram)
+                if postings is not None:
+                    postings.discard(doc_id)
+                    if not postings:
+                        del self._postings[gram]
+
+    def search(self, term, limit, accept=None):
+        """
+        Returns up to `limit` (doc_id, name, scope) whose name contains
+        `term`, prefix matches first. `accept(scope)` filters documents.
+        Terms shorter than n cannot use the index and return nothing.
+        """
+        term = _normalize(term)
+        grams = self._grams(term)
+        if not grams:
+            return []
+
+        with self._lock:
+            postings = sorted((self._postings.get(g, set()) for g in grams), key=len)
+            candidates = set(postings[0])
+            for other in postings[1:]:
+                candidates &= other
+                if not candidates:
+                    return []
+
+            matches = []
+            for doc_id in candidates:
+                normalized, name, scope = self._docs[doc_id]
+                position = normalized.find(term)
+                if position >= 0 and (accept is None or accept(scope)):
+                    matches.append((position, normalized, doc_id, name, scope))
+
+        matches.sort()
+        return [(doc_id, name, scope) for _, _, doc_id, name, scope in matches[:limit]]
+
+
+class _ResponseCache:
+    """Small TTL + LRU cache for typeahead responses"""
+
+    def __init__(self, ttl=SEARCH_CACHE_TTL, size=SEARCH_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self, kind=None):
+        with self._lock:
+            if kind is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == kind]:
+                    del self._entries[key]
+
+
+_responses = _ResponseCache()
+_indexes = {}
+_building = {}
+_indexes_lock = threading.Lock()
+
+
+def _get_index(key, loader):
+    """
+    The ready index for `key`, or None while its first build runs. Builds
+    and TTL rebuilds happen on a background thread, so no request pays for
+    loading every name; a stale index keeps answering until it is replaced.
+    """
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None and time.monotonic() - index.built_at < SEARCH_INDEX_TTL:
+            return index
+        if key in _building:
+            return index
+        building = _building[key] = NgramIndex()
+
+    app = current_app._get_current_object()
+    threading.Thread(
+        target=_build_index, args=(app, key, building, loader), name="search-index", daemon=True
+    ).start()
+    return index
+
+
+def _build_index(app, key, index, loader):
+    with app.app_context():
+        try:
+            index.load(loader())
+            index.built_at = time.monotonic()
+            with _indexes_lock:
+                _indexes[key] = index
+        except Exception as e:
+            print(f"Search index {key[0]} build failed: {e}")
+        finally:
+            with _indexes_lock:
+                _building.pop(key, None)
+            db.session.remove()
+
+
+def _patient_index(hospital_id):
+    def load():
+        return db.session.query(
+            Patient.patient_id, Patient.name, Patient.hospital_id
+        ).filter(Patient.hospital_id == hospital_id).yield_per(5000)
+    return _get_index(("patient", str(hospital_id)), load)
+
+
+def _department_index():
+    def load():
+        return db.session.query(
+            Department.department_id, Department.name, Department.hospital_id
+        ).yield_per(5000)
+    return _get_index(("department",), load)
+
+
+def _clamp_limit(limit):
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return SEARCH_RESULT_LIMIT
+    return max(1, min(limit, SEARCH_MAX_LIMIT))
+
+
+def search_patients(hospital_id, term, limit=SEARCH_RESULT_LIMIT):
+    """
+    Typeahead over a hospital's patients. Name prefixes are answered by
+    the (hospital_id, name) index; substring matches come from the
+    in-process n-gram index.
+    """
+    limit = _clamp_limit(limit)
+    term = (term or "").strip()
+    key = ("patient", str(hospital_id), term.casefold(), limit)
+    cached = _responses.get(key)
+    if cached is not None:
+        return cached
+
+    rows = db.session.query(Patient.patient_id, Patient.name).filter(
+        Patient.hospital_id == hospital_id,
+        Patient.name.like(f"{_escape_like(term)}%", escape="\\")
+    ).order_by(Patient.name).limit(limit).all()
+    results = [{"id": patient_id, "name": name} for patient_id, name in rows]
+
+    if len(results) < limit and len(term) >= NGRAM_SIZE:
+        seen = {r["id"] for r in results}
+        index = _patient_index(hospital_id)
+        if index is not None:
+            matches = index.search(term, limit + len(seen))
+        else:
+            # Index still loading: a bounded substring scan instead
+            matches = db.session.query(Patient.patient_id, Patient.name, Patient.hospital_id).filter(
+                Patient.hospital_id == hospital_id,
+                Patient.name.like(f"%{_escape_like(term)}%", escape="\\")
+            ).order_by(Patient.name).limit(limit + len(seen)).all()
+        for doc_id, name, _ in matches:
+            if doc_id not in seen:
+                results.append({"id": doc_id, "name": name})
+            if len(results) >= limit:
+                break
+
+    _responses.put(key, results)
+    return results
+
+
+def search_departments(term, exclude_hospital_id=None, limit=SEARCH_RESULT_LIMIT):
+    """Typeahead over departments in other hospitals (prefix via SQL, substring via n-grams)"""
+    limit = _clamp_limit(limit)
+    term = (term or "").strip()
+    key = ("department", str(exclude_hospital_id), term.casefold(), limit)
+    cached = _responses.get(key)
+    if cached is not None:
+        return cached
+
+    query = db.session.query(
+        Department.department_id, Department.name, Department.hospital_id
+    ).filter(Department.name.like(f"{_escape_like(term)}%", escape="\\"))
+    if exclude_hospital_id is not None:
+        query = query.filter(Department.hospital_id != exclude_hospital_id)
+    rows = query.order_by(Department.name).limit(limit).all()
+    results = [
+        {"id": department_id, "name": name, "hospital_id": hospital_id}
+        for department_id, name, hospital_id in rows
+    ]
+
+    if len(results) < limit and len(term) >= NGRAM_SIZE:
+        seen = {r["id"] for r in results}
+        excluded = str(exclude_hospital_id)
+        index = _department_index()
+        if index is not None:
+            matches = index.search(term, limit + len(seen), accept=lambda scope: str(scope) != excluded)
+        else:
+            # Index still loading: a bounded substring scan instead
+            fallback = db.session.query(
+                Department.department_id, Department.name, Department.hospital_id
+            ).filter(Department.name.like(f"%{_escape_like(term)}%", escape="\\"))
+            if exclude_hospital_id is not None:
+                fallback = fallback.filter(Department.hospital_id != exclude_hospital_id)
+            matches = fallback.order_by(Department.name).limit(limit + len(seen)).all()
+        for doc_id, name, hospital_id in matches:
+            if doc_id not in seen:
+                results.append({"id": doc_id, "name": name, "hospital_id": hospital_id})
+            if len(results) >= limit:
+                break
+
+    _responses.put(key, results)
+    return results
+
+
+# -----------------------
+# Keep indexes in step with writes
+# -----------------------
+# Mapper events only queue the change on the session; it reaches the
+# shared indexes after commit, so a rolled-back write is never searchable.
+
+def _queue_change(target, kind, doc_id, name, scope):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("search_changes", []).append((kind, doc_id, name, scope))
+
+
+@event.listens_for(Patient, "after_insert")
+@event.listens_for(Patient, "after_update")
+def _patient_written(mapper, connection, target):
+    _queue_change(target, "patient", target.patient_id, target.name, target.hospital_id)
+
+
+@event.listens_for(Patient, "after_delete")
+def _patient_deleted(mapper, connection, target):
+    _queue_change(target, "patient", target.patient_id, None, target.hospital_id)
+
+
+@event.listens_for(Department, "after_insert")
+@event.listens_for(Department, "after_update")
+def _department_written(mapper, connection, target):
+    _queue_change(target, "department", target.department_id, target.name, target.hospital_id)
+
+
+@event.listens_for(Department, "after_delete")
+def _department_deleted(mapper, connection, target):
+    _queue_change(target, "department", target.department_id, None, target.hospital_id)
+
+
+def _indexes_for(kind, scope):
+    # Ready and loading indexes both take the change; a patient is dropped
+    # from every hospital's index and added to its current hospital's only
+    with _indexes_lock:
+        items = list(_indexes.items()) + list(_building.items())
+    for key, index in items:
+        if key[0] != kind:
+            continue
+        yield index, kind == "department" or key[1] == str(scope)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_changes(session):
+    changes = session.info.pop("search_changes", None)
+    if not changes:
+        return
+    for kind, doc_id, name, scope in changes:
+        for index, owns in _indexes_for(kind, scope):
+            index.apply(doc_id, name if owns else None, scope)
+    for kind in {change[0] for change in changes}:
+        _responses.clear(kind)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("search_changes", None)
@@ -0,0 +1,191 @@
+# app/services/simulation_cache.py
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, event, or_
+from sqlalchemy.orm import load_only
+
+from app import db
+from app.models.device import Device
+from app.models.simulations import Simulation
+
+# Fingerprints are reused briefly; local device writes drop them
+# immediately and the TTL is a safety net for other processes' writes
+SIMULATION_CACHE_TTL = 300
+SIMULATION_CACHE_SIZE = 1000
+
+# Device columns the simulation reads; a change to any of them changes results
+DEVICE_COST_FIELDS = (
+    "cost_per_use",
+    "price_per_use",
+    "base_machine_cost",
+    "doctor_minutes",
+    "doctor_hourly_wage",
+    "nurse_minutes",
+    "nurse_hourly_wage",
+)
+
+# A resubmission joins a run that is still in progress instead of starting another
+ACTIVE_STATUSES = ("queued", "running")
+
+# Default for SIMULATION_JOB_STALE_SECONDS
+JOB_STALE_SECONDS = 300
+
+_signatures = {}
+_simulations = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def device_signature(hospital_id):
+    """Hash of the cost fields of every device in the hospital (cached)"""
+    key = str(hospital_id)
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _signatures.get(key)
+        if entry is not None and entry[0] >= now:
+            return entry[1]
+
+    devices = Device.query.options(
+        load_only(Device.device_id, *(getattr(Device, field) for field in DEVICE_COST_FIELDS))
+    ).filter_by(hospital_id=hospital_id).order_by(Device.device_id).all()
+
+    rows = [
+        [device.device_id] + [str(getattr(device, field)) for field in DEVICE_COST_FIELDS]
+        for device in devices
+    ]
+    signature = hashlib.sha256(json.dumps(rows).encode("utf-8")).hexdigest()
+
+    with _cache_lock:
+        _signatures[key] = (now + SIMULATION_CACHE_TTL, signature)
+    return signature
+
+
+def simulation_fingerprint(hospital_id, parameters):
+    """
+    Canonical hash of a run's inputs: its parameters and the hospital's
+    device cost fields. A seed the user typed is part of the hash; a seed
+    generated for a blank field (seed_was_random) is not, so identical
+    submissions match whatever seed each was given. Returns None for runs
+    without a seed, which are random and never reused.
+    """
+    if parameters.get("seed") is None:
+        return None
+
+    skip = ("seed",) if parameters.get("seed_was_random") else ()
+    canonical = json.dumps({
+        "hospital_id": str(hospital_id),
+        "parameters": {
+            key: ({str(k): v for k, v in value.items()} if isinstance(value, dict) else value)
+            for key, value in parameters.items()
+            if key not in skip
+        },
+        "devices": device_signature(hospital_id)
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def stale_job_cutoff():
+    """Queued/running rows whose heartbeat is older than this belong to a dead process"""
+    seconds = current_app.config.get("SIMULATION_JOB_STALE_SECONDS", JOB_STALE_SECONDS)
+    return datetime.utcnow() - timedelta(seconds=seconds)
+
+
+def _reusable(simulation, cutoff):
+    if simulation.status == "completed":
+        return True
+    return simulation.status in ACTIVE_STATUSES and simulation.heartbeat_at is not None \
+        and simulation.heartbeat_at >= cutoff
+
+
+def find_simulation(hospital_id, fingerprint):
+    """
+    The newest completed or in-progress simulation with this fingerprint,
+    or None. In-progress rows whose job stopped sending heartbeats are
+    skipped: nothing will ever finish them.
+    """
+    if fingerprint is None:
+        return None
+    cutoff = stale_job_cutoff()
+
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _simulations.get(fingerprint)
+        if entry is not None and entry[0] < now:
+            del _simulations[fingerprint]
+            entry = None
+        if entry is not None:
+            _simulations.move_to_end(fingerprint)
+
+    if entry is not None:
+        simulation = Simulation.query.get(entry[2])
+        if simulation is not None and simulation.fingerprint == fingerprint \
+                and _reusable(simulation, cutoff):
+            return simulation
+
+    simulation = Simulation.query.filter(
+        Simulation.hospital_id == hospital_id,
+        Simulation.fingerprint == fingerprint,
+        or_(
+            Simulation.status == "completed",
+            and_(Simulation.status.in_(ACTIVE_STATUSES), Simulation.heartbeat_at >= cutoff)
+        )
+    ).order_by(Simulation.simulation_id.desc()).first()
+
+    if simulation is None:
+        forget(fingerprint)
+    else:
+        remember(hospital_id, fingerprint, simulation.simulation_id)
+    return simulation
+
+
+def remember(hospital_id, fingerprint, simulation_id):
+    if fingerprint is None:
+        return
+    with _cache_lock:
+        _simulations[fingerprint] = (time.monotonic() + SIMULATION_CACHE_TTL, str(hospital_id), simulation_id)
+        _simulations.move_to_end(fingerprint)
+        while len(_simulations) > SIMULATION_CACHE_SIZE:
+            _simulations.popitem(last=False)
+
+
+def forget(fingerprint):
+    with _cache_lock:
+        _simulations.pop(fingerprint, None)
+
+
+def invalidate_simulations(hospital_id=None):
+    """Drops the device signature and cached fingerprints of one hospital, or of all"""
+    with _cache_lock:
+        if hospital_id is None:
+            _signatures.clear()
+            _simulations.clear()
+            return
+        key = str(hospital_id)
+        _signatures.pop(key, None)
+        for fingerprint in [f for f, entry in _simulations.items() if entry[1] == key]:
+            del _simulations[fingerprint]
+
+
+@event.listens_for(Device, "after_insert")
+@event.listens_for(Device, "after_delete")
+def _device_added_or_removed(mapper, connection, target):
+    invalidate_simulations(target.hospital_id)
+
+
+@event.listens_for(Device, "after_update")
+def _device_updated(mapper, connection, target):
+    state = db.inspect(target)
+    history = state.attrs.hospital_id.history
+    if history.has_changes():
+        # Moved between hospitals: both device lists changed
+        for hospital_id in list(history.deleted) + list(history.added):
+            invalidate_simulations(hospital_id)
+        return
+
+    if any(state.attrs[field].history.has_changes() for field in DEVICE_COST_FIELDS):
+        invalidate_simulations(target.hospital_id)
@@ -1,152 +1,516 @@
 # simulation_engine.py
 import numpy as np
 import json
+import time
 from datetime import datetime, timedelta
 from app import db
 from app.models.simulations import Simulation
+from app.services.horizon_simulation import (
+    HORIZON_DEFAULT_MONTHS, HORIZON_MAX_MONTHS, month_labels, schedule_matrix, seasonality_curve, simulate_horizon
+)
+from app.services.portfolio_risk import DEFAULT_COMMON_SHARE, draw_portfolio_profits, portfolio_stats
+from app.services.price_optimizer import DEFAULT_ELASTICITY, PRICE_MULTIPLIERS, optimize_portfolio
+from app.services.simulation_cache import find_simulation, remember, simulation_fingerprint
+from app.services.simulation_rng import SimulationStreams
+
+# Negative binomial dispersion used for monthly treatment counts
+NB_DISPERSION = 10
+
+# Upper bound on Monte Carlo runs per device
+MAX_SIMULATION_RUNS = 200000
+
+# Upper bound on devices x runs for the matrices kept whole: stored count
+# distributions and portfolio profits (20M draws is ~160 MB as int64/float64).
+# Runs per device shrink to fit; per-device statistics never need the matrix.
+MAX_SIMULATION_DRAWS = 20000000
+
+PROFIT_PERCENTILES = (5, 50, 95)
+
+# Below this many draws (devices x runs) the process pool costs more than it saves
+PARALLEL_MIN_DRAWS = 2000000
+
+
+def classify_risk(probability_loss):
+    """Maps a probability of loss to the risk bucket shown in the dashboards"""
+    if probability_loss >= 0.3:
+        return 'high'
+    elif probability_loss >= 0.1:
+        return 'medium'
+    return 'low'
+
+
+def parameters_from_saved(raw):
+    """
+    Restores simulation parameters saved by save_simulation_simple.
+    JSON turns the per-device dict keys into strings; they are mapped
+    back to device ids so the run can be replayed exactly.
+    """
+    parameters = json.loads(raw) if isinstance(raw, str) else dict(raw or {})
+    for key in ('device_utilization_rates', 'price_changes', 'maintenance_downtime'):
+        values = parameters.get(key) or {}
+        parameters[key] = {int(k): float(v) for k, v in values.items()}
+    if parameters.get('fitted_demand'):
+        parameters['fitted_demand'] = {
+            int(k): {name: float(value) for name, value in v.items()}
+            for k, v in parameters['fitted_demand'].items()
+        }
+    return parameters
+
+
+def capped_runs(runs, devices):
+    """Runs per device, within MAX_SIMULATION_RUNS and MAX_SIMULATION_DRAWS for `devices` rows"""
+    runs = max(1, min(int(runs), MAX_SIMULATION_RUNS))
+    return max(1, min(runs, MAX_SIMULATION_DRAWS // max(1, devices)))
+
+
+def simulate_device_batch(device_ids, means, unit_margins, fixed_costs, dispersions, runs, seed,
+                          keep_samples=False):
+    """
+    Monte Carlo core for one batch of devices. Draws each device's monthly
+    treatment counts from its own seeded stream with its own
+    negative-binomial dispersion and reduces them to per-device statistics
+    one device at a time, so memory is O(runs) per batch.
+    With keep_samples the (devices x runs) count matrix is also returned as
+    'treatments' (callers bound its size with capped_runs).
+    Works on plain arrays only, so it can run in a worker process.
+    """
+    streams = SimulationStreams(seed)
+    p = dispersions / (dispersions + means)
+
+    n = len(device_ids)
+    stats = {
+        'mean_treatments': np.empty(n),
+        'expected_profit': np.empty(n),
+        'probability_loss': np.empty(n),
+        'profit_percentiles': np.empty((len(PROFIT_PERCENTILES), n))
+    }
+    if keep_samples:
+        stats['treatments'] = np.empty((n, runs), dtype=np.int64)
+
+    for i, device_id in enumerate(device_ids):
+        rng = streams.for_device(device_id)
+        treatments = rng.negative_binomial(dispersions[i], p[i], size=runs)
+        profits = treatments * unit_margins[i] - fixed_costs[i]
+        stats['mean_treatments'][i] = treatments.mean()
+        stats['expected_profit'][i] = profits.mean()
+        stats['probability_loss'][i] = (profits < 0).mean()
+        stats['profit_percentiles'][:, i] = np.percentile(profits, PROFIT_PERCENTILES)
+        if keep_samples:
+            stats['treatments'][i] = treatments
+    return stats
+
+
+def summarize_results(results):
+    """Builds the stored results summary (totals plus per-device figures)"""
+    device_list = []
+    for result in results:
+        device_data = {
+            'device_name': result.get('device_name', 'Unknown Device'),
+            'expected_profit': float(result.get('expected_profit', 0)),
+            'gross_margin': float(result.get('gross_margin', 0)),
+            'expected_revenue': float(result.get('expected_revenue', 0)),
+            'expected_cost': float(result.get('expected_cost', 0)),
+            'expected_treatments': float(result.get('expected_treatments', 0)),
+            'current_price': float(result.get('current_price', 0)),
+            'variable_cost_per_use': float(result.get('variable_cost_per_use', 0)),
+            'fixed_monthly_cost': float(result.get('fixed_monthly_cost', 0)),
+            'probability_loss': float(result.get('probability_loss', 0)),
+            'risk_level': result.get('risk_level', 'medium'),
+            'breakeven_treatments': float(result.get('breakeven_treatments', 0)) if result.get('breakeven_treatments') else None,
+            'profit_p5': float(result.get('profit_p5', 0)),
+            'profit_p50': float(result.get('profit_p50', 0)),
+            'profit_p95': float(result.get('profit_p95', 0))
+        }
+        device_list.append(device_data)
+
+    return {
+        "device_count": len(device_list),
+        "total_revenue": sum(d['expected_revenue'] for d in device_list),
+        "total_profit": sum(d['expected_profit'] for d in device_list),
+        "devices": device_list
+    }
+
+
+def summary_columns(summary):
+    """Simulation summary column values for a summarize_results() dict"""
+    devices = summary.get("devices") or []
+    risk_levels = [d.get("risk_level") for d in devices]
+    # Stored blobs may hold nulls; the columns never do
+    return {
+        "device_count": int(summary.get("device_count") or len(devices)),
+        "total_revenue": float(summary.get("total_revenue") or 0),
+        "total_profit": float(summary.get("total_profit") or 0),
+        "high_risk_count": risk_levels.count("high"),
+        "medium_risk_count": risk_levels.count("medium"),
+        "low_risk_count": risk_levels.count("low")
+    }
+
 
 class EnhancedSimulation:
-    def __init__(self, hospital_id, devices, treatments):
+    def __init__(self, hospital_id, devices, treatments, workers=1,
+                 parallel_min_draws=PARALLEL_MIN_DRAWS, keep_samples=False):
         self.hospital_id = hospital_id
         self.devices = devices
         self.treatments = treatments
-        
-    def simulate_month_with_parameters(self, params):
-        results = []
-        
+        self.workers = max(1, int(workers or 1))
+        self.parallel_min_draws = parallel_min_draws
+        self.worker_timings = []
+
+        # With keep_samples, the last run's per-scenario draws (see simulate_scenarios)
+        self.keep_samples = keep_samples
+        self.samples = []
+
+    def _device_inputs(self, params):
+        """
+        Collects per-device inputs as aligned NumPy arrays.
+        Devices with no expected treatments are dropped.
+
+        Devices in params['fitted_demand'] (see demand_model_service) start
+        from their fitted monthly mean and dispersion instead of
+        base_treatments_per_month x utilization and NB_DISPERSION.
+        """
+        active = []
+        means = []
+        prices = []
+        variable_costs = []
+        fixed_costs = []
+        dispersions = []
+        fitted_demand = params.get('fitted_demand') or {}
+
         for device in self.devices:
             device_id = device.device_id
-            
+
             # Calculate actual treatments for this device
-            avg_treatments = params['base_treatments_per_month'] * params['device_utilization_rates'].get(device_id, 0)
-            
+            fitted = fitted_demand.get(device_id)
+            if fitted:
+                avg_treatments = fitted['mean']
+            else:
+                avg_treatments = params['base_treatments_per_month'] * params['device_utilization_rates'].get(device_id, 0)
+
             # Apply seasonality
             avg_treatments *= params['seasonality_factor']
-            
+
             # Apply maintenance downtime
             availability = 1 - params['maintenance_downtime'].get(device_id, 0)
             avg_treatments *= availability
-            
+
             # Skip if no treatments expected
             if avg_treatments <= 0:
                 continue
-                
-            revenues = []
-            profits = []
-            costs = []
-            
-            simulation_runs = min(params.get('simulation_runs', 100), 100)
-            
-            for _ in range(simulation_runs):
-                # Use negative binomial
-                treatments_this_month = np.random.negative_binomial(
-                    n=10,
-                    p=10/(10 + avg_treatments)
-                )
-                
-                # Calculate per treatment
-                price = float(device.price_per_use) * params['price_changes'].get(device_id, 1.0)
-                direct_cost = float(device.cost_per_use)
-                doctor_cost_per_min = float(device.doctor_hourly_wage) / 60
-                nurse_cost_per_min = float(device.nurse_hourly_wage) / 60
-                staff_cost = (doctor_cost_per_min * device.doctor_minutes) + (nurse_cost_per_min * device.nurse_minutes)
-                
-                # Add fixed monthly costs
-                fixed_monthly_cost = float(device.base_machine_cost) / 60 if hasattr(device, 'base_machine_cost') else 0
-                
-                revenue = treatments_this_month * price
-                total_cost = (treatments_this_month * (direct_cost + staff_cost)) + fixed_monthly_cost
-                profit = revenue - total_cost
-                
-                revenues.append(float(revenue))
-                costs.append(float(total_cost))
-                profits.append(float(profit))
-            
-            # Calculate financial metrics
-            expected_treatments = float(avg_treatments)
-            expected_revenue = float(np.mean(revenues)) if revenues else 0.0
-            expected_cost = float(np.mean(costs)) if costs else 0.0
-            expected_profit = float(np.mean(profits)) if profits else 0.0
-            
+
+            price = float(device.price_per_use) * params['price_changes'].get(device_id, 1.0)
+            direct_cost = float(device.cost_per_use)
+            doctor_cost_per_min = float(device.doctor_hourly_wage) / 60
+            nurse_cost_per_min = float(device.nurse_hourly_wage) / 60
+            staff_cost = (doctor_cost_per_min * device.doctor_minutes) + (nurse_cost_per_min * device.nurse_minutes)
+
+            # Fixed monthly costs
+            fixed_monthly_cost = float(device.base_machine_cost) / 60 if hasattr(device, 'base_machine_cost') else 0
+
+            active.append(device)
+            means.append(avg_treatments)
+            prices.append(price)
+            variable_costs.append(direct_cost + staff_cost)
+            fixed_costs.append(fixed_monthly_cost)
+            dispersions.append(fitted['dispersion'] if fitted else NB_DISPERSION)
+
+        return (
+            active,
+            np.asarray(means, dtype=float),
+            np.asarray(prices, dtype=float),
+            np.asarray(variable_costs, dtype=float),
+            np.asarray(fixed_costs, dtype=float),
+            np.asarray(dispersions, dtype=float),
+        )
+
+    def _run_batches(self, tasks, runs, seed):
+        """
+        Runs one batch task per scenario, serially or on the process pool.
+        Each task is (device_ids, means, unit_margins, fixed_costs, dispersions); the
+        merged per-device statistics come back in task order.
+        """
+        draws = sum(len(task[0]) for task in tasks) * runs
+        if self.workers > 1 and draws >= self.parallel_min_draws:
+            from app.services.parallel_simulation import run_batches
+            stats, self.worker_timings = run_batches(tasks, runs, seed, self.workers, self.keep_samples)
+            return stats
+
+        started = time.perf_counter()
+        stats = [simulate_device_batch(*task, runs, seed, self.keep_samples) for task in tasks]
+        self.worker_timings = [{
+            'worker': 'main',
+            'batches': len(tasks),
+            'devices': sum(len(task[0]) for task in tasks),
+            'seconds': time.perf_counter() - started
+        }]
+        return stats
+
+    def _batch_task(self, inputs):
+        devices, means, prices, variable_costs, fixed_costs, dispersions = inputs
+        device_ids = np.asarray([device.device_id for device in devices], dtype=np.int64)
+        return (device_ids, means, prices - variable_costs, fixed_costs, dispersions)
+
+    def _build_results(self, inputs, stats, runs):
+        devices, means, prices, variable_costs, fixed_costs, dispersions = inputs
+
+        # Revenue and cost are linear in the treatment count, so their means
+        # come straight from the mean count; only profit needs the full matrix.
+        mean_treatments = stats['mean_treatments']
+        expected_revenue = mean_treatments * prices
+        expected_cost = mean_treatments * variable_costs + fixed_costs
+        expected_profit = stats['expected_profit']
+        probability_loss = stats['probability_loss']
+        profit_percentiles = stats['profit_percentiles']
+
+        results = []
+        for i, device in enumerate(devices):
+            price = prices[i]
+            variable_cost_per_use = variable_costs[i]
+            fixed_monthly_cost = fixed_costs[i]
+
             # Calculate profit margin
-            variable_cost_per_use = direct_cost + staff_cost
             gross_margin = (price - variable_cost_per_use) / price if price > 0 else 0
-            
-            # Probability of loss
-            probability_loss = float(np.mean([1 if p < 0 else 0 for p in profits])) if profits else 0.0
-            
-            # Risk level
-            if probability_loss >= 0.3:
-                risk_level = 'high'
-            elif probability_loss >= 0.1:
-                risk_level = 'medium'
-            else:
-                risk_level = 'low'
-            
+
             # Breakeven
             if price > variable_cost_per_use:
                 breakeven = float(fixed_monthly_cost / (price - variable_cost_per_use))
             else:
                 breakeven = None
-            
+
             device_results = {
-                'device_id': device_id,
+                'device_id': device.device_id,
                 'device_name': device.device_type,
-                'expected_treatments': expected_treatments,
-                'expected_revenue': expected_revenue,
-                'expected_cost': expected_cost,
-                'expected_profit': expected_profit,
+                'expected_treatments': float(means[i]),
+                'expected_revenue': float(expected_revenue[i]),
+                'expected_cost': float(expected_cost[i]),
+                'expected_profit': float(expected_profit[i]),
                 'current_price': float(price),
                 'variable_cost_per_use': float(variable_cost_per_use),
                 'fixed_monthly_cost': float(fixed_monthly_cost),
                 'gross_margin': float(gross_margin),
-                'probability_loss': probability_loss,
-                'risk_level': risk_level,
-                'breakeven_treatments': breakeven
+                'probability_loss': float(probability_loss[i]),
+                'risk_level': classify_risk(probability_loss[i]),
+                'breakeven_treatments': breakeven,
+                'profit_p5': float(profit_percentiles[0, i]),
+                'profit_p50': float(profit_percentiles[1, i]),
+                'profit_p95': float(profit_percentiles[2, i]),
+                'demand_dispersion': float(dispersions[i]),
+                'simulation_runs': runs
             }
             results.append(device_results)
-        
+
         return results
-    
-    def optimize_prices(self, simulation_results, target_margin=0.20, elasticity=-0.3):
-        recommendations = []
-        
-        if not simulation_results:
-            return recommendations
-        
-        for result in simulation_results:
-            device_name = result.get('device_name', 'Unknown')
-            current_price = result.get('current_price', 0)
-            variable_cost = result.get('variable_cost_per_use', 0)
-            
-            # Skip invalid data
-            if current_price <= 0 or variable_cost <= 0:
+
+    def simulate_month_with_parameters(self, params):
+        return self.simulate_scenarios(params, [{}])[0]
+
+    def simulate_scenarios(self, params, scenarios):
+        """
+        Simulates a grid of scenarios, each a dict of parameter overrides
+        (for example a different 'price_changes' map). All scenarios share
+        the base seed, so they are compared on common random numbers.
+        Returns one result list per scenario, in input order.
+
+        With keep_samples, self.samples holds one entry per scenario (None
+        when it has no active devices) with the device ids, unit margins,
+        fixed costs and the (devices x runs) treatment count matrix.
+        """
+        # Record the seed so the run can be replayed from its saved parameters
+        streams = SimulationStreams(params.get('seed'))
+        params['seed'] = streams.seed
+
+        scenario_inputs = []
+        for overrides in scenarios:
+            scenario_params = dict(params)
+            scenario_params.update(overrides)
+            scenario_inputs.append(self._device_inputs(scenario_params))
+
+        self.samples = []
+        active = [inputs for inputs in scenario_inputs if inputs[0]]
+        if not active:
+            self.worker_timings = []
+            return [[] for _ in scenarios]
+
+        # Capped on every scenario's devices, so stored samples stay bounded
+        # and results do not depend on keep_samples
+        runs = capped_runs(params.get('simulation_runs', 100), sum(len(inputs[0]) for inputs in active))
+
+        tasks = [self._batch_task(inputs) for inputs in active]
+        stats = iter(self._run_batches(tasks, runs, streams.seed))
+        tasks = iter(tasks)
+
+        results = []
+        for inputs in scenario_inputs:
+            if not inputs[0]:
+                results.append([])
+                if self.keep_samples:
+                    self.samples.append(None)
                 continue
-            
-            current_margin = (current_price - variable_cost) / current_price
-            
-            # Only recommend if margin is below target
-            if current_margin < target_margin:
-                required_price = variable_cost / (1 - target_margin)
-                
-                # Skip unreasonable recommendations
-                if required_price <= 0 or required_price > current_price * 5:
-                    continue
-                
-                price_change_pct = ((required_price / current_price) - 1) * 100
-                demand_change_pct = elasticity * price_change_pct
-                
-                recommendations.append({
-                    'device_name': device_name,
-                    'current_price': current_price,
-                    'recommended_price': required_price,
-                    'current_margin': current_margin * 100,
-                    'target_margin': target_margin * 100,
-                    'price_change_pct': price_change_pct,
-                    'demand_change_pct': demand_change_pct
+
+            task, scenario_stats = next(tasks), next(stats)
+            results.append(self._build_results(inputs, scenario_stats, runs))
+            if self.keep_samples:
+                device_ids, _, unit_margins, fixed_costs, _ = task
+                self.samples.append({
+                    'device_ids': device_ids,
+                    'unit_margins': unit_margins,
+                    'fixed_costs': fixed_costs,
+                    'treatments': scenario_stats['treatments']
                 })
-        
-        return recommendations
+        return results
+
+    def simulate_portfolio(self, params, common_share=None):
+        """
+        Hospital-wide risk with correlated demand (see portfolio_risk).
+        Uses the same inputs and seed as the monthly simulation (runs capped
+        by MAX_SIMULATION_DRAWS) and returns the total profit distribution, VaR/CVaR and per-device
+        risk contributions, or None when no device is active.
+        """
+        streams = SimulationStreams(params.get('seed'))
+        params['seed'] = streams.seed
+
+        if common_share is None:
+            common_share = params.get('common_share', DEFAULT_COMMON_SHARE)
+
+        devices, means, prices, variable_costs, fixed_costs, dispersions = self._device_inputs(params)
+        if not devices:
+            return None
+
+        # The (runs x devices) profit matrix is kept whole
+        runs = capped_runs(params.get('simulation_runs', 100), len(devices))
+
+        device_ids = [device.device_id for device in devices]
+        profits, _ = draw_portfolio_profits(
+            device_ids, means, prices - variable_costs, fixed_costs,
+            runs, streams.seed, dispersions, common_share
+        )
+
+        stats = portfolio_stats(profits, device_ids, [device.device_type for device in devices])
+        stats['common_share'] = float(common_share)
+        return stats
+
+    def simulate_horizon(self, params, progress=None):
+        """
+        Multi-month forecast (see horizon_simulation). On top of the monthly
+        parameters it reads:
+          - horizon_months: 1..HORIZON_MAX_MONTHS
+          - horizon_start: 'YYYY-MM' of the first month (default: next month)
+          - seasonality_curve: 12 calendar-month factors or one per month
+          - downtime_schedule: {device_id: {month: downtime}}, one month each
+          - price_schedule: {device_id: {month: multiplier}}, held until the next change
+        maintenance_downtime and price_changes are the defaults for
+        unscheduled months. `progress(runs_done, runs)` is called after every
+        chunk of runs. Returns a summarize_results()-style dict with the
+        trajectory under 'horizon'.
+        """
+        runs = int(params.get('simulation_runs', 100))
+        runs = max(1, min(runs, MAX_SIMULATION_RUNS))
+        months = int(params.get('horizon_months', HORIZON_DEFAULT_MONTHS))
+        months = max(1, min(months, HORIZON_MAX_MONTHS))
+
+        streams = SimulationStreams(params.get('seed'))
+        params['seed'] = streams.seed
+
+        start = params.get('horizon_start')
+        if start:
+            start = datetime.strptime(start, '%Y-%m')
+        else:
+            today = datetime.utcnow()
+            start = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+            params['horizon_start'] = start.strftime('%Y-%m')
+
+        # Baseline demand and prices; seasonality, downtime and price moves are per month
+        baseline = dict(params, seasonality_factor=1.0, maintenance_downtime={}, price_changes={})
+        devices, means, prices, variable_costs, fixed_costs, dispersions = self._device_inputs(baseline)
+        if not devices:
+            return {"device_count": 0, "total_revenue": 0, "total_profit": 0, "devices": []}
+
+        device_ids = [device.device_id for device in devices]
+        downtime = [params['maintenance_downtime'].get(device_id, 0) for device_id in device_ids]
+        price_changes = [params['price_changes'].get(device_id, 1.0) for device_id in device_ids]
+
+        stats = simulate_horizon(
+            device_ids, means, prices, variable_costs, fixed_costs,
+            months, runs, streams.seed, dispersions,
+            seasonality=seasonality_curve(params.get('seasonality_curve'), start.month, months),
+            availability=1 - schedule_matrix(params.get('downtime_schedule'), device_ids, months, downtime),
+            price_multipliers=schedule_matrix(params.get('price_schedule'), device_ids, months, price_changes,
+                                              carry_forward=True),
+            progress=progress
+        )
+
+        labels = month_labels(start, months)
+        monthly = []
+        for m, label in enumerate(labels):
+            p_month = stats['monthly_percentiles'][m]
+            p_cumulative = stats['cumulative_percentiles'][m]
+            monthly.append({
+                'month': label,
+                'mean_profit': float(stats['monthly_mean'][m]),
+                'std_profit': float(stats['monthly_std'][m]),
+                'profit_p5': float(p_month[0]),
+                'profit_p50': float(p_month[1]),
+                'profit_p95': float(p_month[2]),
+                'revenue': float(stats['device_revenue'][m].sum()),
+                'treatments': float(stats['device_treatments'][m].sum()),
+                'cumulative_mean': float(stats['cumulative_mean'][m]),
+                'cumulative_p5': float(p_cumulative[0]),
+                'cumulative_p50': float(p_cumulative[1]),
+                'cumulative_p95': float(p_cumulative[2])
+            })
+
+        device_list = []
+        for j, device in enumerate(devices):
+            probability_loss = float(stats['device_probability_loss'][j])
+            device_list.append({
+                'device_id': device.device_id,
+                'device_name': device.device_type,
+                'expected_profit': float(stats['device_profit'][:, j].sum()),
+                'expected_revenue': float(stats['device_revenue'][:, j].sum()),
+                'expected_treatments': float(stats['device_treatments'][:, j].sum()),
+                'current_price': float(prices[j]),
+                'variable_cost_per_use': float(variable_costs[j]),
+                'fixed_monthly_cost': float(fixed_costs[j]),
+                'gross_margin': float((prices[j] - variable_costs[j]) / prices[j]) if prices[j] > 0 else 0.0,
+                'probability_loss': probability_loss,
+                'risk_level': classify_risk(probability_loss)
+            })
+
+        return {
+            "device_count": len(device_list),
+            "total_revenue": sum(d['expected_revenue'] for d in device_list),
+            "total_profit": sum(d['expected_profit'] for d in device_list),
+            "devices": device_list,
+            "horizon": {
+                "months": months,
+                "runs": runs,
+                "start": labels[0],
+                "probability_loss": float(stats['probability_horizon_loss']),
+                "monthly": monthly
+            }
+        }
+
+    def optimize_prices(self, simulation_results, target_margin=0.20, elasticity=DEFAULT_ELASTICITY,
+                        seed=None, max_loss_probability=None, multipliers=PRICE_MULTIPLIERS):
+        """
+        Searches a grid of price multipliers per device (see price_optimizer)
+        and recommends the profit-maximizing price whose margin meets
+        target_margin and, if given, whose probability of a monthly loss is
+        at most max_loss_probability. Pass the simulation seed to make the
+        recommendations reproducible.
+        """
+        if not simulation_results:
+            return []
+
+        return optimize_portfolio(
+            simulation_results,
+            target_margin=target_margin,
+            elasticity=elasticity,
+            max_loss_probability=max_loss_probability,
+            multipliers=multipliers,
+            seed=seed,
+            dispersion=NB_DISPERSION
+        )
     
     def save_simulation_simple(self, parameters, results, recommendations=None):
         """Save simulation results with correct field names"""
@@ -156,45 +520,27 @@ class EnhancedSimulation:
             if not results or len(results) == 0:
                 return None
             
-            # Transform device data
-            device_list = []
-            for result in results:
-                device_data = {
-                    'device_name': result.get('device_name', 'Unknown Device'),
-                    'expected_profit': float(result.get('expected_profit', 0)),
-                    'gross_margin': float(result.get('gross_margin', 0)),
-                    'expected_revenue': float(result.get('expected_revenue', 0)),
-                    'expected_cost': float(result.get('expected_cost', 0)),
-                    'expected_treatments': float(result.get('expected_treatments', 0)),
-                    'current_price': float(result.get('current_price', 0)),
-                    'variable_cost_per_use': float(result.get('variable_cost_per_use', 0)),
-                    'fixed_monthly_cost': float(result.get('fixed_monthly_cost', 0)),
-                    'probability_loss': float(result.get('probability_loss', 0)),
-                    'risk_level': result.get('risk_level', 'medium'),
-                    'breakeven_treatments': float(result.get('breakeven_treatments', 0)) if result.get('breakeven_treatments') else None
-                }
-                device_list.append(device_data)
+            # Identical inputs already saved: reuse that row
+            fingerprint = simulation_fingerprint(self.hospital_id, parameters)
+            existing = find_simulation(self.hospital_id, fingerprint)
+            if existing is not None:
+                return existing.simulation_id
             
-            total_revenue = sum(d['expected_revenue'] for d in device_list)
-            total_profit = sum(d['expected_profit'] for d in device_list)
-            
-            summary = {
-                "device_count": len(device_list),
-                "total_revenue": total_revenue,
-                "total_profit": total_profit,
-                "devices": device_list
-            }
+            summary = summarize_results(results)
             
             simulation = Simulation(
                 hospital_id=self.hospital_id,
                 simulation_type="revenue_forecast",
                 parameters=json.dumps(parameters, default=str),
                 results=json.dumps(summary, default=str),
-                recommendations=json.dumps(recommendations, default=str) if recommendations else None
+                recommendations=json.dumps(recommendations, default=str) if recommendations else None,
+                fingerprint=fingerprint,
+                **summary_columns(summary)
             )
             
             db.session.add(simulation)
             db.session.commit()
+            remember(self.hospital_id, fingerprint, simulation.simulation_id)
             return simulation.simulation_id
             
         except Exception as e:
@@ -214,7 +560,8 @@ class EnhancedSimulation:
                 simulation_type="revenue_forecast",
                 parameters=json.dumps({"ran": True, "timestamp": datetime.utcnow().isoformat()}, default=str),
                 results=json.dumps({"device_count": len(results)}, default=str),
-                recommendations=None
+                recommendations=None,
+                device_count=len(results)
             )
             
             db.session.add(simulation)
@@ -236,40 +583,15 @@ def save_simulation_standalone(hospital_id, parameters, results, recommendations
         if not results or len(results) == 0:
             return None
         
-        device_list = []
-        for result in results:
-            device_data = {
-                'device_name': result.get('device_name', 'Unknown Device'),
-                'expected_profit': float(result.get('expected_profit', 0)),
-                'gross_margin': float(result.get('gross_margin', 0)),
-                'expected_revenue': float(result.get('expected_revenue', 0)),
-                'expected_cost': float(result.get('expected_cost', 0)),
-                'expected_treatments': float(result.get('expected_treatments', 0)),
-                'current_price': float(result.get('current_price', 0)),
-                'variable_cost_per_use': float(result.get('variable_cost_per_use', 0)),
-                'fixed_monthly_cost': float(result.get('fixed_monthly_cost', 0)),
-                'probability_loss': float(result.get('probability_loss', 0)),
-                'risk_level': result.get('risk_level', 'medium'),
-                'breakeven_treatments': float(result.get('breakeven_treatments', 0)) if result.get('breakeven_treatments') else None
-            }
-            device_list.append(device_data)
-        
-        total_revenue = sum(d['expected_revenue'] for d in device_list)
-        total_profit = sum(d['expected_profit'] for d in device_list)
-        
-        summary = {
-            "device_count": len(device_list),
-            "total_revenue": total_revenue,
-            "total_profit": total_profit,
-            "devices": device_list
-        }
+        summary = summarize_results(results)
         
         simulation = Simulation(
             hospital_id=hospital_id,
             simulation_type="revenue_forecast",
             parameters=json.dumps(parameters, default=str),
             results=json.dumps(summary, default=str),
-            recommendations=json.dumps(recommendations, default=str) if recommendations else None
+            recommendations=json.dumps(recommendations, default=str) if recommendations else None,
+            **summary_columns(summary)
         )
         
         db.session.add(simulation)
@@ -0,0 +1,118 @@
+# app/services/simulation_history_service.py
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import load_only
+
+from app import db
+from app.models.simulations import Simulation
+from app.services.simulation_engine import summary_columns
+
+SIMULATION_PAGE_SIZE = 25
+
+# Columns the history listing shows; the JSON blobs are never loaded
+_LISTING_COLUMNS = (
+    Simulation.simulation_id, Simulation.hospital_id, Simulation.simulation_date,
+    Simulation.simulation_type, Simulation.status, Simulation.progress,
+    Simulation.error_message, Simulation.device_count, Simulation.total_revenue,
+    Simulation.total_profit, Simulation.high_risk_count, Simulation.medium_risk_count,
+    Simulation.low_risk_count
+)
+
+
+def encode_cursor(simulation):
+    """Keyset cursor for the page after this (last shown) simulation"""
+    stamp = simulation.simulation_date.isoformat() if simulation.simulation_date else ""
+    return f"{stamp}|{simulation.simulation_id}"
+
+
+def decode_cursor(cursor):
+    """Returns (simulation_date or None, simulation_id), or None for a missing/garbled cursor"""
+    try:
+        stamp, simulation_id = cursor.split("|", 1)
+        return (datetime.fromisoformat(stamp) if stamp else None), int(simulation_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def list_simulations(hospital_id, cursor=None, page_size=SIMULATION_PAGE_SIZE):
+    """
+    One page of a hospital's simulations, newest first, using keyset
+    pagination on (simulation_date, simulation_id) and the summary columns.
+
+    Returns (simulations, next_cursor); next_cursor is None on the last page.
+    """
+    query = Simulation.query.options(load_only(*_LISTING_COLUMNS)).filter(
+        Simulation.hospital_id == hospital_id
+    )
+
+    position = decode_cursor(cursor)
+    if position:
+        simulation_date, simulation_id = position
+        if simulation_date is None:
+            query = query.filter(
+                Simulation.simulation_date.is_(None),
+                Simulation.simulation_id < simulation_id
+            )
+        else:
+            query = query.filter(or_(
+                Simulation.simulation_date < simulation_date,
+                and_(Simulation.simulation_date == simulation_date, Simulation.simulation_id < simulation_id),
+                Simulation.simulation_date.is_(None)
+            ))
+
+    # MySQL and SQLite sort NULL timestamps last in descending order
+    rows = query.order_by(
+        Simulation.simulation_date.desc(),
+        Simulation.simulation_id.desc()
+    ).limit(page_size + 1).all()
+
+    simulations = rows[:page_size]
+    next_cursor = encode_cursor(simulations[-1]) if len(rows) > page_size else None
+    return simulations, next_cursor
+
+
+def simulation_stats(hospital_id):
+    """Count and most recent date of a hospital's simulations"""
+    count, latest = db.session.query(
+        func.count(Simulation.simulation_id),
+        func.max(Simulation.simulation_date)
+    ).filter(Simulation.hospital_id == hospital_id).one()
+    return {"count": count, "latest": latest}
+
+
+def backfill_summaries(batch_size=500):
+    """
+    Fills the summary columns of simulations saved before they existed.
+    Walks the table once by simulation_id (keyset), so a row whose blob
+    still yields no summary is not selected again; returns the number of
+    rows updated.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(Simulation.simulation_id, Simulation.results).filter(
+            Simulation.simulation_id > last_id,
+            Simulation.device_count.is_(None),
+            Simulation.results.isnot(None)
+        ).order_by(Simulation.simulation_id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        mappings = []
+        for simulation_id, raw in rows:
+            try:
+                summary = json.loads(raw) if isinstance(raw, str) else (raw or {})
+            except ValueError:
+                summary = {}
+            values = summary_columns(summary if isinstance(summary, dict) else {})
+            values["simulation_id"] = simulation_id
+            mappings.append(values)
+
+        db.session.bulk_update_mappings(Simulation, mappings)
+        db.session.commit()
+        updated += len(mappings)
+
+    return updated
@@ -0,0 +1,323 @@
+# app/services/simulation_jobs.py
+import json
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models.device import Device
+from app.models.simulations import Simulation
+from app.models.treatment import Treatment
+from app.services.distribution_store import store_distribution
+from app.services.price_optimizer import DEFAULT_ELASTICITY
+from app.services.simulation_cache import (
+    ACTIVE_STATUSES, find_simulation, remember, simulation_fingerprint, stale_job_cutoff
+)
+from app.services.simulation_engine import (
+    EnhancedSimulation, parameters_from_saved, summarize_results, summary_columns
+)
+
+# Seconds between heartbeats of the jobs this process holds (keep well
+# under SIMULATION_JOB_STALE_SECONDS)
+HEARTBEAT_SECONDS = 30
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# simulation_id -> app of every job queued or running in this process
+_jobs = {}
+_heartbeat = None
+
+
+class SimulationCancelled(Exception):
+    """Raised inside a job once its row has been marked cancelled"""
+
+
+def _get_executor(workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="simulation-job")
+        return _executor
+
+
+def _start_heartbeat():
+    global _heartbeat
+    with _executor_lock:
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_heartbeat_loop, name="simulation-heartbeat", daemon=True)
+            _heartbeat.start()
+
+
+def _heartbeat_loop():
+    # Jobs only live in this process's pool; the heartbeat tells other
+    # processes (and the next startup) which queued/running rows are alive
+    while True:
+        time.sleep(HEARTBEAT_SECONDS)
+        with _executor_lock:
+            jobs = list(_jobs.items())
+        by_app = {}
+        for simulation_id, app in jobs:
+            by_app.setdefault(app, []).append(simulation_id)
+        for app, simulation_ids in by_app.items():
+            with app.app_context():
+                try:
+                    Simulation.query.filter(
+                        Simulation.simulation_id.in_(simulation_ids),
+                        Simulation.status.in_(ACTIVE_STATUSES)
+                    ).update({"heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+                    db.session.commit()
+                except SQLAlchemyError as e:
+                    db.session.rollback()
+                    print(f"Simulation heartbeat failed: {e}")
+                finally:
+                    db.session.remove()
+
+
+def recover_stale_jobs():
+    """
+    Fails queued/running rows whose job stopped sending heartbeats, i.e.
+    whose process exited before finishing them. Called at startup.
+    Returns the number of rows failed.
+    """
+    if not db.inspect(db.engine).has_table(Simulation.__tablename__):
+        return 0  # fresh database, tables not created yet
+    now = datetime.utcnow()
+    updated = Simulation.query.filter(
+        Simulation.status.in_(ACTIVE_STATUSES),
+        or_(Simulation.heartbeat_at.is_(None), Simulation.heartbeat_at < stale_job_cutoff())
+    ).update({
+        "status": "failed",
+        "error_message": "Interrupted: the server restarted before the simulation finished",
+        "completed_at": now
+    }, synchronize_session=False)
+    db.session.commit()
+    return updated
+
+
+def recover_at_startup(app):
+    """
+    Runs recover_stale_jobs once for a starting server (see run.py) when
+    SIMULATION_RECOVER_JOBS_ON_START is set. Errors are logged, never
+    raised, so a database problem does not keep the server from starting.
+    """
+    if not app.config.get("SIMULATION_RECOVER_JOBS_ON_START", True):
+        return
+    with app.app_context():
+        try:
+            failed = recover_stale_jobs()
+            if failed:
+                print(f"Marked {failed} interrupted simulation jobs as failed")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Could not check for interrupted simulation jobs: {e}")
+        finally:
+            db.session.remove()
+
+
+def _update_active(simulation_id, **values):
+    """
+    Updates a job row only while it is still queued/running. The database
+    row is the source of truth for cancellation, so a job that finds its
+    row cancelled stops at the next checkpoint.
+    """
+    values["heartbeat_at"] = datetime.utcnow()
+    updated = Simulation.query.filter(
+        Simulation.simulation_id == simulation_id,
+        Simulation.status.in_(ACTIVE_STATUSES)
+    ).update(values, synchronize_session=False)
+    db.session.commit()
+    if not updated:
+        raise SimulationCancelled(simulation_id)
+
+
+def build_simulator(hospital_id, devices, treatments):
+    """Creates an EnhancedSimulation using the configured worker pool settings"""
+    return EnhancedSimulation(
+        hospital_id,
+        devices,
+        treatments,
+        workers=current_app.config.get("SIMULATION_WORKERS", 1),
+        parallel_min_draws=current_app.config.get("SIMULATION_PARALLEL_MIN_DRAWS", 2000000),
+        keep_samples=current_app.config.get("SIMULATION_STORE_DISTRIBUTIONS", True)
+    )
+
+
+def _store_samples(simulator, summary):
+    """
+    Saves the run's treatment count matrix (if kept) and records what the
+    reader needs to turn it into profits under summary["distribution"].
+    Returns the storage key, or None.
+    """
+    samples = simulator.samples[0] if simulator.samples else None
+    if samples is None:
+        return None
+
+    try:
+        key = store_distribution(samples['treatments'])
+    except OSError as e:
+        print(f"Could not store simulation distribution: {e}")
+        return None
+
+    summary["distribution"] = {
+        "key": key,
+        "device_ids": samples['device_ids'].tolist(),
+        "unit_margins": samples['unit_margins'].tolist(),
+        "fixed_costs": samples['fixed_costs'].tolist()
+    }
+    return key
+
+
+def run_simulation_job(simulation_id):
+    """Runs a queued simulation and stores its results on the same row"""
+    simulation = Simulation.query.get(simulation_id)
+    if simulation is None:
+        return
+
+    try:
+        _update_active(simulation_id, status="running", progress=5)
+
+        parameters = parameters_from_saved(simulation.parameters)
+        devices = Device.query.filter_by(hospital_id=simulation.hospital_id).all()
+        treatments = Treatment.query.filter_by(hospital_id=simulation.hospital_id).all()
+        simulator = build_simulator(simulation.hospital_id, devices, treatments)
+
+        if simulation.simulation_type == "horizon_forecast":
+            # Checkpoint per chunk: progress 5-95%, and a cancelled row stops the run
+            summary = simulator.simulate_horizon(
+                parameters,
+                progress=lambda done, total: _update_active(simulation_id, progress=5 + int(90 * done / total))
+            )
+            recommendations = None
+            distribution_key = None
+        else:
+            results = simulator.simulate_month_with_parameters(parameters)
+            _update_active(simulation_id, progress=70)
+
+            recommendations = simulator.optimize_prices(
+                results,
+                parameters.get('target_margin', 0.20),
+                elasticity=parameters.get('elasticity', DEFAULT_ELASTICITY),
+                seed=parameters.get('seed'),
+                max_loss_probability=parameters.get('max_loss_probability')
+            )
+            _update_active(simulation_id, progress=85)
+
+            summary = summarize_results(results)
+            summary["worker_timings"] = simulator.worker_timings
+            if parameters.get('portfolio_mode'):
+                summary["portfolio"] = simulator.simulate_portfolio(parameters)
+            distribution_key = _store_samples(simulator, summary)
+
+        _update_active(
+            simulation_id,
+            parameters=json.dumps(parameters, default=str),
+            results=json.dumps(summary, default=str),
+            recommendations=json.dumps(recommendations, default=str) if recommendations else None,
+            status="completed",
+            progress=100,
+            completed_at=datetime.utcnow(),
+            distribution_key=distribution_key,
+            **summary_columns(summary)
+        )
+
+    except SimulationCancelled:
+        db.session.rollback()
+
+    except Exception as e:
+        db.session.rollback()
+        traceback.print_exc()
+        Simulation.query.filter_by(simulation_id=simulation_id).update({
+            "status": "failed",
+            "error_message": str(e)[:1000],
+            "completed_at": datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+
+
+def _run_in_context(app, simulation_id):
+    with app.app_context():
+        try:
+            run_simulation_job(simulation_id)
+        finally:
+            with _executor_lock:
+                _jobs.pop(simulation_id, None)
+            db.session.remove()
+
+
+def enqueue_simulation(hospital_id, parameters, reuse=True, simulation_type="revenue_forecast"):
+    """
+    Records a queued simulation and hands it to the background pool.
+    With SIMULATION_ASYNC disabled the job runs before returning.
+
+    With reuse, a run whose parameters, seed and device cost fields match
+    an existing completed or in-progress simulation returns that
+    simulation instead of starting another.
+
+    simulation_type picks the job: "revenue_forecast" (one month) or
+    "horizon_forecast" (multi-month, see EnhancedSimulation.simulate_horizon).
+
+    Returns the simulation id.
+    """
+    fingerprint = simulation_fingerprint(hospital_id, parameters)
+    if reuse:
+        existing = find_simulation(hospital_id, fingerprint)
+        if existing is not None:
+            return existing.simulation_id
+
+    simulation = Simulation(
+        hospital_id=hospital_id,
+        simulation_type=simulation_type,
+        parameters=json.dumps(parameters, default=str),
+        results=None,
+        status="queued",
+        progress=0,
+        fingerprint=fingerprint,
+        heartbeat_at=datetime.utcnow()
+    )
+    db.session.add(simulation)
+    db.session.commit()
+    simulation_id = simulation.simulation_id
+    remember(hospital_id, fingerprint, simulation_id)
+
+    app = current_app._get_current_object()
+    if app.config.get("SIMULATION_ASYNC", True):
+        executor = _get_executor(app.config.get("SIMULATION_JOB_WORKERS", 2))
+        with _executor_lock:
+            _jobs[simulation_id] = app
+        _start_heartbeat()
+        executor.submit(_run_in_context, app, simulation_id)
+    else:
+        run_simulation_job(simulation_id)
+
+    return simulation_id
+
+
+def cancel_simulation(simulation_id):
+    """Marks a queued/running simulation as cancelled. Returns False if it already finished."""
+    updated = Simulation.query.filter(
+        Simulation.simulation_id == simulation_id,
+        Simulation.status.in_(ACTIVE_STATUSES)
+    ).update({
+        "status": "cancelled",
+        "completed_at": datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+    return bool(updated)
+
+
+def job_status(simulation):
+    """JSON-ready status for the polling endpoint"""
+    return {
+        "simulation_id": simulation.simulation_id,
+        "status": simulation.status,
+        "progress": simulation.progress,
+        "error": simulation.error_message,
+        "completed_at": simulation.completed_at.isoformat() if simulation.completed_at else None
+    }
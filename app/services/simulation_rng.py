@@ -0,0 +1,66 @@
+# app/services/simulation_rng.py
+import secrets
+import numpy as np
+
+# Spawn-key namespaces, so device streams and worker streams never overlap
+DEVICE_STREAM = 0
+WORKER_STREAM = 1
+OPTIMIZER_STREAM = 2
+COMMON_FACTOR_STREAM = 3
+HORIZON_STREAM = 4
+
+
+def new_seed():
+    """Returns a fresh random seed that fits in JSON and a signed BIGINT"""
+    return secrets.randbits(63)
+
+
+def resolve_seed(value):
+    """
+    Parses a seed from user input, generating one when it is blank.
+    Raises ValueError for anything SeedSequence would reject later
+    (non-integers, negative numbers).
+    """
+    if value is None or str(value).strip() == "":
+        return new_seed()
+    try:
+        seed = int(str(value).strip())
+    except ValueError:
+        raise ValueError("the seed must be a whole number") from None
+    if seed < 0:
+        raise ValueError("the seed must be 0 or greater")
+    return seed
+
+
+class SimulationStreams:
+    """
+    Independent numpy.random.Generator streams derived from one seed.
+
+    Each device gets its own stream keyed by its id, so a device's draws
+    are identical whether it is simulated alone, with other devices, or
+    on another worker. Worker streams use a separate key namespace.
+    """
+
+    def __init__(self, seed=None):
+        self.seed = new_seed() if seed is None else int(seed)
+
+    def _sequence(self, *key):
+        return np.random.SeedSequence(self.seed, spawn_key=tuple(int(k) for k in key))
+
+    def for_device(self, device_id):
+        return np.random.default_rng(self._sequence(DEVICE_STREAM, device_id))
+
+    def for_optimizer(self, device_id):
+        return np.random.default_rng(self._sequence(OPTIMIZER_STREAM, device_id))
+
+    def for_common_factor(self):
+        return np.random.default_rng(self._sequence(COMMON_FACTOR_STREAM))
+
+    def for_horizon(self, chunk_index):
+        return np.random.default_rng(self._sequence(HORIZON_STREAM, chunk_index))
+
+    def for_worker(self, worker_index):
+        return np.random.default_rng(self._sequence(WORKER_STREAM, worker_index))
+
+    def spawn_workers(self, count):
+        return [self.for_worker(i) for i in range(count)]
@@ -0,0 +1,119 @@
+# app/services/transfer_history_service.py
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case, func, or_
+
+from app import db
+from app.models.data_transfer import DataTransfer
+from app.models.department import Department
+from app.models.hospital import Hospital
+from app.models.patient import Patient
+
+TRANSFER_PAGE_SIZE = 25
+
+TRANSFER_STATUSES = ("pending", "verified", "accepted", "rejected", "failed")
+
+
+def encode_cursor(transfer):
+    """Keyset cursor for the page after this (last shown) transfer"""
+    stamp = transfer.transferred_at.isoformat() if transfer.transferred_at else ""
+    return f"{stamp}|{transfer.transfer_id}"
+
+
+def decode_cursor(cursor):
+    """Returns (transferred_at or None, transfer_id), or None for a missing/garbled cursor"""
+    try:
+        stamp, transfer_id = cursor.split("|", 1)
+        return (datetime.fromisoformat(stamp) if stamp else None), int(transfer_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d") if value else None
+    except ValueError:
+        return None
+
+
+def list_transfers(hospital_id, direction, cursor=None, status=None, date_from=None, date_to=None,
+                   page_size=TRANSFER_PAGE_SIZE):
+    """
+    One page of a hospital's incoming or outgoing transfers, newest first.
+
+    Rows are (transfer, department_name, other_hospital_name, patient_name).
+    Keyset pagination on (transferred_at, transfer_id) uses the
+    (target_hospital / source_hospital, transferred_at) indexes; transfers
+    without a timestamp come last. Dates are 'YYYY-MM-DD'; date_to is inclusive.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if direction == "incoming":
+        own, other = DataTransfer.target_hospital, DataTransfer.source_hospital
+    else:
+        own, other = DataTransfer.source_hospital, DataTransfer.target_hospital
+
+    query = db.session.query(
+        DataTransfer,
+        Department.name.label("department_name"),
+        Hospital.name.label("hospital_name"),
+        Patient.name.label("patient_name")
+    )\
+    .join(Department, DataTransfer.department_id == Department.department_id)\
+    .join(Hospital, other == Hospital.hospital_id)\
+    .join(Patient, DataTransfer.patient_id == Patient.patient_id)\
+    .filter(own == hospital_id)
+
+    if status in TRANSFER_STATUSES:
+        query = query.filter(DataTransfer.transfer_status == status)
+
+    start = _parse_date(date_from)
+    if start:
+        query = query.filter(DataTransfer.transferred_at >= start)
+
+    end = _parse_date(date_to)
+    if end:
+        query = query.filter(DataTransfer.transferred_at < end + timedelta(days=1))
+
+    position = decode_cursor(cursor)
+    if position:
+        transferred_at, transfer_id = position
+        if transferred_at is None:
+            query = query.filter(
+                DataTransfer.transferred_at.is_(None),
+                DataTransfer.transfer_id < transfer_id
+            )
+        else:
+            query = query.filter(or_(
+                DataTransfer.transferred_at < transferred_at,
+                and_(DataTransfer.transferred_at == transferred_at, DataTransfer.transfer_id < transfer_id),
+                DataTransfer.transferred_at.is_(None)
+            ))
+
+    # MySQL and SQLite sort NULL timestamps last in descending order
+    rows = query.order_by(
+        DataTransfer.transferred_at.desc(),
+        DataTransfer.transfer_id.desc()
+    ).limit(page_size + 1).all()
+
+    page = rows[:page_size]
+    next_cursor = encode_cursor(page[-1][0]) if len(rows) > page_size else None
+    return page, next_cursor
+
+
+def transfer_counts(hospital_id):
+    """Totals for the history summary cards, in one grouped query"""
+    incoming = DataTransfer.target_hospital == hospital_id
+    row = db.session.query(
+        func.sum(case((incoming, 1), else_=0)),
+        func.sum(case((DataTransfer.source_hospital == hospital_id, 1), else_=0)),
+        func.sum(case((and_(incoming, DataTransfer.transfer_status == "verified"), 1), else_=0)),
+        func.sum(case((and_(incoming, DataTransfer.transfer_status.in_(("failed", "rejected"))), 1), else_=0))
+    ).filter(or_(incoming, DataTransfer.source_hospital == hospital_id)).one()
+
+    return {
+        "incoming": int(row[0] or 0),
+        "outgoing": int(row[1] or 0),
+        "verified": int(row[2] or 0),
+        "failed": int(row[3] or 0)
+    }
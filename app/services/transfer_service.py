@@ -1,20 +1,71 @@
 # app/services/transfer_service.py
-from app.models.hospital_connection import HospitalConnection
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, func
+
 from app.models.hospital import Hospital
 from app.models.data_transfer import DataTransfer
-from app.services.checksum_service import generate_checksum
+from app.models.transfer_leaf_hash import TransferLeafHash
+from app.services.checksum_service import generate_checksum, leaf_hash, legacy_merkle_root, merkle_root
+from app.services.connection_graph import get_connection_graph
+from app.services.routing_service import get_routing_graph
+from app.services.request_profiler import annotate
 from app.models.patient import Patient
-from app.models.treatment import Treatment
 from app.models.treatment_session import TreatmentSession  
 from app import db
-def build_patient_payload(patient_id, department_id):
-    patient = Patient.query.get(patient_id)
 
-    treatment_sessions = TreatmentSession.query.filter_by(
-        patient_id=patient_id
-    ).order_by(TreatmentSession.created_at).all()
+# Number of hospitals offered on the transfer page
+TRANSFER_CANDIDATE_LIMIT = 10
+
+
+# Session rows fetched per round trip while streaming a payload
+PAYLOAD_BATCH_SIZE = 1000
+
+SESSION_FIELDS = (
+    "session_id", "treatment_id", "hospital_id", "device_id", "doctor_id",
+    "doctor_minutes", "nurse_minutes", "device_cost", "device_price",
+    "staff_cost", "total_price", "profit", "notes", "created_at"
+)
+
+
+# Leaf hashes are reused while the session's row_version is unchanged, so
+# other processes' writes are caught too; the TTL only bounds memory use
+LEAF_CACHE_TTL = 300
+LEAF_CACHE_SIZE = 200000
+
+_leaf_cache = OrderedDict()
+_leaf_cache_lock = threading.Lock()
+
+
+def session_records(*criteria, fields=SESSION_FIELDS, order_by=None):
+    """
+    Streams session payload records matching the criteria, oldest first
+    (by created_at, session_id unless `order_by` columns are given).
+    """
+    columns = [getattr(TreatmentSession, field) for field in fields]
+    if order_by is None:
+        order_by = (TreatmentSession.created_at, TreatmentSession.session_id)
+    rows = db.session.query(*columns).filter(*criteria).order_by(
+        *order_by
+    ).yield_per(PAYLOAD_BATCH_SIZE)
+
+    for row in rows:
+        record = dict(zip(fields, row))
+        record["created_at"] = row.created_at.isoformat() if row.created_at else None
+        yield record
+
 
-    payload = {
+def iter_session_records(patient_id, order_by=None):
+    """Yields a patient's treatment sessions as payload records, oldest first, in batches."""
+    return session_records(TreatmentSession.patient_id == patient_id, order_by=order_by)
+
+
+def patient_header(patient, department_id, transferred_at=None):
+    """The non-session part of a transfer payload"""
+    return {
         "patient": {
             "patient_id": patient.patient_id,
             "name": patient.name,
@@ -24,131 +75,295 @@ def build_patient_payload(patient_id, department_id):
         },
         "transfer_context": {
             "department_id": department_id,
-            "timestamp": None  # Will be filled later
-        },
-        "treatment_history": [
-            {
-                "session_id": ts.session_id,
-                "treatment_id": ts.treatment_id,
-                "hospital_id": ts.hospital_id,
-                "device_id": ts.device_id,
-                "doctor_id": ts.doctor_id,
-                "doctor_minutes": ts.doctor_minutes,
-                "nurse_minutes": ts.nurse_minutes,
-                "device_cost": ts.device_cost,
-                "device_price": ts.device_price,
-                "staff_cost": ts.staff_cost,
-                "total_price": ts.total_price,
-                "profit": ts.profit,
-                "notes": ts.notes,
-                "created_at": ts.created_at.isoformat() if ts.created_at else None
-            }
-            for ts in treatment_sessions
-        ]
+            "timestamp": transferred_at.isoformat() if transferred_at else None
+        }
     }
-    
-    # DEBUG
-    import json
-    print(f"DEBUG - Payload structure: {json.dumps(payload, indent=2, default=str)}")
-    
+
+
+def build_patient_payload(patient_id, department_id, order_by=None):
+    """
+    Transfer payload for a patient. "treatment_history" is a generator
+    that streams session records from the database, so the payload can
+    be consumed (hashed) once without loading the whole history.
+    """
+    patient = Patient.query.get(patient_id)
+
+    payload = patient_header(patient, department_id)  # timestamp is filled later
+    payload["treatment_history"] = iter_session_records(patient_id, order_by=order_by)
+
     return payload
 
 
-def create_transfer_checksum(transfer: DataTransfer):
+def transfer_checksum(transfer: DataTransfer):
     """
-    Creates and stores the original checksum for a transfer.
-    This is done at the source hospital before sending.
+    Flat SHA-256 over the whole streamed payload. Transfers created before
+    Merkle checksums (no stored leaves) are verified with this, so sessions
+    keep the order those checksums were computed in: created_at alone.
     """
     payload = build_patient_payload(
         transfer.patient_id,
-        transfer.department_id
+        transfer.department_id,
+        order_by=(TreatmentSession.created_at,)
     )
-    
-    # Remove timestamp from payload for checksum (use transfer timestamp instead)
-    # This ensures both sides compute the same checksum
+
+    # Use the transfer timestamp so both sides compute the same checksum
     payload["transfer_context"]["timestamp"] = transfer.transferred_at.isoformat() if transfer.transferred_at else None
-    
-    checksum = generate_checksum(payload)
-    transfer.checksum_original = checksum
+
+    return generate_checksum(payload)
+
+
+def _header_leaf(transfer: DataTransfer):
+    patient = Patient.query.get(transfer.patient_id)
+    return leaf_hash(patient_header(patient, transfer.department_id, transfer.transferred_at))
+
+
+def cache_session_leaves(leaves):
+    """Stores freshly computed (session_id, leaf hash, row_version) triples in the leaf cache"""
+    expires = time.monotonic() + LEAF_CACHE_TTL
+    with _leaf_cache_lock:
+        for session_id, digest, version in leaves:
+            _leaf_cache[session_id] = (expires, digest, version)
+            _leaf_cache.move_to_end(session_id)
+        while len(_leaf_cache) > LEAF_CACHE_SIZE:
+            _leaf_cache.popitem(last=False)
+
+
+def hash_session_records(records):
+    """[(session_id, leaf hash, row_version)] for records carrying a row_version field"""
+    leaves = []
+    for record in records:
+        version = record.pop("row_version")
+        leaves.append((record["session_id"], leaf_hash(record), version))
+    return leaves
+
+
+def reusable_leaves(versions, known=None):
+    """
+    {session_id: (leaf hash, row_version)} for the (session_id, row_version)
+    pairs whose current version is in `known` ({session_id: (leaf hash,
+    row_version)}, e.g. a transfer's stored leaves) or in the leaf cache.
+    """
+    known = known or {}
+    now = time.monotonic()
+    leaves = {}
+    with _leaf_cache_lock:
+        for session_id, version in versions:
+            stored = known.get(session_id)
+            if stored is not None and stored[1] == version:
+                leaves[session_id] = (stored[0], version)
+                continue
+            entry = _leaf_cache.get(session_id)
+            if entry and entry[0] > now and entry[2] == version:
+                leaves[session_id] = (entry[1], version)
+                _leaf_cache.move_to_end(session_id)
+    return leaves
+
+
+def missing_session_records(session_ids):
+    """Streams payload records (plus row_version) for sessions that must be rehashed"""
+    for i in range(0, len(session_ids), PAYLOAD_BATCH_SIZE):
+        yield from session_records(
+            TreatmentSession.session_id.in_(session_ids[i:i + PAYLOAD_BATCH_SIZE]),
+            fields=SESSION_FIELDS + ("row_version",)
+        )
+
+
+def session_leaves(patient_id, known=None):
+    """
+    [(session_id, leaf hash, row_version)] for a patient's sessions, oldest
+    first. Only ids and row versions are scanned; a session is rehashed
+    only when its current version is neither in `known` nor cached (see
+    reusable_leaves).
+    """
+    versions = db.session.query(TreatmentSession.session_id, TreatmentSession.row_version).filter(
+        TreatmentSession.patient_id == patient_id
+    ).order_by(
+        TreatmentSession.created_at, TreatmentSession.session_id
+    ).all()
+
+    leaves = reusable_leaves(versions, known)
+    missing = [session_id for session_id, _ in versions if session_id not in leaves]
+    if missing:
+        hashed = hash_session_records(missing_session_records(missing))
+        leaves.update((session_id, (digest, version)) for session_id, digest, version in hashed)
+        cache_session_leaves(hashed)
+
+    return [
+        (session_id,) + leaves[session_id]
+        for session_id, _ in versions if session_id in leaves
+    ]
+
+
+def leaf_rows(transfer_id, header, leaves):
+    """TransferLeafHash mappings for bulk insertion (header first)"""
+    return [
+        {"transfer_id": transfer_id, "position": 0, "session_id": None, "leaf_hash": header,
+         "session_version": None}
+    ] + [
+        {"transfer_id": transfer_id, "position": i, "session_id": session_id, "leaf_hash": digest,
+         "session_version": version}
+        for i, (session_id, digest, version) in enumerate(leaves, start=1)
+    ]
+
+
+def transfer_timestamp():
+    """
+    The database clock's current time for DataTransfer.transferred_at,
+    without microseconds so it survives a DATETIME round trip unchanged
+    (it is part of every checksum). Single and bulk transfers both use it.
+    """
+    return db.session.query(func.now()).scalar().replace(microsecond=0)
+
+
+def create_transfer_checksum(transfer: DataTransfer):
+    """
+    Creates and stores the original checksum for a transfer.
+    This is done at the source hospital before sending: the Merkle root
+    goes in checksum_original and the leaves are kept for verification.
+    """
+    header = _header_leaf(transfer)
+    leaves = session_leaves(transfer.patient_id)
+
+    transfer.checksum_original = merkle_root([header] + [digest for _, digest, _ in leaves])
+
+    TransferLeafHash.query.filter_by(transfer_id=transfer.transfer_id).delete()
+    db.session.bulk_insert_mappings(TransferLeafHash, leaf_rows(transfer.transfer_id, header, leaves))
+
+
+def invalidate_session_leaves(*session_ids):
+    """Drops cached leaf hashes (all of them when no ids are given)"""
+    with _leaf_cache_lock:
+        if not session_ids:
+            _leaf_cache.clear()
+        for session_id in session_ids:
+            _leaf_cache.pop(session_id, None)
+
+
+@event.listens_for(TreatmentSession, "after_update")
+@event.listens_for(TreatmentSession, "after_delete")
+def _session_changed(mapper, connection, target):
+    invalidate_session_leaves(target.session_id)
 
 
 def build_graph():
-    """Builds hospital connection graph for scoring."""
-    connections = HospitalConnection.query.all()
-    graph = {}
-    for c in connections:
-        graph.setdefault(c.hospital_from, []).append({
-            "to": c.hospital_to,
-            "cost": c.transfer_cost,
-            "latency": c.latency_minutes,
-            "reliability": c.reliability
-        })
-    return graph
+    """Hospital connection adjacency (hospital -> outgoing edges), served from the graph cache."""
+    return get_connection_graph().adjacency
 
 
 def score_hospital(graph, source_hospital_id, target_hospital_id):
-    """Scores a hospital connection based on reliability, cost, and latency."""
-    edges = graph.get(source_hospital_id, [])
-    for e in edges:
-        if e["to"] == target_hospital_id:
-            # Higher score = better (more reliable, cheaper, faster)
-            score = e["reliability"] / (1 + e["cost"] + e["latency"])
-            return round(score, 4)
-    return 0
-
-
-def get_candidate_hospitals(patient_hospital_id, department_id):
-    """Gets hospitals with the requested department (excluding current hospital)."""
-    from app.models.hospital import Hospital
+    """
+    Scores the best route between two hospitals based on reliability,
+    cost, and latency. Routes may pass through intermediate hospitals;
+    returns 0 when the target is unreachable.
+
+    `graph` (from build_graph) is kept for compatibility; routes always come
+    from the cached routing graph, which is built from the same connections.
+    """
+    route = get_routing_graph().best_route(source_hospital_id, target_hospital_id)
+    return route["score"] if route else 0
+
+
+def get_candidate_hospitals(patient_hospital_id, department_name):
+    """
+    Gets (hospital, department_id) for every hospital with a department of
+    this name (case-insensitive, excluding the current hospital) in one query.
+    """
     from app.models.department import Department
 
-    hospitals = Hospital.query.join(Department)\
-        .filter(Department.department_id == department_id)\
+    rows = db.session.query(Hospital, Department.department_id)\
+        .join(Department, Department.hospital_id == Hospital.hospital_id)\
+        .filter(func.lower(Department.name) == department_name.strip().lower())\
         .filter(Hospital.hospital_id != patient_hospital_id)\
+        .order_by(Department.department_id)\
         .all()
-    return hospitals
 
+    # A hospital may list the same department twice; keep the first
+    candidates = {}
+    for hospital, department_id in rows:
+        candidates.setdefault(hospital.hospital_id, (hospital, department_id))
+    return list(candidates.values())
 
-def compute_hospital_scores(patient_hospital_id, department_id):
-    """Computes and ranks candidate hospitals for transfer."""
-    graph = build_graph()
-    hospitals = get_candidate_hospitals(patient_hospital_id, department_id)
+
+def rank_hospitals(patient_hospital_id, department_name, limit=TRANSFER_CANDIDATE_LIMIT):
+    """
+    Top `limit` hospitals offering the department, ranked by best route
+    score from the patient's hospital. Route metrics come from the cached
+    routing graph, so no per-hospital queries are made.
+    """
+    routing = get_routing_graph()
 
     scored = []
-    for h in hospitals:
-        score = score_hospital(graph, patient_hospital_id, h.hospital_id)
+    for h, department_id in get_candidate_hospitals(patient_hospital_id, department_name):
+        route = routing.best_route(patient_hospital_id, h.hospital_id)
         scored.append({
             "hospital": h,
-            "score": score,
+            "score": route["score"] if route else 0,
+            "route": route,
             "hospital_id": h.hospital_id,
-            "hospital_name": h.name
+            "hospital_name": h.name,
+            "department_id": department_id
         })
-    
-    # Sort by score (descending)
-    scored.sort(key=lambda x: x["score"], reverse=True)
-    return scored
+
+    return heapq.nlargest(limit, scored, key=lambda x: x["score"])
+
+
+def compute_hospital_scores(patient_hospital_id, department_id, limit=TRANSFER_CANDIDATE_LIMIT):
+    """Computes and ranks candidate hospitals for transfer."""
+    from app.models.department import Department
+
+    department_name = db.session.query(Department.name)\
+        .filter(Department.department_id == department_id)\
+        .scalar()
+    if department_name is None:
+        return []
+    return rank_hospitals(patient_hospital_id, department_name, limit)
 
 
 # Add this function for verification at target hospital
 def verify_transfer_checksum(transfer: DataTransfer):
     """
     Verifies checksum at target hospital.
-    Returns True if checksums match, False otherwise.
+    Returns (matches, recomputed checksum, diverged). On a mismatch,
+    diverged reports whether the patient header changed and which
+    session ids were changed, removed or added since the transfer was
+    initiated; it is None for transfers without stored leaves.
     """
-    payload = build_patient_payload(
-        transfer.patient_id,
-        transfer.department_id
+    stored = db.session.query(
+        TransferLeafHash.session_id, TransferLeafHash.leaf_hash, TransferLeafHash.session_version
+    ).filter(
+        TransferLeafHash.transfer_id == transfer.transfer_id
+    ).order_by(TransferLeafHash.position).all()
+
+    if not stored:
+        new_checksum = transfer_checksum(transfer)
+        return new_checksum == transfer.checksum_original, new_checksum, None
+
+    # Transfers initiated before domain-separated roots keep their old tree
+    root = merkle_root
+    if legacy_merkle_root([row.leaf_hash for row in stored]) == transfer.checksum_original:
+        root = legacy_merkle_root
+
+    # Sessions whose row_version still matches the snapshot reuse the stored
+    # leaf; only changed sessions are rehashed
+    original = {row.session_id: (row.leaf_hash, row.session_version) for row in stored[1:]}
+    header = _header_leaf(transfer)
+    leaves = session_leaves(transfer.patient_id, known=original)
+    new_checksum = root([header] + [digest for _, digest, _ in leaves])
+    if new_checksum == transfer.checksum_original:
+        return True, new_checksum, {}
+
+    current = {sid: digest for sid, digest, _ in leaves}
+    diverged = {
+        "patient": stored[0].leaf_hash != header,
+        "changed": [sid for sid, digest, _ in leaves if sid in original and original[sid][0] != digest],
+        "removed": [sid for sid in original if sid not in current],
+        "added": [sid for sid, _, _ in leaves if sid not in original]
+    }
+
+    annotate(
+        f"Checksum mismatch: patient header {'changed' if diverged['patient'] else 'unchanged'}, "
+        f"{len(diverged['changed'])} sessions changed, {len(diverged['removed'])} removed, "
+        f"{len(diverged['added'])} added"
     )
-    
-    # Use the original transfer timestamp for consistency
-    payload["transfer_context"]["timestamp"] = transfer.transferred_at.isoformat() if transfer.transferred_at else None
-    
-    new_checksum = generate_checksum(payload)
-    original_checksum = transfer.checksum_original
-    
-    # DEBUG: Print both checksums
-    print(f"DEBUG - Original checksum: {original_checksum}")
-    print(f"DEBUG - New checksum:      {new_checksum}")
-    print(f"DEBUG - Match: {original_checksum == new_checksum}")
-    
-    return original_checksum == new_checksum
\ No newline at end of file
+
+    return False, new_checksum, diverged
@@ -0,0 +1,88 @@
+# app/services/treatment_session_service.py
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
+
+from app.models.treatment_session import TreatmentSession
+
+SESSION_PAGE_SIZE = 50
+
+
+def encode_cursor(session_obj):
+    """Keyset cursor for the page after this (last shown) session"""
+    stamp = session_obj.created_at.isoformat() if session_obj.created_at else ""
+    return f"{stamp}|{session_obj.session_id}"
+
+
+def decode_cursor(cursor):
+    """Returns (created_at or None, session_id), or None for a missing/garbled cursor"""
+    try:
+        stamp, session_id = cursor.split("|", 1)
+        return (datetime.fromisoformat(stamp) if stamp else None), int(session_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d") if value else None
+    except ValueError:
+        return None
+
+
+def list_sessions(hospital_id, cursor=None, doctor_id=None, date_from=None, date_to=None,
+                  page_size=SESSION_PAGE_SIZE):
+    """
+    One page of a hospital's treatment sessions, newest first.
+
+    Uses keyset pagination on (created_at, session_id), so the cost of a
+    page does not grow with the number of sessions, and joins the
+    patient/treatment/device/doctor rows the listing displays in the same
+    query. Legacy sessions without a created_at come last. Dates are
+    'YYYY-MM-DD' strings; date_to is inclusive.
+
+    Returns (sessions, next_cursor); next_cursor is None on the last page.
+    """
+    query = TreatmentSession.query.options(
+        joinedload(TreatmentSession.patient_session),
+        joinedload(TreatmentSession.treatment_session),
+        joinedload(TreatmentSession.device_session),
+        joinedload(TreatmentSession.doctor_session)
+    ).filter(TreatmentSession.hospital_id == hospital_id)
+
+    if doctor_id:
+        query = query.filter(TreatmentSession.doctor_id == doctor_id)
+
+    start = _parse_date(date_from)
+    if start:
+        query = query.filter(TreatmentSession.created_at >= start)
+
+    end = _parse_date(date_to)
+    if end:
+        query = query.filter(TreatmentSession.created_at < end + timedelta(days=1))
+
+    position = decode_cursor(cursor)
+    if position:
+        created_at, session_id = position
+        if created_at is None:
+            query = query.filter(
+                TreatmentSession.created_at.is_(None),
+                TreatmentSession.session_id < session_id
+            )
+        else:
+            query = query.filter(or_(
+                TreatmentSession.created_at < created_at,
+                and_(TreatmentSession.created_at == created_at, TreatmentSession.session_id < session_id),
+                TreatmentSession.created_at.is_(None)
+            ))
+
+    # MySQL and SQLite sort NULL timestamps last in descending order
+    rows = query.order_by(
+        TreatmentSession.created_at.desc(),
+        TreatmentSession.session_id.desc()
+    ).limit(page_size + 1).all()
+
+    sessions = rows[:page_size]
+    next_cursor = encode_cursor(sessions[-1]) if len(rows) > page_size else None
+    return sessions, next_cursor
@@ -0,0 +1,88 @@
+# app/services/utilization_service.py
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.models.treatment_session import TreatmentSession
+from app.services.rollup_service import usage_counts_since
+
+UTILIZATION_WINDOW_DAYS = 180
+
+# Safety net for other processes' writes; local writes invalidate immediately
+UTILIZATION_CACHE_TTL = 300
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def device_usage_counts(hospital_id, days=UTILIZATION_WINDOW_DAYS):
+    """
+    Counts treatment sessions per device for a hospital over the last
+    `days` days. Reads the daily rollup table (one grouped query over
+    O(days) rows). Sessions without a device are returned under the
+    None key so the total matches all sessions.
+    """
+    since = (datetime.utcnow() - timedelta(days=days)).date()
+    return usage_counts_since(hospital_id, since)
+
+
+def _cached_counts(hospital_id):
+    key = str(hospital_id)
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+
+    counts = device_usage_counts(hospital_id)
+    with _cache_lock:
+        _cache[key] = (now + UTILIZATION_CACHE_TTL, counts)
+    return counts
+
+
+def historical_utilization(hospital_id, device_ids):
+    """
+    Share of the hospital's recent sessions that used each device.
+    Falls back to an equal split when there is no history.
+    """
+    if not device_ids:
+        return {}
+
+    counts = _cached_counts(hospital_id)
+    total = sum(counts.values())
+    if total == 0:
+        return {device_id: 1.0 / len(device_ids) for device_id in device_ids}
+
+    return {device_id: counts.get(device_id, 0) / total for device_id in device_ids}
+
+
+def invalidate_utilization(hospital_id=None):
+    """Drops cached counts for one hospital, or for all hospitals"""
+    with _cache_lock:
+        if hospital_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(str(hospital_id), None)
+
+
+# New sessions are noted on the ORM session and invalidate after commit,
+# so a rolled-back insert never drops (or refills) the cache early
+@event.listens_for(TreatmentSession, "after_insert")
+def _session_written(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("utilization_hospitals", set()).add(target.hospital_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_written(session):
+    for hospital_id in session.info.pop("utilization_hospitals", ()):
+        invalidate_utilization(hospital_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_written(session):
+    session.info.pop("utilization_hospitals", None)
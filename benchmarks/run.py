@@ -0,0 +1,277 @@
+# benchmarks/run.py
+"""
+Benchmarks for the simulation, transfer and admin list hot paths.
+
+Builds a synthetic hospital network (benchmarks/synthetic.py) in a fresh
+SQLite file, or in the database given by --database-url (e.g. a local
+MySQL schema that may be wiped), times each benchmark and writes JSON:
+
+    python -m benchmarks.run --sessions 50000 --output bench.json
+    python -m benchmarks.run --output new.json --compare bench.json
+
+With --compare, benchmarks whose median slowed down by more than
+--threshold (default 20%) are listed and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import create_app, db
+from benchmarks.synthetic import DEFAULT_NOW, generate
+
+# Default timing rounds per benchmark (after WARMUP_ROUNDS untimed calls)
+ROUNDS = 10
+WARMUP_ROUNDS = 1
+
+DEFAULT_THRESHOLD = 0.20
+
+
+def measure(func, rounds=ROUNDS, warmup=WARMUP_ROUNDS, setup=None):
+    """
+    Times `func` over `rounds` calls. `setup` runs untimed before every
+    call (e.g. to drop a cache for a cold-path benchmark).
+    Returns min/max/mean/median/stddev in seconds, pytest-benchmark style.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        func()
+
+    timings = []
+    for _ in range(rounds):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    return {
+        "rounds": rounds,
+        "min": min(timings),
+        "max": max(timings),
+        "mean": statistics.mean(timings),
+        "median": statistics.median(timings),
+        "stddev": statistics.stdev(timings) if rounds > 1 else 0.0
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def simulation_parameters(devices, runs, seed=1):
+    """Monthly simulation parameters covering every device of a hospital"""
+    return {
+        "base_treatments_per_month": 120.0,
+        "device_utilization_rates": {device.device_id: 1.0 / len(devices) for device in devices},
+        "seasonality_factor": 1.0,
+        "price_changes": {},
+        "maintenance_downtime": {device.device_id: 0.05 for device in devices},
+        "simulation_runs": runs,
+        "seed": seed
+    }
+
+
+def benchmarks(app, ids, runs):
+    """(name, func, setup) for every hot path; funcs run inside an app context"""
+    from app.models.data_transfer import DataTransfer
+    from app.models.device import Device
+    from app.models.treatment import Treatment
+    from app.services.connection_graph import invalidate_connection_graph
+    from app.services.demand_model_service import fit_demand_model
+    from app.services.simulation_engine import EnhancedSimulation
+    from app.services.transfer_service import (
+        compute_hospital_scores, create_transfer_checksum, invalidate_session_leaves, verify_transfer_checksum
+    )
+
+    hospital_id = ids["hospital_id"]
+    devices = Device.query.filter_by(hospital_id=hospital_id).all()
+    treatments = Treatment.query.filter_by(hospital_id=hospital_id).all()
+    params = simulation_parameters(devices, runs)
+
+    def simulator():
+        return EnhancedSimulation(hospital_id, devices, treatments)
+
+    month_results = simulator().simulate_month_with_parameters(dict(params))
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["admin_id"] = ids["admin_id"]
+        session["hospital_id"] = hospital_id
+        session["role"] = 0
+
+    def view(path):
+        def get():
+            response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {path} returned {response.status_code}")
+        return get
+
+    def scores():
+        compute_hospital_scores(ids["patient_hospital_id"], ids["department_id"])
+
+    def create_checksum():
+        # Rewrites the transfer's leaf rows; rolled back so every round does the same work
+        try:
+            create_transfer_checksum(DataTransfer.query.get(ids["transfer_id"]))
+            db.session.flush()
+        finally:
+            db.session.rollback()
+
+    def verify_checksum():
+        verify_transfer_checksum(DataTransfer.query.get(ids["transfer_id"]))
+
+    # The fit window ends the day before the generated "now"
+    fit_until = ids["now"].date() - timedelta(days=1)
+
+    return [
+        ("simulation.month", lambda: simulator().simulate_month_with_parameters(dict(params)), None),
+        ("simulation.portfolio", lambda: simulator().simulate_portfolio(dict(params)), None),
+        ("simulation.horizon_12m", lambda: simulator().simulate_horizon(dict(params, horizon_months=12)), None),
+        ("simulation.optimize_prices", lambda: simulator().optimize_prices(month_results, seed=1), None),
+        ("demand.fit", lambda: fit_demand_model(hospital_id, until=fit_until), None),
+        ("transfer.hospital_scores", scores, None),
+        ("transfer.hospital_scores_cold", scores, invalidate_connection_graph),
+        ("transfer.create_checksum", create_checksum, None),
+        ("transfer.create_checksum_cold", create_checksum, invalidate_session_leaves),
+        ("transfer.verify_checksum", verify_checksum, None),
+        ("views.transfers_history", view("/admin/transfers-history"), None),
+        ("views.simulation_history", view("/admin/simulation-history"), None),
+        ("views.devices", view("/admin/devices"), None),
+        ("views.patients", view("/admin/patients"), None),
+    ]
+
+
+def run(args):
+    tmp_dir = tempfile.mkdtemp(prefix="hospital-bench-")
+    database_url = args.database_url or f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": database_url,
+        "SIMULATION_ASYNC": False,
+        "SIMULATION_WORKERS": 1,
+        "SIMULATION_DISTRIBUTION_DIR": os.path.join(tmp_dir, "distributions"),
+        "TESTING": True
+    })
+    try:
+        return _run(app, args, database_url)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _run(app, args, database_url):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        started = time.perf_counter()
+        ids = generate(
+            hospitals=args.hospitals, devices=args.devices, patients=args.patients,
+            sessions=args.sessions, transfers=args.transfers, seed=args.seed,
+            now=args.now
+        )
+        generate_seconds = time.perf_counter() - started
+        print(f"Generated {ids['rows']} in {generate_seconds:.1f}s", file=sys.stderr)
+
+        results = {}
+        for name, func, setup in benchmarks(app, ids, args.runs):
+            if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                continue
+            # Each benchmark starts from a clean session, like a fresh request
+            db.session.remove()
+            results[name] = measure(func, rounds=args.rounds, setup=setup)
+            print(f"{name:32s} median {results[name]['median'] * 1000:9.2f} ms", file=sys.stderr)
+
+    return {
+        "commit": _git_commit(),
+        "created_at": datetime.utcnow().isoformat(),
+        "machine": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "database": database_url.split(":", 1)[0]
+        },
+        "dataset": dict(ids["rows"], patient_sessions=ids["patient_sessions"], seed=args.seed,
+                        now=args.now.isoformat()),
+        "simulation_runs": args.runs,
+        "generate_seconds": generate_seconds,
+        "benchmarks": results
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Median ratio (current / baseline) per benchmark present in both runs.
+    Returns (rows, regressions); a regression is a ratio above 1 + threshold.
+    """
+    rows = []
+    for name, stats in sorted(current["benchmarks"].items()):
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous or not previous["median"]:
+            continue
+        ratio = stats["median"] / previous["median"]
+        rows.append((name, previous["median"], stats["median"], ratio))
+    return rows, [row for row in rows if row[3] > 1 + threshold]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hospitals", type=int, default=10)
+    parser.add_argument("--devices", type=int, default=8, help="devices per hospital")
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--transfers", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=10000, help="Monte Carlo runs per simulation")
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--now", type=datetime.fromisoformat, default=DEFAULT_NOW,
+                        help="time the generated history ends (ISO format)")
+    parser.add_argument("--database-url", help="SQLAlchemy URL; its tables are dropped and recreated")
+    parser.add_argument("--only", nargs="*", help="benchmark name prefixes to run")
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    current = run(args)
+    output = json.dumps(current, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if not args.compare:
+        return 0
+
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    if baseline.get("dataset") != current["dataset"]:
+        print("Warning: baseline was generated with a different dataset", file=sys.stderr)
+
+    rows, regressions = compare(current, baseline, args.threshold)
+    for name, before, after, ratio in rows:
+        flag = "  REGRESSION" if ratio > 1 + args.threshold else ""
+        print(f"{name:32s} {before * 1000:9.2f} ms -> {after * 1000:9.2f} ms  x{ratio:.2f}{flag}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
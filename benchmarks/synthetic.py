@@ -0,0 +1,249 @@
+# benchmarks/synthetic.py
+import random
+import uuid
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models.admin import Admin
+from app.models.data_transfer import DataTransfer
+from app.models.department import Department
+from app.models.device import Device
+from app.models.doctor import Doctor
+from app.models.hospital import Hospital
+from app.models.hospital_connection import HospitalConnection
+from app.models.patient import Patient
+from app.models.simulations import Simulation
+from app.models.specialization import Specialization
+from app.models.treatment import Treatment
+from app.models.treatment_session import TreatmentSession
+from app.services.rollup_service import rebuild_rollups
+from app.services.transfer_service import create_transfer_checksum
+
+# Rows per bulk insert
+INSERT_BATCH_SIZE = 5000
+
+DEPARTMENT_NAMES = (
+    "Cardiology", "Neurology", "Oncology", "Radiology",
+    "Orthopedics", "Pediatrics", "Nephrology", "Emergency"
+)
+
+DEVICE_TYPES = ("MRI", "CT Scanner", "X-Ray", "Ultrasound", "Dialysis", "ECG", "PET", "Ventilator")
+
+TRANSFER_STATUSES = ("pending", "verified", "accepted", "rejected", "failed")
+
+# Every generated account shares this password
+PASSWORD = "benchmark"
+
+# "Current" time of the generated history; fixed so runs are comparable
+DEFAULT_NOW = datetime(2025, 1, 1)
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.session.bulk_insert_mappings(model, rows[start:start + INSERT_BATCH_SIZE])
+    db.session.commit()
+
+
+def generate(hospitals=10, devices=8, patients=1000, sessions=20000, transfers=2000,
+             simulations=50, connection_density=0.3, history_days=365, seed=0, now=DEFAULT_NOW):
+    """
+    Fills an empty database with a synthetic hospital network:
+      - `hospitals` hospitals, each with one admin, one doctor, the
+        department list and `devices` devices
+      - `patients` patients and `sessions` treatment sessions, spread
+        over the last `history_days` days (rollups rebuilt afterwards)
+      - a random directed connection graph (`connection_density` is the
+        chance of an edge per ordered hospital pair; a ring keeps it connected)
+      - `transfers` data transfers and `simulations` saved simulations
+      - one pending, checksummed transfer of the busiest patient
+
+    Counts are totals across hospitals, except `devices` (per hospital).
+    Timestamps count back from `now`, not the wall clock, so the same
+    arguments always produce the same data. Returns a dict of ids the
+    benchmarks need.
+    """
+    rng = random.Random(seed)
+    now = now.replace(microsecond=0)
+    password = generate_password_hash(PASSWORD)
+    hospital_ids = list(range(1, hospitals + 1))
+
+    _insert(Hospital, [
+        {"hospital_id": h, "name": f"Hospital {h}", "location": f"City {h % 7}"}
+        for h in hospital_ids
+    ])
+    # Numeric admin ids: data_transfers.initiated_by_staff is an integer column
+    _insert(Admin, [
+        {"admin_id": str(h), "hospital_id": h, "name": f"Admin {h}",
+         "email": f"admin{h}@bench.local", "password": password, "role": 0}
+        for h in hospital_ids
+    ])
+
+    departments = []
+    for h in hospital_ids:
+        for name in DEPARTMENT_NAMES:
+            departments.append({
+                "department_id": len(departments) + 1, "hospital_id": h, "name": name
+            })
+    _insert(Department, departments)
+    _insert(Specialization, [
+        {"specialization_id": d["department_id"], "department_id": d["department_id"], "name": d["name"]}
+        for d in departments
+    ])
+    departments_by_hospital = {}
+    for d in departments:
+        departments_by_hospital.setdefault(d["hospital_id"], []).append(d["department_id"])
+
+    _insert(Doctor, [
+        {"doctor_id": f"doctor-{h}", "hospital_id": h,
+         "specialization_id": departments_by_hospital[h][0], "name": f"Doctor {h}",
+         "email": f"doctor{h}@bench.local", "password": password, "hourly_wage": 90}
+        for h in hospital_ids
+    ])
+    _insert(Treatment, [
+        {"treatment_id": h, "hospital_id": h, "name": "Procedure", "requires_device": True}
+        for h in hospital_ids
+    ])
+
+    device_rows = []
+    for h in hospital_ids:
+        for _ in range(devices):
+            cost = round(rng.uniform(20, 200), 2)
+            device_rows.append({
+                "device_id": len(device_rows) + 1,
+                "hospital_id": h,
+                "device_type": rng.choice(DEVICE_TYPES),
+                "base_machine_cost": round(rng.uniform(20000, 500000), 2),
+                "doctor_minutes": rng.randint(10, 60),
+                "doctor_hourly_wage": 90,
+                "nurse_minutes": rng.randint(10, 90),
+                "nurse_hourly_wage": 40,
+                "cost_per_use": cost,
+                "price_per_use": round(cost * rng.uniform(1.5, 4.0), 2),
+                "status": "operational"
+            })
+    _insert(Device, device_rows)
+    devices_by_hospital = {}
+    for d in device_rows:
+        devices_by_hospital.setdefault(d["hospital_id"], []).append(d)
+
+    patient_rows = [
+        {"patient_id": str(uuid.UUID(int=rng.getrandbits(128))), "hospital_id": rng.choice(hospital_ids),
+         "name": f"Patient {i}", "email": f"patient{i}@bench.local",
+         "dob": date(1940, 1, 1) + timedelta(days=rng.randint(0, 29000))}
+        for i in range(patients)
+    ]
+    _insert(Patient, patient_rows)
+
+    # Skewed session counts, so some patients have long histories
+    weights = [1.0 / (i + 1) for i in range(len(patient_rows))]
+    session_patients = rng.choices(patient_rows, weights=weights, k=sessions) if patient_rows else []
+    session_rows = []
+    for patient in session_patients:
+        hospital_id = patient["hospital_id"]
+        device = rng.choice(devices_by_hospital[hospital_id]) if devices else None
+        price = float(device["price_per_use"]) if device else 100.0
+        cost = float(device["cost_per_use"]) if device else 40.0
+        staff_cost = round(rng.uniform(10, 80), 2)
+        session_rows.append({
+            "patient_id": patient["patient_id"],
+            "hospital_id": hospital_id,
+            "treatment_id": hospital_id,
+            "device_id": device["device_id"] if device else None,
+            "doctor_id": f"doctor-{hospital_id}",
+            "device_cost": cost,
+            "device_price": price,
+            "staff_cost": staff_cost,
+            "total_price": price,
+            "profit": round(price - cost - staff_cost, 2),
+            "created_at": now - timedelta(seconds=rng.randint(0, history_days * 86400))
+        })
+    _insert(TreatmentSession, session_rows)
+    rebuild_rollups()
+
+    connections = []
+    for i, a in enumerate(hospital_ids):
+        for b in hospital_ids:
+            ring = b == hospital_ids[(i + 1) % len(hospital_ids)]
+            if a != b and (ring or rng.random() < connection_density):
+                connections.append({
+                    "hospital_from": a,
+                    "hospital_to": b,
+                    "transfer_cost": round(rng.uniform(1, 20), 2),
+                    "latency_minutes": round(rng.uniform(5, 120), 1),
+                    "reliability": round(rng.uniform(0.8, 0.999), 3)
+                })
+    _insert(HospitalConnection, connections)
+
+    transfer_rows = []
+    for _ in range(transfers if len(hospital_ids) > 1 and patient_rows else 0):
+        patient = rng.choice(patient_rows)
+        source = patient["hospital_id"]
+        target = rng.choice([h for h in hospital_ids if h != source])
+        transfer_rows.append({
+            "patient_id": patient["patient_id"],
+            "source_hospital": source,
+            "target_hospital": target,
+            "department_id": rng.choice(departments_by_hospital[target]),
+            "initiated_by_staff": source,
+            "transfer_status": rng.choice(TRANSFER_STATUSES),
+            "transferred_at": now - timedelta(seconds=rng.randint(0, history_days * 86400))
+        })
+    _insert(DataTransfer, transfer_rows)
+
+    _insert(Simulation, [
+        {"hospital_id": rng.choice(hospital_ids), "simulation_type": "revenue_forecast",
+         "simulation_date": now - timedelta(hours=i), "parameters": "{}", "results": "{}",
+         "status": "completed", "progress": 100, "device_count": devices,
+         "total_revenue": rng.uniform(1e5, 1e6), "total_profit": rng.uniform(-1e5, 5e5),
+         "high_risk_count": 0, "medium_risk_count": 0, "low_risk_count": devices}
+        for i in range(simulations)
+    ])
+
+    # The busiest patient (longest history) drives the payload benchmarks
+    counts = Counter(row["patient_id"] for row in session_rows)
+    busiest = session_patients[0] if session_patients else None
+    if counts:
+        busiest_id = counts.most_common(1)[0][0]
+        busiest = next(p for p in patient_rows if p["patient_id"] == busiest_id)
+
+    # A Merkle-checksummed transfer for the checksum benchmarks
+    transfer_id = None
+    if busiest and len(hospital_ids) > 1:
+        target = next(h for h in hospital_ids if h != busiest["hospital_id"])
+        transfer = DataTransfer(
+            patient_id=busiest["patient_id"],
+            source_hospital=busiest["hospital_id"],
+            target_hospital=target,
+            department_id=departments_by_hospital[target][0],
+            initiated_by_staff=busiest["hospital_id"],
+            transfer_status="pending",
+            transferred_at=now
+        )
+        db.session.add(transfer)
+        db.session.flush()
+        create_transfer_checksum(transfer)
+        db.session.commit()
+        transfer_id = transfer.transfer_id
+
+    return {
+        "now": now,
+        "transfer_id": transfer_id,
+        "hospital_id": hospital_ids[0],
+        "admin_id": str(hospital_ids[0]),
+        "patient_id": busiest["patient_id"] if busiest else None,
+        "patient_hospital_id": busiest["hospital_id"] if busiest else None,
+        "patient_sessions": counts[busiest["patient_id"]] if busiest else 0,
+        "department_id": departments_by_hospital[hospital_ids[0]][0],
+        "rows": {
+            "hospitals": len(hospital_ids),
+            "devices": len(device_rows),
+            "patients": len(patient_rows),
+            "sessions": len(session_rows),
+            "connections": len(connections),
+            "transfers": len(transfer_rows) + (1 if transfer_id else 0),
+            "simulations": simulations
+        }
+    }
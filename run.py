@@ -1,8 +1,14 @@
 # run.py
+import os
+
 from app import create_app
+from app.services.simulation_jobs import recover_at_startup
 
 app = create_app()
 
 if __name__ == "__main__":
+    # Once per server start (the debug reloader's child process skips it)
+    if os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+        recover_at_startup(app)
     # debug=True allows auto-reload and shows errors in browser
     app.run(host="127.0.0.1", port=5000, debug=True)